@@ -0,0 +1,3344 @@
+"""
+Excel Column Mapper engine
+Reading, mapping, transforming, validating and writing tabular data, plus the mapping history and profiles.
+Free of tkinter, so servers, scripts and worker processes can use it without loading a GUI toolkit.
+
+Author: Open Source Community
+License: MIT
+Version: 2.0.0
+"""
+
+from __future__ import annotations
+
+import ast
+import bisect
+import csv
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import operator
+import os
+import re
+import shutil
+import threading
+import time
+import warnings
+import zipfile
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+class LazyModule:
+    """Module proxy that defers the real import until an attribute is first used"""
+    
+    def __init__(self, module_name: str):
+        self._module_name = module_name
+        self._module = None
+        self._lock = threading.Lock()
+    
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the underlying module has been imported"""
+        return self._module is not None
+    
+    def load(self):
+        """Import the underlying module (once) and return it"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._module_name)
+        return self._module
+    
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+
+# pandas (and numpy with it) takes longer to import than building the whole window,
+# so it is only imported on first file load or warmed in the background after startup
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+
+class Config:
+    """Configuration settings for the application"""
+    
+    # Application settings
+    APP_NAME = "Excel Column Mapper"
+    APP_VERSION = "1.0"
+    WINDOW_TITLE = f"{APP_NAME} v{APP_VERSION}"
+    WINDOW_SIZE = "1240x600"
+    WINDOW_MIN_SIZE = (1000, 600)
+    
+    # Directories
+    ASSETS_DIR = PROJECT_ROOT / "assets"
+    LOG_DIR = PROJECT_ROOT / "log"
+    SOURCE_FILES_DIR = PROJECT_ROOT / "data" / "source_files"
+    OUTPUT_DIR = PROJECT_ROOT / "data" / "output"
+    REFERENCE_DIR = PROJECT_ROOT / "data" / "reference"
+    THEMES_DIR = PROJECT_ROOT / "themes"
+    SERVICE_DIR = PROJECT_ROOT / "data" / "service"
+    
+    # Files
+    HISTORY_FILE = LOG_DIR / "mapping_history.csv"
+    HISTORY_ARCHIVE_DIR = LOG_DIR / "history_archive"
+    INCREMENTAL_STATE_DIR = LOG_DIR / "incremental"
+    LOOKUP_CACHE_DIR = LOG_DIR / "lookup_cache"
+    PROFILES_DIR = PROJECT_ROOT / "profiles"
+    CONFIG_FILE = PROJECT_ROOT / "config.json"
+    LOGO_FILE = ASSETS_DIR / "logo.png"
+    FAVICON_FILE = ASSETS_DIR / "favicon.ico"
+    
+    # Theme settings
+    THEME_NAME = "azure"  # Using Azure theme - a popular open-source theme
+    
+    # Processing settings
+    CHUNK_ROWS = 50_000  # Rows per chunk for readers and writers (cancellation granularity)
+    XLSX_ENGINE = "auto"  # "auto" writes .xlsx with xlsxwriter's constant-memory mode if installed, "openpyxl" never
+    GZIP_LEVEL = 6  # Compression level for .csv.gz outputs (1 fastest, 9 smallest)
+    PARQUET_COMPRESSION = "snappy"  # Codec for .parquet outputs: snappy, zstd, gzip or none
+    MERGE_MAX_WORKERS = None  # Worker processes for multi-source merges (None = one per CPU)
+    SOURCE_FILE_COLUMN = "Source_File"  # Optional merge column recording where each row came from
+    EXPRESSION_ENGINE = "auto"  # "auto" evaluates numeric expression mappings with numexpr if installed, "python" never
+    LOOKUP_MISS_POLICY = "blank"  # What lookups do with values missing from the reference: blank, keep or error
+    SCHEMA_SUFFIX = ".schema.json"  # Column types declared next to a template (template.schema.json)
+    CAST_ERROR_POLICY = "blank"  # Values that don't fit a destination column's type: blank (and report) or error
+    UNATTENDED_CAST_ERROR_POLICY = "error"  # The same for watch-folder and headless refresh runs, where nobody confirms
+    PREVIEW_ROWS = 50  # Output rows computed at a time for the Data Preview grid
+    MAPPING_CHOICES_LIMIT = 200  # Source columns listed when a mapping dropdown opens (type to narrow them)
+    HISTORY_PAGE_SIZE = 200  # History sessions listed per page in the load dialog
+    HISTORY_NORMALIZE_HEADERS = False  # Match history columns ignoring case and spacing by default
+    PROBLEM_EXAMPLES = 3  # Offending rows listed per column in type and validation reports
+    VALIDATION_POLICY = "report"  # Rule violations found before writing: report (the GUI asks first) or error
+    
+    # History retention settings (each can be overridden in config.json under "history")
+    HISTORY_AUTO_COMPACT = True  # Compact the history at startup when it is due
+    HISTORY_COMPACT_BYTES = 5_000_000  # History file size that makes compaction due
+    HISTORY_ARCHIVE_DAYS = 90  # Sessions last used longer ago move to monthly gzip archives (0 = never)
+    HISTORY_RETENTION_DAYS = 730  # Sessions and archives older than this are deleted (0 = keep forever)
+    
+    # Watch-folder daemon settings
+    WATCH_POLL_SECONDS = 1.0  # How often the source folder is scanned
+    WATCH_SETTLE_SECONDS = 2.0  # How long a file must stay unchanged before it is processed
+    WATCH_MAX_WORKERS = 2  # Worker processes transforming files concurrently
+    
+    # HTTP service settings (--serve)
+    SERVICE_HOST = "127.0.0.1"  # Only this machine can connect by default
+    SERVICE_PORT = 8765
+    SERVICE_MAX_WORKERS = None  # Worker processes running jobs (None = one per CPU)
+    SERVICE_MAX_QUEUED = 32  # Jobs waiting for a worker before new submissions are refused
+    
+    @classmethod
+    def ensure_directories(cls):
+        """Ensure all required directories exist"""
+        for directory in [cls.ASSETS_DIR, cls.LOG_DIR, cls.SOURCE_FILES_DIR, cls.THEMES_DIR]:
+            directory.mkdir(parents=True, exist_ok=True)
+
+class StatisticsManager:
+    """Manages user statistics and achievements"""
+    
+    def __init__(self):
+        self.stats = {
+            'mappings_created': 0,
+            'files_processed': 0,
+            'total_columns_mapped': 0,
+            'sessions_completed': 0,
+            'last_activity': None
+        }
+        self.load_stats()
+    
+    def load_stats(self):
+        """Load statistics from file"""
+        try:
+            if Config.CONFIG_FILE.exists():
+                with open(Config.CONFIG_FILE, 'r') as f:
+                    data = json.load(f)
+                    self.stats.update(data.get('statistics', {}))
+        except Exception as e:
+            print(f"Warning: Could not load statistics: {e}")
+    
+    def save_stats(self):
+        """Save statistics to file"""
+        try:
+            config_data = {}
+            if Config.CONFIG_FILE.exists():
+                with open(Config.CONFIG_FILE, 'r') as f:
+                    config_data = json.load(f)
+            
+            config_data['statistics'] = self.stats
+            config_data['last_updated'] = datetime.now().isoformat()
+            
+            with open(Config.CONFIG_FILE, 'w') as f:
+                json.dump(config_data, f, indent=2)
+        except Exception as e:
+            print(f"Warning: Could not save statistics: {e}")
+    
+    def update_mapping_created(self):
+        """Update mapping created count"""
+        self.stats['mappings_created'] += 1
+        self.stats['last_activity'] = datetime.now().isoformat()
+        self.save_stats()
+    
+    def update_file_processed(self, columns_count: int):
+        """Update file processed count"""
+        self.stats['files_processed'] += 1
+        self.stats['total_columns_mapped'] += columns_count
+        self.stats['sessions_completed'] += 1
+        self.stats['last_activity'] = datetime.now().isoformat()
+        self.save_stats()
+
+def get_process_memory() -> Optional[int]:
+    """Get the resident memory of this process in bytes, if it can be determined"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        # Linux exposes the resident page count without extra dependencies
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class PerformanceTracer:
+    """Records timing spans for each processing stage and exports them as traces"""
+
+    CSV_FIELDS = ['name', 'start_ms', 'duration_ms', 'rows', 'memory_delta_bytes', 'thread', 'details']
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, rows: Optional[int] = None, **details) -> Iterator[Dict[str, Any]]:
+        """Time a stage; the yielded record can be updated with the rows processed"""
+        record = {
+            'name': name,
+            'rows': rows,
+            'details': details,
+            'thread': threading.current_thread().name
+        }
+        start_memory = get_process_memory()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            end = time.perf_counter()
+            end_memory = get_process_memory()
+
+            record['start_ms'] = (start - self._origin) * 1000
+            record['duration_ms'] = (end - start) * 1000
+            if start_memory is not None and end_memory is not None:
+                record['memory_delta_bytes'] = end_memory - start_memory
+            else:
+                record['memory_delta_bytes'] = None
+
+            with self._lock:
+                self.spans.append(record)
+
+    def clear(self):
+        """Discard all recorded spans"""
+        with self._lock:
+            self.spans.clear()
+
+    def export_chrome_trace(self, file_path: Optional[Path] = None) -> Path:
+        """Export spans in Chrome trace event format (chrome://tracing, Perfetto)"""
+        file_path = Path(file_path) if file_path else self.default_export_path('.json')
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        pid = os.getpid()
+        thread_ids: Dict[str, int] = {}
+        events = []
+        with self._lock:
+            spans = list(self.spans)
+
+        for record in spans:
+            tid = thread_ids.setdefault(record['thread'], len(thread_ids) + 1)
+            args = {'rows': record['rows'], 'memory_delta_bytes': record['memory_delta_bytes']}
+            args.update({key: str(value) for key, value in record['details'].items()})
+            events.append({
+                'name': record['name'],
+                'cat': 'stage',
+                'ph': 'X',
+                'ts': round(record['start_ms'] * 1000, 3),
+                'dur': round(record['duration_ms'] * 1000, 3),
+                'pid': pid,
+                'tid': tid,
+                'args': args
+            })
+
+        # Name the thread lanes so the viewer shows them readably
+        for thread_name, tid in thread_ids.items():
+            events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                'args': {'name': thread_name}
+            })
+
+        with open(file_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, indent=2)
+
+        return file_path
+
+    def export_csv(self, file_path: Optional[Path] = None) -> Path:
+        """Export spans as a flat CSV table"""
+        file_path = Path(file_path) if file_path else self.default_export_path('.csv')
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            spans = list(self.spans)
+
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.CSV_FIELDS)
+            writer.writeheader()
+            for record in spans:
+                writer.writerow({
+                    'name': record['name'],
+                    'start_ms': f"{record['start_ms']:.3f}",
+                    'duration_ms': f"{record['duration_ms']:.3f}",
+                    'rows': record['rows'] if record['rows'] is not None else '',
+                    'memory_delta_bytes': record['memory_delta_bytes'] if record['memory_delta_bytes'] is not None else '',
+                    'thread': record['thread'],
+                    'details': json.dumps(record['details'], default=str) if record['details'] else ''
+                })
+
+        return file_path
+
+    def export(self, file_path: Path) -> Path:
+        """Export spans, choosing CSV or Chrome trace JSON by file extension"""
+        if Path(file_path).suffix.lower() == '.csv':
+            return self.export_csv(file_path)
+        return self.export_chrome_trace(file_path)
+
+    @staticmethod
+    def default_export_path(suffix: str) -> Path:
+        """Get a timestamped trace file path inside the log directory"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return Config.LOG_DIR / f"trace_{timestamp}{suffix}"
+
+class OperationCancelled(Exception):
+    """Raised when a long-running operation is cancelled by the user"""
+
+class CancellationToken:
+    """Cooperative cancellation flag checked by readers, the copy loop and writers"""
+    
+    def __init__(self):
+        self._event = threading.Event()
+    
+    def cancel(self):
+        """Request cancellation"""
+        self._event.set()
+    
+    @property
+    def is_cancelled(self) -> bool:
+        """Whether cancellation has been requested"""
+        return self._event.is_set()
+    
+    def raise_if_cancelled(self):
+        """Raise OperationCancelled if cancellation has been requested"""
+        if self._event.is_set():
+            raise OperationCancelled()
+
+def check_cancelled(token: Optional[CancellationToken]):
+    """Raise OperationCancelled if the (optional) token has been cancelled"""
+    if token is not None:
+        token.raise_if_cancelled()
+
+def _excel_column_names(header_row: Tuple[Any, ...]) -> List[str]:
+    """Build column names from an Excel header row the way pandas does"""
+    columns = []
+    seen: Dict[str, int] = {}
+    for i, value in enumerate(header_row):
+        name = f"Unnamed: {i}" if value is None else str(value)
+        if name in seen:
+            # Deduplicate repeated headers as "Name", "Name.1", ...
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def _excel_cell_value(value: Any) -> Any:
+    """Convert a raw openpyxl cell value the way pandas does"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _rows_to_frame(rows: List[Tuple[Any, ...]], columns: List[str]) -> pd.DataFrame:
+    """Build a typed DataFrame from raw spreadsheet rows"""
+    width = len(columns)
+    missing = float('nan')
+    rows = [
+        tuple(missing if value is None else value for value in row[:width]) + (missing,) * (width - len(row))
+        for row in rows
+    ]
+    return pd.DataFrame.from_records(rows, columns=columns).infer_objects()
+
+def iter_excel_chunks(file_path: Path, chunk_rows: int, token: Optional[CancellationToken] = None) -> Iterator[pd.DataFrame]:
+    """Stream the first worksheet of an .xlsx file as DataFrame chunks"""
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header_row = next(rows, None)
+        if header_row is None:
+            yield pd.DataFrame()
+            return
+        
+        columns = _excel_column_names(header_row)
+        buffer: List[Tuple[Any, ...]] = []
+        blank_rows: List[Tuple[Any, ...]] = []
+        emitted = False
+        
+        for row in rows:
+            row = tuple(_excel_cell_value(value) for value in row)
+            
+            # Hold blank rows back so trailing ones are dropped, like pandas does
+            if all(value is None for value in row):
+                blank_rows.append(row)
+                continue
+            buffer.extend(blank_rows)
+            blank_rows.clear()
+            buffer.append(row)
+            
+            if len(buffer) >= chunk_rows:
+                check_cancelled(token)
+                yield _rows_to_frame(buffer, columns)
+                emitted = True
+                buffer = []
+        
+        check_cancelled(token)
+        if buffer or not emitted:
+            yield _rows_to_frame(buffer, columns)
+    finally:
+        workbook.close()
+
+# Separates a zip archive from the data file read inside it, e.g. "bundle.zip::orders.csv"
+ARCHIVE_MEMBER_SEPARATOR = "::"
+
+# Data files that can be read, as they are or gzip-compressed (.csv.gz) or inside a zip archive
+DATA_FILE_SUFFIXES = ('.csv', '.csv.gz', '.xlsx', '.xlsm', '.xls')
+INPUT_FILE_SUFFIXES = DATA_FILE_SUFFIXES + ('.zip',)
+
+def split_archive_path(file_path: Path) -> Tuple[Path, Optional[str]]:
+    """Split "bundle.zip::orders.csv" into the archive and the member read inside it (None for other files)"""
+    text = str(file_path)
+    if ARCHIVE_MEMBER_SEPARATOR not in text:
+        return Path(text), None
+    archive, member = text.split(ARCHIVE_MEMBER_SEPARATOR, 1)
+    # Zip member names always use forward slashes
+    return Path(archive), member.replace('\\', '/')
+
+def get_data_members(archive: zipfile.ZipFile) -> List[str]:
+    """Get the data files inside an open zip archive (folders and macOS metadata are skipped)"""
+    return [
+        info.filename for info in archive.infolist()
+        if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+        and info.filename.lower().endswith(DATA_FILE_SUFFIXES)
+    ]
+
+def list_archive_members(archive_path: Path) -> List[str]:
+    """List the data files inside a zip archive"""
+    with zipfile.ZipFile(archive_path) as archive:
+        return get_data_members(archive)
+
+def get_archive_member(archive: zipfile.ZipFile, member: Optional[str]) -> str:
+    """Get the member to read from an open zip archive: the one named, or its only data file"""
+    name = Path(archive.filename).name
+    members = get_data_members(archive)
+    if member is not None:
+        if member not in members:
+            raise ValueError(f"{name} has no data file named {member}")
+        return member
+    if len(members) != 1:
+        listed = ", ".join(members[:10]) or "none"
+        raise ValueError(
+            f"{name} holds {len(members)} data files ({listed}); name one as {name}{ARCHIVE_MEMBER_SEPARATOR}<file>"
+        )
+    return members[0]
+
+def expand_archive_paths(file_paths: List[str]) -> List[str]:
+    """Replace zip archives in a list of files with every data file inside them"""
+    expanded = []
+    for file_path in file_paths:
+        archive_path, member = split_archive_path(file_path)
+        if member is None and archive_path.name.lower().endswith('.zip'):
+            expanded.extend(f"{archive_path}{ARCHIVE_MEMBER_SEPARATOR}{name}" for name in list_archive_members(archive_path))
+        else:
+            expanded.append(str(file_path))
+    return expanded
+
+def get_data_format(name: str) -> str:
+    """Tell a data file's format from its name: csv, xlsx or xls (legacy and anything else pandas may read)"""
+    name = name.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.xlsx', '.xlsm')):
+        return 'xlsx'
+    return 'xls'
+
+def is_plain_file(file_path: Path) -> bool:
+    """Whether a data file can be read directly, rather than decompressed or taken out of a zip archive"""
+    archive_path, member = split_archive_path(file_path)
+    return member is None and not archive_path.name.lower().endswith(('.gz', '.zip'))
+
+def get_input_name(file_path: Path) -> str:
+    """Get the name an input is shown and recorded under: the file's, or the zip member's (bundle.zip::a/t.csv -> t.csv)"""
+    archive_path, member = split_archive_path(file_path)
+    return Path(member).name if member else archive_path.name
+
+def get_input_stem(file_path: Path) -> str:
+    """Get a data file's (or zip member's) name without its format and compression suffixes (orders.csv.gz -> orders)"""
+    name = get_input_name(file_path)
+    for suffix in sorted(INPUT_FILE_SUFFIXES, key=len, reverse=True):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return Path(name).stem
+
+@contextmanager
+def open_input_file(file_path: Path) -> Iterator[Tuple[Any, str]]:
+    """Open a data file for reading with the name that tells its format: plain files as their path, gzip files
+    and zip members as streams of decompressed bytes (nothing is extracted to disk)"""
+    archive_path, member = split_archive_path(file_path)
+    if is_plain_file(file_path):
+        yield archive_path, archive_path.name
+        return
+    
+    with ExitStack() as stack:
+        if archive_path.name.lower().endswith('.zip'):
+            archive = stack.enter_context(zipfile.ZipFile(archive_path))
+            name = get_archive_member(archive, member)
+            stream = stack.enter_context(archive.open(name))
+        else:
+            name = archive_path.name
+            stream = stack.enter_context(open(archive_path, 'rb'))
+        if name.lower().endswith('.gz'):
+            stream = stack.enter_context(gzip.GzipFile(fileobj=stream, mode='rb'))
+            name = name[:-3]
+        yield stream, name
+
+def iter_file_chunks(file_path: Path, chunk_rows: Optional[int] = None,
+                     token: Optional[CancellationToken] = None) -> Iterator[pd.DataFrame]:
+    """Stream an Excel or CSV file (plain, gzip-compressed or inside a zip) as DataFrame chunks, checking for
+    cancellation between chunks"""
+    file_path = Path(file_path)
+    chunk_rows = chunk_rows or Config.CHUNK_ROWS
+    
+    check_cancelled(token)
+    with open_input_file(file_path) as (source, name):
+        data_format = get_data_format(name)
+        if data_format == 'csv':
+            # Compressed CSVs are decompressed as the parser reads them, one chunk at a time
+            with pd.read_csv(source, encoding='utf-8', chunksize=chunk_rows) as reader:
+                for chunk in reader:
+                    check_cancelled(token)
+                    yield chunk
+            return
+        
+        if not isinstance(source, Path):
+            # Workbooks are zip files themselves and need random access, so compressed ones are held in memory
+            # (their rows are still read one chunk at a time)
+            source = io.BytesIO(source.read())
+        if data_format == 'xlsx':
+            yield from iter_excel_chunks(source, chunk_rows, token)
+        else:
+            # Legacy formats can only be parsed in one go
+            frame = pd.read_excel(source)
+            check_cancelled(token)
+            yield frame
+
+def get_partial_path(save_path: Path) -> Path:
+    """Get the temporary path an output file is written to before it is complete"""
+    return save_path.with_name(f".{save_path.stem}.partial{save_path.suffix}")
+
+# Output format name -> writer class that writes chunks of rows to one open file
+OUTPUT_WRITERS: Dict[str, type] = {}
+
+# Rows an Excel worksheet holds, the header included
+XLSX_MAX_ROWS = 1_048_576
+
+def register_output_writer(name: str, suffix: str, appendable: bool = False):
+    """Register a writer class for output files ending in suffix (appendable: incremental refresh can add rows)"""
+    def decorator(writer_class):
+        writer_class.format = name
+        writer_class.suffix = suffix
+        writer_class.appendable = appendable
+        OUTPUT_WRITERS[name] = writer_class
+        return writer_class
+    return decorator
+
+def get_output_format(save_path: Path) -> str:
+    """Get the registered output format for a file name (the longest matching suffix wins)"""
+    name = Path(save_path).name.lower()
+    matches = [writer_class for writer_class in OUTPUT_WRITERS.values() if name.endswith(writer_class.suffix)]
+    if not matches:
+        suffixes = ", ".join(writer_class.suffix for writer_class in OUTPUT_WRITERS.values())
+        raise ValueError(f"Can't write {Path(save_path).name}: output files must end in {suffixes}")
+    return max(matches, key=lambda writer_class: len(writer_class.suffix)).format
+
+def get_cell_rows(chunk: pd.DataFrame):
+    """Get a chunk's rows as plain Python values for spreadsheet writers (missing values as None)"""
+    values = chunk.astype(object)
+    return values.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+@register_output_writer('csv', '.csv', appendable=True)
+class CsvOutputWriter:
+    """UTF-8 CSV"""
+    
+    def __init__(self, path: Path):
+        self.handle = self.open(path)
+        self.header = True
+    
+    def open(self, path: Path):
+        """Open the file the rows are written to"""
+        return open(path, 'w', newline='', encoding='utf-8')
+    
+    def write(self, chunk: pd.DataFrame):
+        """Append a chunk of rows"""
+        chunk.to_csv(self.handle, index=False, header=self.header)
+        self.header = False
+    
+    def close(self):
+        """Finish the file"""
+        self.handle.close()
+
+@register_output_writer('csv.gz', '.csv.gz', appendable=True)
+class GzipCsvOutputWriter(CsvOutputWriter):
+    """Gzip-compressed UTF-8 CSV"""
+    
+    def open(self, path: Path):
+        """Open the file the rows are written to"""
+        return gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=Config.GZIP_LEVEL)
+
+# Appendable, but not streamed: incremental runs load and rewrite the whole workbook (see append_output_rows)
+@register_output_writer('xlsx', '.xlsx', appendable=True)
+class XlsxOutputWriter:
+    """Excel workbook streamed row by row: xlsxwriter's constant-memory mode if installed, openpyxl's write-only otherwise"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.rows = 0
+        xlsxwriter = None
+        if Config.XLSX_ENGINE == "auto":
+            try:
+                import xlsxwriter
+            except ImportError:
+                pass
+        
+        if xlsxwriter is not None:
+            self.book = xlsxwriter.Workbook(str(path), {
+                'constant_memory': True,
+                'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+                'strings_to_urls': False
+            })
+            sheet = self.book.add_worksheet('Sheet1')
+            self.append = lambda values: sheet.write_row(self.rows, 0, values)
+            self.finish = self.book.close
+        else:
+            import openpyxl
+            self.book = openpyxl.Workbook(write_only=True)
+            self.append = self.book.create_sheet('Sheet1').append
+            self.finish = lambda: self.book.save(self.path)
+    
+    def write(self, chunk: pd.DataFrame):
+        """Append a chunk of rows, after the header row if this is the first"""
+        if self.rows + len(chunk) + (self.rows == 0) > XLSX_MAX_ROWS:
+            raise ValueError(f"Excel sheets hold at most {XLSX_MAX_ROWS:,} rows: save as CSV, Parquet or Feather instead")
+        if self.rows == 0:
+            self.append([str(column) for column in chunk.columns])
+            self.rows += 1
+        for values in get_cell_rows(chunk):
+            self.append(values)
+            self.rows += 1
+    
+    def close(self):
+        """Finish the workbook"""
+        self.finish()
+
+class ArrowOutputWriter(ABC):
+    """Columnar file written through pyarrow, one block of rows per chunk"""
+    
+    def __init__(self, path: Path):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ValueError(f"Writing {self.format} files needs pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.path = path
+        self.schema = None
+        self.writer = None
+    
+    @abstractmethod
+    def open(self, schema):
+        """Open the pyarrow writer for the file"""
+    
+    def get_table(self, chunk: pd.DataFrame):
+        """Convert a chunk to an Arrow table; object columns are written as text, since they may mix types (1001, 'A-7')"""
+        chunk = chunk.rename(columns=str)
+        for column in chunk.columns[(chunk.dtypes == object).to_numpy()]:
+            chunk[column] = as_text(chunk[column])
+        
+        if self.schema is not None:
+            return self.pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False)
+        table = self.pa.Table.from_pandas(chunk, preserve_index=False)
+        # Columns with no values in the first chunk hold text in later ones
+        self.schema = self.pa.schema(
+            [field.with_type(self.pa.string()) if self.pa.types.is_null(field.type) else field for field in table.schema],
+            metadata=table.schema.metadata
+        )
+        return table.cast(self.schema)
+    
+    def write(self, chunk: pd.DataFrame):
+        """Append a chunk of rows"""
+        table = self.get_table(chunk)
+        if self.writer is None:
+            self.writer = self.open(self.schema)
+        self.writer.write_table(table)
+    
+    def close(self):
+        """Finish the file"""
+        if self.writer is not None:
+            self.writer.close()
+
+@register_output_writer('parquet', '.parquet')
+class ParquetOutputWriter(ArrowOutputWriter):
+    """Apache Parquet (needs pyarrow), one row group per chunk"""
+    
+    def open(self, schema):
+        """Open the pyarrow writer for the file"""
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(str(self.path), schema, compression=Config.PARQUET_COMPRESSION)
+
+@register_output_writer('feather', '.feather')
+class FeatherOutputWriter(ArrowOutputWriter):
+    """Feather, the Arrow IPC file format (needs pyarrow), one record batch per chunk"""
+    
+    def open(self, schema):
+        """Open the pyarrow writer for the file"""
+        import pyarrow.ipc
+        compression = 'lz4' if self.pa.Codec.is_available('lz4') else None
+        return pyarrow.ipc.new_file(str(self.path), schema, options=pyarrow.ipc.IpcWriteOptions(compression=compression))
+
+class ChunkedOutputWriter:
+    """Writes an output file chunk by chunk through the writer registered for its format; the file only appears once it is complete"""
+    
+    def __init__(self, save_path: Path, columns: Optional[List[str]] = None):
+        self.save_path = Path(save_path)
+        self.partial_path = get_partial_path(self.save_path)
+        self.columns = columns
+        self.rows_written = 0
+        self.chunks_written = 0
+        self.writer_class = OUTPUT_WRITERS[get_output_format(self.save_path)]
+        self._handle = None
+    
+    def write(self, chunk: pd.DataFrame):
+        """Append a chunk of rows to the output"""
+        if self._handle is None:
+            self._handle = self.writer_class(self.partial_path)
+        self._handle.write(chunk)
+        
+        self.rows_written += len(chunk)
+        self.chunks_written += 1
+    
+    def close(self) -> Path:
+        """Finish the output and move it into place"""
+        if self.chunks_written == 0:
+            # Still produce a file with just the header row
+            self.write(pd.DataFrame(columns=self.columns or []))
+        self._handle.close()
+        self._handle = None
+        os.replace(self.partial_path, self.save_path)
+        return self.save_path
+    
+    def abort(self):
+        """Discard the partially written output"""
+        if self._handle is not None:
+            try:
+                self._handle.close()
+            except Exception:
+                pass
+            self._handle = None
+        self.partial_path.unlink(missing_ok=True)
+    
+    def __enter__(self) -> "ChunkedOutputWriter":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Never leave a half-written output behind
+            self.abort()
+        return False
+
+def write_output_file(df: pd.DataFrame, save_path: Path, token: Optional[CancellationToken] = None,
+                      chunk_rows: Optional[int] = None) -> Path:
+    """Write a DataFrame in chunks; the output only appears once it is complete"""
+    chunk_rows = chunk_rows or Config.CHUNK_ROWS
+    
+    with ChunkedOutputWriter(save_path, df.columns.tolist()) as writer:
+        for start in range(0, len(df), chunk_rows):
+            check_cancelled(token)
+            writer.write(df.iloc[start:start + chunk_rows])
+        check_cancelled(token)
+    
+    return Path(save_path)
+
+def as_text(series: pd.Series) -> pd.Series:
+    """Convert values to text, leaving missing values missing"""
+    return series.astype(str).where(series.notna())
+
+def get_whole_numbers(series: pd.Series) -> pd.Series:
+    """Mark a float column's finite whole numbers within the Int64 range (missing values are not marked)"""
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+        whole = np.isfinite(values) & (values == np.round(values)) & (np.abs(values) < 2.0 ** 63)
+    return pd.Series(whole, index=series.index)
+
+def has_only_whole_numbers(series: pd.Series) -> bool:
+    """Whether a float column's values are all finite whole numbers within the Int64 range"""
+    return bool(get_whole_numbers(series)[series.notna()].all())
+
+# Transform name -> factory taking the optional argument after ':' and returning a Series -> Series step
+TRANSFORMS: Dict[str, Callable[[Optional[str]], Callable[[pd.Series], pd.Series]]] = {}
+
+def register_transform(name: str):
+    """Register a transform factory under the name used in transform chains"""
+    def decorator(factory):
+        TRANSFORMS[name] = factory
+        return factory
+    return decorator
+
+@register_transform('trim')
+def trim_transform(arg: Optional[str]) -> Callable[[pd.Series], pd.Series]:
+    """Strip surrounding whitespace"""
+    return lambda series: as_text(series).str.strip()
+
+@register_transform('upper')
+def upper_transform(arg: Optional[str]) -> Callable[[pd.Series], pd.Series]:
+    """Upper-case text"""
+    return lambda series: as_text(series).str.upper()
+
+@register_transform('lower')
+def lower_transform(arg: Optional[str]) -> Callable[[pd.Series], pd.Series]:
+    """Lower-case text"""
+    return lambda series: as_text(series).str.lower()
+
+@register_transform('date')
+def date_transform(arg: Optional[str]) -> Callable[[pd.Series], pd.Series]:
+    """Parse dates, in the given strftime format if any (unparseable values become empty)"""
+    return lambda series: pd.to_datetime(series, format=arg or None, errors='coerce')
+
+@register_transform('decimal_comma')
+def decimal_comma_transform(arg: Optional[str]) -> Callable[[pd.Series], pd.Series]:
+    """Parse numbers written as 1.234,56 (unparseable values become empty)"""
+    def convert(series: pd.Series) -> pd.Series:
+        if pd.api.types.is_numeric_dtype(series):
+            return series
+        text = as_text(series).str.replace(r'[.\s]', '', regex=True).str.replace(',', '.', regex=False)
+        return pd.to_numeric(text, errors='coerce')
+    return convert
+
+@register_transform('scale')
+def scale_transform(arg: Optional[str]) -> Callable[[pd.Series], pd.Series]:
+    """Multiply numbers by a factor, e.g. scale:0.001 for g → kg"""
+    try:
+        factor = float(arg)
+    except (TypeError, ValueError):
+        raise ValueError(f"scale needs a number, e.g. scale:0.001 (got {arg!r})")
+    return lambda series: pd.to_numeric(series, errors='coerce') * factor
+
+@register_transform('map')
+def map_transform(arg: Optional[str]) -> Callable[[pd.Series], pd.Series]:
+    """Replace values, e.g. map:Y=Yes,N=No (other values are kept)"""
+    pairs = [pair.split('=', 1) for pair in (arg or '').split(',') if pair.strip()]
+    if not pairs or any(len(pair) != 2 for pair in pairs):
+        raise ValueError(f"map needs value pairs, e.g. map:Y=Yes,N=No (got {arg!r})")
+    lookup = {old.strip(): new.strip() for old, new in pairs}
+    
+    def replace(series: pd.Series) -> pd.Series:
+        text = as_text(series)
+        return text.map(lookup).where(text.isin(list(lookup)), series)
+    return replace
+
+class ReferenceTable:
+    """Key → value pairs from a reference file, indexed for vectorized lookups"""
+    
+    def __init__(self, keys: pd.Series, values: pd.Series):
+        # The first row wins for repeated keys; rows without a key can't be looked up
+        keep = (~keys.duplicated(keep='first') & keys.notna()).to_numpy()
+        self.keys = keys[keep].reset_index(drop=True)
+        self.values = values[keep].reset_index(drop=True)
+        # Hash indexes over the keys as they are (False) and as text (True), built on first use
+        self._indexes: Dict[bool, pd.Index] = {}
+        self._lock = threading.Lock()
+    
+    def get_index(self, as_text: bool) -> pd.Index:
+        """Get the hash index over the keys, as they are or as text"""
+        with self._lock:
+            if as_text not in self._indexes:
+                self._indexes[as_text] = pd.Index(as_key_text(self.keys) if as_text else self.keys)
+            return self._indexes[as_text]
+    
+    def get_positions(self, lookup_values: pd.Series) -> np.ndarray:
+        """Get the reference row of each value (-1 where it isn't found)"""
+        as_text = needs_text_keys(self.keys, lookup_values)
+        positions = self.get_index(as_text).get_indexer(as_key_text(lookup_values) if as_text else lookup_values)
+        positions[lookup_values.isna().to_numpy()] = -1
+        return positions
+    
+    def lookup(self, lookup_values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+        """Look up every value at once, returning the found values and a mask of misses"""
+        positions = self.get_positions(lookup_values)
+        missing = positions < 0
+        if len(self.values):
+            found = self.values.to_numpy().take(np.where(missing, 0, positions))
+        else:
+            found = np.full(len(positions), np.nan, dtype=object)
+        return pd.Series(found, index=lookup_values.index).mask(missing), missing
+
+class ReferenceTableCache:
+    """Loads each reference table once, keeping it in memory and on disk until the file changes"""
+    
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = cache_dir
+        self._tables: Dict[Tuple[str, str, str], Tuple[Tuple[int, int], ReferenceTable]] = {}
+        self._lock = threading.Lock()
+    
+    def get_cache_file(self, cache_key: Tuple[str, str, str]) -> Path:
+        """Get the on-disk cache file for a reference table"""
+        cache_dir = Path(self.cache_dir or Config.LOOKUP_CACHE_DIR)
+        return cache_dir / f"{hashlib.sha1('|'.join(cache_key).encode('utf-8')).hexdigest()[:16]}.pkl"
+    
+    def get(self, file_path: Path, key_column: str, value_column: str) -> ReferenceTable:
+        """Get the indexed reference table, reading the file only if it changed since it was cached"""
+        file_path = Path(file_path).resolve()
+        signature = get_file_signature(file_path)
+        if signature is None:
+            raise ValueError(f"Reference file not found: {file_path}")
+        cache_key = (str(file_path), key_column, value_column)
+        
+        with self._lock:
+            cached = self._tables.get(cache_key)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+            
+            table = self.load_from_disk(cache_key, signature)
+            if table is None:
+                table = self.read_reference_file(file_path, key_column, value_column)
+                self.save_to_disk(cache_key, signature, table)
+            self._tables[cache_key] = (signature, table)
+            return table
+    
+    @staticmethod
+    def read_reference_file(file_path: Path, key_column: str, value_column: str) -> ReferenceTable:
+        """Read the key and value columns of a reference file"""
+        reference_df = read_data_file(file_path)
+        missing = [column for column in (key_column, value_column) if column not in reference_df.columns]
+        if missing:
+            raise ValueError(f"Reference file {file_path.name} has no column(s): {', '.join(missing)}")
+        return ReferenceTable(reference_df[key_column], reference_df[value_column])
+    
+    def load_from_disk(self, cache_key: Tuple[str, str, str], signature: Tuple[int, int]) -> Optional[ReferenceTable]:
+        """Load a cached table saved by an earlier run, if the file hasn't changed since"""
+        cache_file = self.get_cache_file(cache_key)
+        if not cache_file.exists():
+            return None
+        try:
+            cached = pd.read_pickle(cache_file)
+            if tuple(cached['signature']) != tuple(signature):
+                return None
+            return ReferenceTable(cached['keys'], cached['values'])
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable lookup cache {cache_file.name}: {e}")
+            return None
+    
+    def save_to_disk(self, cache_key: Tuple[str, str, str], signature: Tuple[int, int], table: ReferenceTable):
+        """Save a table so later runs can skip reading the reference file"""
+        cache_file = self.get_cache_file(cache_key)
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            pd.to_pickle({'signature': signature, 'keys': table.keys, 'values': table.values}, cache_file)
+        except OSError as e:
+            print(f"Warning: Could not cache lookup table: {e}")
+
+REFERENCE_TABLES = ReferenceTableCache()
+
+def resolve_reference_path(name: str) -> Path:
+    """Find a reference file given as an absolute path, a name in data/reference, or a relative path"""
+    path = Path(name).expanduser()
+    if not path.is_absolute() and (Config.REFERENCE_DIR / path).exists():
+        return Config.REFERENCE_DIR / path
+    return path
+
+@register_transform('lookup')
+def lookup_transform(arg: Optional[str]) -> Callable[[pd.Series], pd.Series]:
+    """Replace codes with values from a reference file, e.g. lookup:skus.xlsx,SKU,Description,miss=keep"""
+    parts = [part.strip() for part in (arg or '').split(',')]
+    options = dict(part.split('=', 1) for part in parts[3:] if '=' in part)
+    if len(parts) < 3 or not all(parts[:3]) or len(options) != len(parts) - 3:
+        raise ValueError(
+            f"lookup needs a file, key column and value column, e.g. lookup:skus.xlsx,SKU,Description (got {arg!r})"
+        )
+    
+    file_path = resolve_reference_path(parts[0])
+    key_column, value_column = parts[1], parts[2]
+    miss_policy = options.pop('miss', Config.LOOKUP_MISS_POLICY)
+    default = options.pop('default', None)
+    if options:
+        raise ValueError(f"Unknown lookup option(s): {', '.join(options)} (use miss=blank|keep|error, default=VALUE)")
+    if miss_policy not in ('blank', 'keep', 'error'):
+        raise ValueError(f"Unknown lookup miss policy {miss_policy!r} (use blank, keep or error)")
+    if not file_path.exists():
+        raise ValueError(f"Reference file not found: {file_path}")
+    
+    def lookup(series: pd.Series) -> pd.Series:
+        table = REFERENCE_TABLES.get(file_path, key_column, value_column)
+        found, missing = table.lookup(series)
+        if not missing.any():
+            return found
+        
+        if miss_policy == 'error':
+            examples = ', '.join(str(value) for value in series[missing].unique()[:5])
+            raise ValueError(f"{int(missing.sum())} values not found in {file_path.name} (e.g. {examples})")
+        if default is not None:
+            return found.mask(missing, default)
+        if miss_policy == 'keep':
+            return found.mask(missing, series)
+        return found
+    return lookup
+
+def parse_transform_chain(spec: str) -> List[Tuple[str, Optional[str]]]:
+    """Split a chain like "trim | date:%d/%m/%Y" into (name, argument) steps"""
+    steps = []
+    for part in spec.split('|'):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition(':')
+        name = name.strip().lower()
+        if name not in TRANSFORMS:
+            raise ValueError(f"Unknown transform '{name}' (available: {', '.join(sorted(TRANSFORMS))})")
+        steps.append((name, arg.strip() or None))
+    return steps
+
+def compile_transform_chain(spec: str) -> Callable[[pd.Series], pd.Series]:
+    """Compile a transform chain into one function applied to a whole column"""
+    steps = [TRANSFORMS[name](arg) for name, arg in parse_transform_chain(spec)]
+    
+    def apply(series: pd.Series) -> pd.Series:
+        for step in steps:
+            series = step(series)
+        return series
+    return apply
+
+# Quoted strings are matched first so brackets inside them aren't taken for column references
+EXPRESSION_TOKEN = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|\[([^\[\]]+)\]""")
+
+_numexpr = None
+
+def get_numexpr():
+    """Get the numexpr module if it is installed and enabled (None otherwise)"""
+    global _numexpr
+    if Config.EXPRESSION_ENGINE != "auto":
+        return None
+    if _numexpr is None:
+        try:
+            import numexpr
+            _numexpr = numexpr
+        except ImportError:
+            _numexpr = False
+    return _numexpr or None
+
+def is_expression(source_spec: Any) -> bool:
+    """Whether a mapping source is an expression like "=[Qty] * [UnitPrice]" rather than a column name"""
+    return isinstance(source_spec, str) and source_spec.startswith('=')
+
+def get_referenced_columns(source_spec: str) -> List[str]:
+    """Get the source columns a mapping reads (the column itself, or those an expression references)"""
+    return ColumnExpression(source_spec).columns if is_expression(source_spec) else [source_spec]
+
+def add_values(left: Any, right: Any) -> Any:
+    """Add numbers, or join text when either side is text (missing text counts as empty)"""
+    def is_text(value):
+        return isinstance(value, str) or (
+            isinstance(value, pd.Series) and not pd.api.types.is_numeric_dtype(value)
+        )
+    
+    if not (is_text(left) or is_text(right)):
+        return left + right
+    
+    def text(value):
+        return as_text(value).fillna('') if isinstance(value, pd.Series) else str(value)
+    return text(left) + text(right)
+
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$')
+
+def compare_values(function: Callable[[Any, Any], Any], left: Any, right: Any) -> Any:
+    """Compare values, reading text columns as dates when compared with an ISO date like '2026-01-01'"""
+    def as_comparable(value, other):
+        if isinstance(value, pd.Series) and isinstance(other, str) and ISO_DATE.match(other):
+            if not pd.api.types.is_datetime64_any_dtype(value):
+                value = pd.to_datetime(value, errors='coerce')
+            return value, pd.Timestamp(other)
+        return value, other
+    
+    left, right = as_comparable(left, right)
+    right, left = as_comparable(right, left)
+    return function(left, right)
+
+def negate(values: Any) -> Any:
+    """Logical not, value by value: numbers are true unless 0, other values by Python truthiness"""
+    if not isinstance(values, pd.Series):
+        return not values
+    if pd.api.types.is_bool_dtype(values):
+        return ~values
+    if pd.api.types.is_numeric_dtype(values):
+        return values == 0
+    return ~values.astype(bool)
+
+def is_in(values: Any, options: List[Any]) -> Any:
+    """Whether each value is one of the options"""
+    return values.isin(options) if isinstance(values, pd.Series) else values in options
+
+class ColumnExpression:
+    """A computed column such as "=[First] + ' ' + [Last]", parsed once and evaluated on whole columns"""
+    
+    BINARY_OPERATORS = {
+        ast.Add: add_values,
+        ast.Sub: operator.sub,
+        ast.Mult: operator.mul,
+        ast.Div: operator.truediv,
+        ast.FloorDiv: operator.floordiv,
+        ast.Mod: operator.mod,
+        ast.Pow: operator.pow
+    }
+    UNARY_OPERATORS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: negate}
+    COMPARE_OPERATORS = {
+        ast.Eq: operator.eq,
+        ast.NotEq: operator.ne,
+        ast.Lt: operator.lt,
+        ast.LtE: operator.le,
+        ast.Gt: operator.gt,
+        ast.GtE: operator.ge
+    }
+    # Conditions combine element-wise, like & and | on columns
+    BOOLEAN_OPERATORS = {ast.And: operator.and_, ast.Or: operator.or_}
+    # Operators numexpr can't evaluate
+    PYTHON_ONLY_OPERATORS = (ast.FloorDiv,)
+    
+    def __init__(self, text: str):
+        if not is_expression(text):
+            raise ValueError(f"Expressions start with '=' (got {text!r})")
+        self.text = text
+        self.columns: List[str] = []
+        self.has_text = False
+        self.python_only = False
+        
+        def reference(match):
+            if match.group(1):
+                return match.group(1)
+            column = match.group(2)
+            if column not in self.columns:
+                self.columns.append(column)
+            return f"__col{self.columns.index(column)}"
+        
+        source = EXPRESSION_TOKEN.sub(reference, text[1:]).strip()
+        try:
+            tree = ast.parse(source, mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"Invalid expression {text!r}: {e.msg}")
+        
+        self.evaluator = self.compile_node(tree.body)
+        self.numexpr_source = ast.unparse(tree.body)
+    
+    def compile_node(self, node: ast.AST) -> Callable[[List[pd.Series]], Any]:
+        """Turn an allowed syntax node into a function of the referenced columns"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) and not isinstance(node.value, bool):
+            self.has_text = self.has_text or isinstance(node.value, str)
+            value = node.value
+            return lambda columns: value
+        
+        placeholder = re.fullmatch(r'__col(\d+)', node.id) if isinstance(node, ast.Name) else None
+        if placeholder and int(placeholder.group(1)) < len(self.columns):
+            index = int(placeholder.group(1))
+            return lambda columns: columns[index]
+        
+        if isinstance(node, ast.BinOp) and type(node.op) in self.BINARY_OPERATORS:
+            self.python_only = self.python_only or isinstance(node.op, self.PYTHON_ONLY_OPERATORS)
+            function = self.BINARY_OPERATORS[type(node.op)]
+            left, right = self.compile_node(node.left), self.compile_node(node.right)
+            return lambda columns: function(left(columns), right(columns))
+        
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.UNARY_OPERATORS:
+            self.python_only = self.python_only or isinstance(node.op, ast.Not)
+            function = self.UNARY_OPERATORS[type(node.op)]
+            operand = self.compile_node(node.operand)
+            return lambda columns: function(operand(columns))
+        
+        if isinstance(node, ast.BoolOp) and type(node.op) in self.BOOLEAN_OPERATORS:
+            self.python_only = True
+            function = self.BOOLEAN_OPERATORS[type(node.op)]
+            operands = [self.compile_node(value) for value in node.values]
+            
+            def combine(columns):
+                result = operands[0](columns)
+                for operand in operands[1:]:
+                    result = function(result, operand(columns))
+                return result
+            return combine
+        
+        if isinstance(node, ast.Compare):
+            self.python_only = True
+            return self.compile_comparison(node)
+        
+        fragment = re.sub(r'__col(\d+)', lambda match: f"[{self.columns[int(match.group(1))]}]"
+                          if int(match.group(1)) < len(self.columns) else match.group(0), ast.unparse(node))
+        raise ValueError(
+            f"Unsupported syntax in expression {self.text!r}: {fragment} "
+            f"(use [Column] references, numbers, 'text' and + - * / // % **)"
+        )
+    
+    def compile_comparison(self, node: ast.Compare) -> Callable[[List[pd.Series]], Any]:
+        """Compile a (possibly chained) comparison such as 0 < [Qty] <= 10 or [Status] in ('A', 'B')"""
+        operands = [self.compile_node(node.left)]
+        checks = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not (isinstance(comparator, (ast.Tuple, ast.List, ast.Set))
+                        and all(isinstance(element, ast.Constant) for element in comparator.elts)):
+                    raise ValueError(f"'in' needs a list of values in expression {self.text!r}, e.g. [Status] in ('A', 'B')")
+                options = [element.value for element in comparator.elts]
+                negate = isinstance(op, ast.NotIn)
+                checks.append(lambda left, right, negate=negate: ~is_in(left, right) if negate else is_in(left, right))
+                operands.append(lambda columns, options=options: options)
+            elif type(op) in self.COMPARE_OPERATORS:
+                function = self.COMPARE_OPERATORS[type(op)]
+                checks.append(lambda left, right, function=function: compare_values(function, left, right))
+                operands.append(self.compile_node(comparator))
+            else:
+                raise ValueError(f"Unsupported comparison in expression {self.text!r}")
+        
+        def compare(columns):
+            values = [operand(columns) for operand in operands]
+            result = None
+            for i, check in enumerate(checks):
+                outcome = check(values[i], values[i + 1])
+                result = outcome if result is None else result & outcome
+            return result
+        return compare
+    
+    def get_missing_columns(self, source_headers: List[str]) -> List[str]:
+        """Get referenced columns that are not among the given source headers"""
+        return [column for column in self.columns if column not in source_headers]
+    
+    def evaluate(self, source_df: pd.DataFrame) -> pd.Series:
+        """Compute the expression over whole source columns"""
+        columns = [source_df[column] for column in self.columns]
+        
+        numexpr = get_numexpr()
+        if (numexpr is not None and not self.has_text and not self.python_only
+                and all(pd.api.types.is_numeric_dtype(column) for column in columns)):
+            local_dict = {f"__col{i}": column.to_numpy(dtype='float64') for i, column in enumerate(columns)}
+            return pd.Series(numexpr.evaluate(self.numexpr_source, local_dict=local_dict), index=source_df.index)
+        
+        result = self.evaluator(columns)
+        if not isinstance(result, pd.Series):
+            # Constant expression
+            result = pd.Series(result, index=source_df.index)
+        return result
+
+class MappingPlan:
+    """Column mappings with their expressions, transform chains and row filter compiled once per run"""
+    
+    def __init__(self, mappings: Dict[str, str], transforms: Optional[Dict[str, str]] = None,
+                 source_headers: Optional[List[str]] = None, row_filter: Optional[str] = None):
+        self.mappings = dict(mappings)
+        self.transforms = {
+            dest: spec.strip() for dest, spec in (transforms or {}).items()
+            if dest in self.mappings and isinstance(spec, str) and spec.strip()
+        }
+        self.steps = {dest: compile_transform_chain(spec) for dest, spec in self.transforms.items()}
+        self.expressions = {
+            dest: ColumnExpression(source) for dest, source in self.mappings.items() if is_expression(source)
+        }
+        self.row_filter = row_filter.strip() if isinstance(row_filter, str) and row_filter.strip() else None
+        # A row filter is a condition in the expression language, e.g. [Status] == 'Active'
+        self.condition = ColumnExpression('=' + self.row_filter.lstrip('=')) if self.row_filter else None
+        if source_headers is not None:
+            self.validate(source_headers)
+    
+    @property
+    def source_columns(self) -> List[str]:
+        """Get every source column the mappings read, in a stable order"""
+        columns = set(self.condition.columns if self.condition else [])
+        for dest_col, source in self.mappings.items():
+            expression = self.expressions.get(dest_col)
+            columns.update(expression.columns if expression else [source])
+        return sorted(columns)
+    
+    @property
+    def needs_apply(self) -> bool:
+        """Whether columns must be computed before copying (otherwise source columns are copied as they are)"""
+        return bool(self.steps or self.expressions)
+    
+    def validate(self, source_headers: List[str]):
+        """Check that every column an expression or the row filter references exists in the source"""
+        for dest_col, expression in self.expressions.items():
+            missing = expression.get_missing_columns(source_headers)
+            if missing:
+                raise ValueError(f"Expression for '{dest_col}' references unknown source columns: {', '.join(missing)}")
+        if self.condition is not None:
+            missing = self.condition.get_missing_columns(source_headers)
+            if missing:
+                raise ValueError(f"Row filter references unknown source columns: {', '.join(missing)}")
+    
+    def get_row_mask(self, chunk: pd.DataFrame) -> np.ndarray:
+        """Get which rows of a chunk match the row filter"""
+        if self.condition is None:
+            return np.ones(len(chunk), dtype=bool)
+        
+        missing = self.condition.get_missing_columns(chunk.columns)
+        if missing:
+            raise ValueError(f"Row filter references columns missing from the source: {', '.join(missing)}")
+        mask = self.condition.evaluate(chunk)
+        if not pd.api.types.is_bool_dtype(mask):
+            raise ValueError(f"Row filter must be a condition, e.g. [Status] == 'Active' (got {self.row_filter!r})")
+        return mask.to_numpy()
+    
+    def filter_rows(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Keep only the rows of a chunk that match the row filter (renumbered from 0)"""
+        if self.condition is None:
+            return chunk
+        return chunk[self.get_row_mask(chunk)].reset_index(drop=True)
+    
+    def column(self, source_df: pd.DataFrame, dest_col: str) -> Optional[pd.Series]:
+        """Get the (computed, transformed) values for one destination column, or None if its source is missing"""
+        expression = self.expressions.get(dest_col)
+        if expression is not None:
+            if expression.get_missing_columns(source_df.columns):
+                return None
+            values = expression.evaluate(source_df)
+        else:
+            source_col = self.mappings[dest_col]
+            if source_col not in source_df.columns:
+                return None
+            values = source_df[source_col]
+        
+        step = self.steps.get(dest_col)
+        return step(values) if step else values
+    
+    def apply(self, source_df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, str]]:
+        """Transform a chunk into columns named after their destinations, with the mappings to copy them"""
+        if not self.needs_apply:
+            return source_df, self.mappings
+        
+        result = pd.DataFrame(index=source_df.index)
+        for dest_col in self.mappings:
+            values = self.column(source_df, dest_col)
+            if values is not None:
+                result[dest_col] = values
+        return result, {dest_col: dest_col for dest_col in result.columns}
+
+def cast_integer(series: pd.Series) -> pd.Series:
+    """Cast to nullable integers; text that isn't a number and fractional numbers become missing"""
+    numbers = pd.to_numeric(series, errors='coerce')
+    return numbers.where(numbers == numbers.round()).astype('Int64')
+
+def cast_float(series: pd.Series) -> pd.Series:
+    """Cast to floats; text that isn't a number becomes missing"""
+    return pd.to_numeric(series, errors='coerce').astype('float64')
+
+def cast_date(series: pd.Series) -> pd.Series:
+    """Cast to datetimes; numbers are read as Excel serial dates"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return pd.to_datetime(series, unit='D', origin='1899-12-30', errors='coerce')
+    with warnings.catch_warnings():
+        # Text dates are parsed with the format of the first one; the rest that don't fit are reported
+        warnings.simplefilter('ignore', UserWarning)
+        return pd.to_datetime(series, errors='coerce')
+
+BOOLEAN_WORDS = {'true': True, 'yes': True, 'y': True, '1': True, 'false': False, 'no': False, 'n': False, '0': False}
+
+def cast_boolean(series: pd.Series) -> pd.Series:
+    """Cast to nullable booleans from True/False, yes/no, y/n or 1/0"""
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype('boolean')
+    if pd.api.types.is_float_dtype(series):
+        # Numbers other than 1 and 0 (0.5, inf) become missing and are reported
+        return series.map({1.0: True, 0.0: False}).astype('boolean')
+    return as_text(series).str.strip().str.lower().map(BOOLEAN_WORDS).astype('boolean')
+
+def cast_text(series: pd.Series) -> pd.Series:
+    """Cast to text; whole floats lose their '.0' (1001.0 -> "1001")"""
+    if pd.api.types.is_float_dtype(series) and has_only_whole_numbers(series):
+        series = series.astype('Int64')
+    return as_text(series).astype('string')
+
+# Schema type name -> vectorized cast
+COLUMN_TYPES: Dict[str, Callable[[pd.Series], pd.Series]] = {
+    'int': cast_integer,
+    'float': cast_float,
+    'date': cast_date,
+    'bool': cast_boolean,
+    'text': cast_text
+}
+
+def infer_column_type(series: pd.Series) -> Optional[str]:
+    """Guess a schema type from a template column's existing values (None for empty or mixed columns)"""
+    values = series.dropna()
+    if values.empty:
+        return None
+    if pd.api.types.is_bool_dtype(values):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(values):
+        return 'int'
+    if pd.api.types.is_float_dtype(values):
+        return 'float'
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return 'date'
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    return {'string': 'text', 'datetime': 'date', 'date': 'date'}.get(kind)
+
+def get_schema_path(template_path: Path) -> Path:
+    """Get the schema file declared next to a template (template.xlsx -> template.schema.json)"""
+    template_path = Path(template_path)
+    return template_path.with_name(template_path.stem + Config.SCHEMA_SUFFIX)
+
+# Validation rules a schema file can declare per column, besides "type"
+RULE_NAMES = ('required', 'pattern', 'min', 'max', 'max_length', 'unique')
+
+class DestinationSchema:
+    """Target type and validation rules per destination column, declared in a schema file or inferred from the template"""
+    
+    def __init__(self, column_types: Optional[Dict[str, str]] = None, rules: Optional[Dict[str, Dict[str, Any]]] = None):
+        column_types = column_types or {}
+        unknown = {column: name for column, name in column_types.items() if name not in COLUMN_TYPES}
+        if unknown:
+            column, name = next(iter(unknown.items()))
+            raise ValueError(
+                f"Unknown type '{name}' for column '{column}' (use one of: {', '.join(COLUMN_TYPES)})"
+            )
+        self.column_types = dict(column_types)
+        self.rules = {column: dict(column_rules) for column, column_rules in (rules or {}).items() if column_rules}
+        for column, column_rules in self.rules.items():
+            unknown_rules = sorted(set(column_rules) - set(RULE_NAMES))
+            if unknown_rules:
+                raise ValueError(
+                    f"Unknown rule '{unknown_rules[0]}' for column '{column}' (use one of: {', '.join(RULE_NAMES)})"
+                )
+            if 'pattern' in column_rules:
+                try:
+                    re.compile(column_rules['pattern'])
+                except re.error as e:
+                    raise ValueError(f"Invalid pattern for column '{column}': {e}")
+    
+    @classmethod
+    def from_template(cls, destination_df: pd.DataFrame, template_path: Optional[Path] = None) -> "DestinationSchema":
+        """Infer types from the template's data; a schema file next to the template overrides them"""
+        column_types = {}
+        for column in destination_df.columns:
+            column_type = infer_column_type(destination_df[column])
+            if column_type:
+                column_types[column] = column_type
+        
+        schema_path = get_schema_path(template_path) if template_path else None
+        if schema_path and schema_path.exists():
+            with open(schema_path, 'r', encoding='utf-8') as f:
+                declared = json.load(f)
+            # Either {"Column": "type"} or {"columns": {...}}, where a column can also be {"type": ..., "required": true, ...}
+            declared = declared.get('columns', declared)
+            rules = {}
+            for column, spec in declared.items():
+                if column not in destination_df.columns:
+                    continue
+                if isinstance(spec, dict):
+                    spec = dict(spec)
+                    if 'type' in spec:
+                        column_types[column] = spec.pop('type')
+                    rules[column] = spec
+                else:
+                    column_types[column] = spec
+            return cls(column_types, rules)
+        return cls(column_types)
+    
+    def check(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+        """Cast and validate a whole frame, returning it with every violation found"""
+        validator = ChunkValidator(self)
+        aligned = validator.check(df)
+        return aligned, validator.get_violations()
+    
+    def align(self, df: pd.DataFrame, policy: Optional[str] = None) -> Tuple[pd.DataFrame, Dict[str, Dict[str, Any]]]:
+        """Cast typed columns, returning the frame and the values that could not be converted per column"""
+        policy = policy or Config.CAST_ERROR_POLICY
+        problems = {}
+        aligned = df.copy(deep=False)
+        for column, name in self.column_types.items():
+            if column not in aligned.columns:
+                continue
+            original = aligned[column]
+            cast = COLUMN_TYPES[name](original)
+            invalid = (original.notna() & cast.isna()).to_numpy()
+            if invalid.any():
+                rows = np.flatnonzero(invalid)
+                problems[column] = {
+                    'type': name,
+                    'count': len(rows),
+                    # Data row numbers (1-based) with the offending values
+                    'examples': [(int(row) + 1, original.iloc[row]) for row in rows[:Config.PROBLEM_EXAMPLES]]
+                }
+            aligned[column] = cast
+        
+        if problems and policy == "error":
+            raise ValueError("Values don't match the destination types:\n" + "\n".join(describe_cast_problems(problems)))
+        return aligned, problems
+
+def get_comparable_values(series: pd.Series, bound: Any) -> Tuple[pd.Series, Any]:
+    """Bring a column and a min/max bound to types that compare (dates with dates, numbers with numbers)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, pd.Timestamp(bound)
+    if isinstance(bound, str):
+        return as_text(series), bound
+    return pd.to_numeric(series, errors='coerce'), bound
+
+def check_distinct_text(series: pd.Series, check: Callable[[pd.Series], pd.Series]) -> np.ndarray:
+    """Run a text check once per distinct value and spread the result back over the rows (missing values pass)"""
+    codes, uniques = pd.factorize(series)
+    results = check(pd.Series(np.asarray(uniques, dtype=object)).astype(str)).to_numpy(dtype=bool)
+    # factorize gives missing values the code -1, which picks the trailing False
+    return np.append(results, False)[codes]
+
+class ChunkValidator:
+    """Casts chunks of output rows to a schema's types and checks its rules, one vectorized pass per column and rule"""
+    
+    def __init__(self, schema: DestinationSchema, cast_policy: Optional[str] = None):
+        self.schema = schema
+        self.cast_policy = cast_policy
+        self.rows_checked = 0
+        # (column, rule) -> violation record, accumulated over all chunks
+        self.violations: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Values already seen in columns that must be unique
+        self.seen: Dict[str, pd.Index] = {}
+    
+    def record(self, column: str, rule: str, message: str, mask: np.ndarray, values: pd.Series):
+        """Count the rows flagged by mask and keep the first few as examples"""
+        rows = np.flatnonzero(mask)
+        if not len(rows):
+            return
+        violation = self.violations.setdefault(
+            (column, rule), {'column': column, 'rule': rule, 'message': message, 'count': 0, 'examples': []}
+        )
+        violation['count'] += len(rows)
+        room = Config.PROBLEM_EXAMPLES - len(violation['examples'])
+        # Data row numbers (1-based) across all chunks checked so far
+        for row in rows[:max(room, 0)]:
+            value = values.iloc[row]
+            if pd.isna(value):
+                value = None
+            elif isinstance(value, np.generic):
+                value = value.item()
+            violation['examples'].append((self.rows_checked + int(row) + 1, value))
+    
+    def check(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Cast a chunk to the schema's types and record its violations; returns the cast chunk"""
+        original = chunk
+        chunk, problems = self.schema.align(chunk, self.cast_policy)
+        for column, problem in problems.items():
+            self.record(column, 'type', f"are not {problem['type']}",
+                        (original[column].notna() & chunk[column].isna()).to_numpy(), original[column])
+        
+        for column, rules in self.schema.rules.items():
+            if column not in chunk.columns:
+                continue
+            series = chunk[column]
+            present = series.notna().to_numpy()
+            
+            if rules.get('required'):
+                self.record(column, 'required', "are empty", ~present, series)
+            if 'pattern' in rules:
+                pattern = rules['pattern']
+                mismatched = check_distinct_text(series, lambda values: ~values.str.fullmatch(pattern))
+                self.record(column, 'pattern', f"don't match {pattern}", mismatched, series)
+            for rule, message, compare in (('min', "are below", operator.lt), ('max', "are above", operator.gt)):
+                if rule in rules:
+                    values, bound = get_comparable_values(series, rules[rule])
+                    outside = compare(values, bound).fillna(False).to_numpy(dtype=bool)
+                    self.record(column, rule, f"{message} {rules[rule]}", present & outside, series)
+            if 'max_length' in rules:
+                max_length = rules['max_length']
+                too_long = check_distinct_text(series, lambda values: values.str.len() > max_length)
+                self.record(column, 'max_length', f"are longer than {max_length} characters", too_long, series)
+            if rules.get('unique'):
+                repeated = series.duplicated(keep=False).to_numpy()
+                current = pd.Index(series[present].unique())
+                if column in self.seen:
+                    repeated |= series.isin(self.seen[column]).to_numpy()
+                    current = self.seen[column].append(current)
+                self.record(column, 'unique', "are duplicated", present & repeated, series)
+                self.seen[column] = current
+        
+        self.rows_checked += len(chunk)
+        return chunk
+    
+    def get_violations(self) -> List[Dict[str, Any]]:
+        """Get every violation found so far"""
+        return list(self.violations.values())
+    
+    def raise_if_invalid(self):
+        """Stop before writing when the validation policy says rule violations are errors"""
+        if self.violations and Config.VALIDATION_POLICY == "error":
+            raise ValueError(
+                "Output failed validation, nothing was written:\n" + "\n".join(describe_violations(self.get_violations()))
+            )
+
+def describe_violations(violations: List[Dict[str, Any]]) -> List[str]:
+    """Describe validation violations, one line per column and rule"""
+    lines = []
+    for violation in violations:
+        examples = ", ".join(f"row {row}: {value!r}" for row, value in violation['examples'])
+        lines.append(f"{violation['column']}: {violation['count']} values {violation['message']} (e.g. {examples})")
+    return lines
+
+def describe_cast_problems(problems: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Describe values that could not be converted, one line per column"""
+    lines = []
+    for column, problem in problems.items():
+        examples = ", ".join(f"row {row}: {value!r}" for row, value in problem['examples'])
+        lines.append(f"{column}: {problem['count']} values are not {problem['type']} (e.g. {examples})")
+    return lines
+
+def build_transfer_frame(
+    source_df: pd.DataFrame,
+    destination_df: pd.DataFrame,
+    mappings: Dict[str, str],
+    token: Optional[CancellationToken] = None,
+    report: Optional[Callable[..., None]] = None,
+    tracer: Optional[PerformanceTracer] = None
+) -> pd.DataFrame:
+    """Copy mapped source columns into a copy of the destination data, row by position"""
+    report = report or (lambda message, progress=None: None)
+    tracer = tracer or PerformanceTracer()
+    
+    # Create result dataframe, grown once to fit the source; reindexing keeps each column's type
+    # (padding with an all-object frame would turn every column into object)
+    result_df = destination_df.reset_index(drop=True)
+    if len(source_df) > len(result_df):
+        result_df = result_df.reindex(range(len(source_df)))
+    else:
+        result_df = result_df.copy()
+    
+    # Copy data for each mapping
+    total_mappings = len(mappings)
+    for i, (dest_col, source_col) in enumerate(mappings.items()):
+        check_cancelled(token)
+        progress = 20 + (60 * i / total_mappings)
+        report(f"Copying {source_col} → {dest_col}...", progress)
+        
+        if source_col in source_df.columns:
+            with tracer.span("copy_mapping", source=source_col, destination=dest_col) as span:
+                source_data = source_df[source_col].reset_index(drop=True)
+                
+                # Copy data
+                result_df[dest_col] = source_data
+                span['rows'] = len(source_data)
+    
+    return result_df
+
+def needs_text_keys(left_keys: pd.Series, right_keys: pd.Series) -> bool:
+    """Whether two key columns only match when compared as text (e.g. 1001 in one, "1001" in the other)"""
+    both_numeric = pd.api.types.is_numeric_dtype(left_keys) and pd.api.types.is_numeric_dtype(right_keys)
+    return not (both_numeric or left_keys.dtype == right_keys.dtype)
+
+def as_key_text(keys: pd.Series) -> pd.Series:
+    """Convert key values to trimmed text, keeping blanks blank (whole floats lose their '.0')"""
+    text = keys.astype(str).str.strip()
+    if pd.api.types.is_float_dtype(keys):
+        # Value by value, so one huge or infinite key doesn't keep the others from matching
+        whole = get_whole_numbers(keys)
+        if whole.any():
+            text[whole] = keys[whole].astype('int64').astype(str)
+    return text.where(keys.notna())
+
+def get_join_keys(destination_keys: pd.Series, source_keys: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Bring destination and source key columns to a comparable type"""
+    if not needs_text_keys(destination_keys, source_keys):
+        return destination_keys, source_keys
+    return as_key_text(destination_keys), as_key_text(source_keys)
+
+def merge_column_values(column: pd.Series, positions: np.ndarray, values: pd.Series) -> pd.Series:
+    """Return a copy of column with values written at the given row positions"""
+    try:
+        dtype = np.result_type(column.dtype, values.dtype)
+    except TypeError:
+        dtype = object
+    merged = column.to_numpy(dtype=dtype, copy=True)
+    merged[positions] = values.to_numpy(dtype=dtype)
+    return pd.Series(merged, index=column.index, name=column.name)
+
+def upsert_transfer_frame(
+    source_df: pd.DataFrame,
+    destination_df: pd.DataFrame,
+    mappings: Dict[str, str],
+    key_column: str,
+    token: Optional[CancellationToken] = None,
+    report: Optional[Callable[..., None]] = None,
+    tracer: Optional[PerformanceTracer] = None
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """Update destination rows whose key matches a source row and append the rest"""
+    report = report or (lambda message, progress=None: None)
+    tracer = tracer or PerformanceTracer()
+    
+    if key_column not in mappings:
+        raise ValueError(f"Key column '{key_column}' must be mapped to a source column")
+    if key_column not in destination_df.columns:
+        raise ValueError(f"Key column '{key_column}' is not in the destination file")
+    if mappings[key_column] not in source_df.columns:
+        raise ValueError(f"Source column '{mappings[key_column]}' is not in the source file")
+    
+    mapped = {dest: source for dest, source in mappings.items() if source in source_df.columns}
+    destination_keys, source_keys = get_join_keys(destination_df[key_column], source_df[mapped[key_column]])
+    
+    with tracer.span("build_key_index", rows=len(destination_df), key=key_column):
+        key_index = pd.Index(destination_keys)
+        if not key_index.is_unique:
+            duplicates = key_index[key_index.duplicated()].unique()
+            raise ValueError(
+                f"Destination key column '{key_column}' has {len(duplicates)} duplicate values "
+                f"(e.g. {duplicates[0]!r}); rows can't be matched unambiguously"
+            )
+    check_cancelled(token)
+    
+    report("Matching rows on key...", 30)
+    with tracer.span("match_keys", rows=len(source_df), key=key_column):
+        # When a key repeats in the source, its last row wins
+        source_rows = source_df[~source_keys.duplicated(keep='last') | source_keys.isna()]
+        source_keys = source_keys.loc[source_rows.index]
+        positions = key_index.get_indexer(source_keys)
+        # Rows without a key can't match anything, so they are always inserted
+        positions[source_keys.isna().to_numpy()] = -1
+        matched = positions >= 0
+    check_cancelled(token)
+    
+    result_df = destination_df.copy()
+    # Matched rows already agree on the key, so keep the destination's own key values
+    updates = {dest: source for dest, source in mapped.items() if dest != key_column}
+    total_mappings = max(len(updates), 1)
+    for i, (dest_col, source_col) in enumerate(updates.items()):
+        check_cancelled(token)
+        report(f"Updating {dest_col} ← {source_col}...", 40 + (30 * i / total_mappings))
+        with tracer.span("update_mapping", rows=int(matched.sum()), source=source_col, destination=dest_col):
+            result_df[dest_col] = merge_column_values(
+                result_df[dest_col], positions[matched], source_rows[source_col][matched]
+            )
+    
+    report("Appending new rows...", 75)
+    inserted = remap_frame(source_rows[~matched], mapped, destination_df.columns.tolist())
+    if len(inserted):
+        with tracer.span("insert_rows", rows=len(inserted)):
+            result_df = pd.concat([result_df, inserted], ignore_index=True)
+    
+    return result_df, {'updated': int(matched.sum()), 'inserted': len(inserted)}
+
+# Columns of the mapping history CSV; the first four identify a session
+HISTORY_COLUMNS = [
+    'Timestamp', 'Source_File', 'Destination_File', 'Output_File',
+    'Source_Column', 'Destination_Column', 'Transforms', 'Row_Filter', 'Use_Count'
+]
+SESSION_COLUMNS = HISTORY_COLUMNS[:4]
+
+def read_csv_header(file_path: Path) -> List[str]:
+    """Read just the header row of a CSV file"""
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        return next(csv.reader(f), [])
+
+def append_mapping_history(
+    mappings: Dict[str, str],
+    source_file_name: str,
+    destination_file_name: str,
+    output_file_name: str,
+    transforms: Optional[Dict[str, str]] = None,
+    row_filter: Optional[str] = None
+):
+    """Append one mapping session to the history CSV file"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    transforms = transforms or {}
+    
+    history_data = []
+    for dest_col, source_col in mappings.items():
+        history_data.append({
+            'Timestamp': timestamp,
+            'Source_File': source_file_name,
+            'Destination_File': destination_file_name,
+            'Output_File': output_file_name,
+            'Source_Column': source_col,
+            'Destination_Column': dest_col,
+            'Transforms': transforms.get(dest_col, ''),
+            'Row_Filter': row_filter or '',
+            'Use_Count': 1
+        })
+    
+    new_history_df = pd.DataFrame(history_data, columns=HISTORY_COLUMNS)
+    Config.HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    
+    if Config.HISTORY_FILE.exists() and read_csv_header(Config.HISTORY_FILE) == HISTORY_COLUMNS:
+        # Append in place, so the rows (and byte offsets) of earlier sessions never move
+        new_history_df.to_csv(Config.HISTORY_FILE, mode='a', header=False, index=False)
+    elif Config.HISTORY_FILE.exists():
+        # A history written by an older version gets its columns upgraded once
+        existing_history_df = pd.read_csv(Config.HISTORY_FILE)
+        combined_history_df = pd.concat([existing_history_df, new_history_df], ignore_index=True)
+        combined_history_df.to_csv(Config.HISTORY_FILE, index=False)
+    else:
+        new_history_df.to_csv(Config.HISTORY_FILE, index=False)
+
+class HistoryIndex:
+    """Summary of every history session with its byte range in the history CSV, extended as the file grows"""
+    
+    BOUNDARY_BYTES = 4096  # Bytes before the indexed end that must be unchanged to trust the index
+    INDEX_VERSION = 3  # Bumped when session summaries gain fields, so older indexes are rebuilt
+    
+    def __init__(self, history_file: Optional[Path] = None):
+        self.history_file = Path(history_file or Config.HISTORY_FILE)
+        self.index_file = self.history_file.with_name(f"{self.history_file.stem}.index.json")
+    
+    def get_boundary_digest(self, f, end: int) -> str:
+        """Digest the bytes just before end, to tell an appended file from a rewritten one"""
+        start = max(end - self.BOUNDARY_BYTES, 0)
+        f.seek(start)
+        return hashlib.sha1(f.read(end - start)).hexdigest()
+    
+    def load_state(self) -> Optional[Dict[str, Any]]:
+        """Read the saved index, if any"""
+        if not self.index_file.exists():
+            return None
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read history index, rebuilding it: {e}")
+            return None
+    
+    def get_sessions(self) -> List[Dict[str, Any]]:
+        """Get session summaries, oldest first, indexing only rows added since the last call"""
+        if not self.history_file.exists():
+            return []
+        
+        state = self.load_state()
+        size = self.history_file.stat().st_size
+        with open(self.history_file, 'rb') as f:
+            header = f.readline()
+            header_text = header.decode('utf-8')
+            if (
+                state is None
+                or state.get('version') != self.INDEX_VERSION
+                or state.get('header') != header_text
+                or size < state['indexed_bytes']
+                or self.get_boundary_digest(f, state['indexed_bytes']) != state['boundary_digest']
+            ):
+                # New or rewritten history: index it from the top
+                state = {'version': self.INDEX_VERSION, 'header': header_text,
+                         'indexed_bytes': len(header), 'sessions': []}
+            elif size == state['indexed_bytes']:
+                return state['sessions']
+            
+            state['indexed_bytes'] = self.scan(f, state['indexed_bytes'], header_text, state['sessions'])
+            state['boundary_digest'] = self.get_boundary_digest(f, state['indexed_bytes'])
+        
+        try:
+            write_json_atomic(self.index_file, state)
+        except OSError as e:
+            print(f"Warning: Could not save history index: {e}")
+        return state['sessions']
+    
+    @staticmethod
+    def scan(f, start: int, header_text: str, sessions: List[Dict[str, Any]]) -> int:
+        """Add the sessions in complete rows from start onwards to sessions; returns the offset indexed up to"""
+        header = next(csv.reader([header_text]))
+        key_positions = [header.index(column) for column in SESSION_COLUMNS]
+        source_position = header.index('Source_Column')
+        dest_position = header.index('Destination_Column')
+        uses_position = header.index('Use_Count') if 'Use_Count' in header else None
+        f.seek(start)
+        offset = start
+        record = b""
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A row still being written; index it next time
+                break
+            record += line
+            if record.count(b'"') % 2:
+                # Inside a quoted value that spans lines
+                continue
+            row = next(csv.reader([record.decode('utf-8')]))
+            end = offset + len(record)
+            key = [row[position] if position < len(row) else "" for position in key_positions]
+            try:
+                referenced = get_referenced_columns(row[source_position])
+            except ValueError:
+                referenced = [row[source_position]]
+            # Destination column followed by the source columns it reads, for compatibility ranking
+            columns = [row[dest_position], *referenced]
+            
+            last = sessions[-1] if sessions else None
+            if last is not None and last['end'] == offset and [last[column] for column in SESSION_COLUMNS] == key:
+                last['end'] = end
+                last['mappings_count'] += 1
+                last['columns'].append(columns)
+            else:
+                session = dict(zip(SESSION_COLUMNS, key))
+                uses = row[uses_position] if uses_position is not None and uses_position < len(row) else ""
+                session.update({
+                    'offset': offset, 'end': end, 'mappings_count': 1, 'columns': [columns],
+                    'use_count': int(uses) if uses.isdigit() else 1
+                })
+                sessions.append(session)
+            offset = end
+            record = b""
+        return offset
+    
+    def read_session(self, session: Dict[str, Any]) -> pd.DataFrame:
+        """Read the history rows of one session"""
+        with open(self.history_file, 'rb') as f:
+            header = f.readline()
+            f.seek(session['offset'])
+            rows = f.read(session['end'] - session['offset'])
+        # Read everything as text so column names that look like numbers stay as written
+        return pd.read_csv(io.BytesIO(header + rows), dtype=str, keep_default_na=False)
+
+def normalize_headers(names: pd.Series) -> pd.Series:
+    """Fold case and collapse spacing in column names, so 'Customer  name ' matches 'Customer Name'"""
+    return names.str.replace(r'\s+', ' ', regex=True).str.strip().str.casefold()
+
+class HeaderIndex:
+    """Type-ahead search over column names: names starting with the typed text first, then names containing it"""
+    
+    def __init__(self, headers: List[str]):
+        self.headers = [str(header) for header in headers]
+        self.folded = [header.casefold() for header in self.headers]
+        self.exact: Dict[str, str] = {}
+        for header, name in zip(self.headers, self.folded):
+            self.exact.setdefault(name, header)
+        # Names in sorted order find prefix matches by bisection; trigrams narrow substring matches
+        self.sorted_names = sorted(self.folded)
+        self.sorted_positions = sorted(range(len(self.folded)), key=self.folded.__getitem__)
+        self.trigrams: Dict[str, List[int]] = {}
+        for position, name in enumerate(self.folded):
+            for trigram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                self.trigrams.setdefault(trigram, []).append(position)
+    
+    def lookup(self, text: str) -> Optional[str]:
+        """Get the column named text, ignoring case"""
+        return self.exact.get(text.strip().casefold())
+    
+    def search(self, text: str, limit: int = 100) -> List[str]:
+        """Get up to limit columns matching text, each group in column order"""
+        query = text.strip().casefold()
+        if not query:
+            return self.headers[:limit]
+        
+        start = bisect.bisect_left(self.sorted_names, query)
+        end = start
+        while end < len(self.sorted_names) and self.sorted_names[end].startswith(query):
+            end += 1
+        prefix = sorted(self.sorted_positions[start:end])
+        
+        if len(prefix) < limit:
+            if len(query) >= 3:
+                # Only names holding every trigram of the query can contain it
+                postings = sorted((self.trigrams.get(query[i:i + 3], []) for i in range(len(query) - 2)), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                candidates = range(len(self.folded))
+            found = set(prefix)
+            prefix += sorted(
+                position for position in candidates
+                if position not in found and query in self.folded[position]
+            )
+        return [self.headers[position] for position in prefix[:limit]]
+
+class HeaderMatcher:
+    """Scores saved mappings against the loaded source and destination headers, optionally ignoring case and spacing"""
+    
+    def __init__(self, source_headers: List[str], destination_headers: List[str], normalize: bool = False):
+        self.normalize = normalize
+        # Lookup key -> loaded header name; the first header wins when two normalize alike
+        self.source_lookup = self.get_lookup(source_headers)
+        self.destination_lookup = self.get_lookup(destination_headers)
+    
+    def get_keys(self, names: List[str]) -> pd.Series:
+        """Get the lookup keys of column names"""
+        names = pd.Series(names, dtype=object).astype(str)
+        return normalize_headers(names) if self.normalize else names
+    
+    def get_lookup(self, headers: List[str]) -> Dict[str, str]:
+        """Map lookup keys to the header names they stand for"""
+        lookup = {}
+        for key, header in zip(self.get_keys(headers), headers):
+            lookup.setdefault(key, header)
+        return lookup
+    
+    def is_loaded(self, names: List[str], lookup: Dict[str, str]) -> np.ndarray:
+        """Check which column names are among the loaded headers, normalizing each distinct name once"""
+        codes, distinct = pd.factorize(pd.Series(names, dtype=object))
+        return self.get_keys(list(distinct)).isin(lookup).to_numpy()[codes]
+    
+    def rank(self, sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Score every session at once; best match first, then newest first"""
+        if not sessions:
+            return []
+        
+        # Flatten all sessions' mappings so the header lookups run once over the whole history
+        pairs = [pair for session in sessions for pair in session['columns']]
+        totals = np.array([len(session['columns']) for session in sessions], dtype=np.int64)
+        pair_sessions = np.repeat(np.arange(len(sessions)), totals)
+        
+        usable = self.is_loaded([pair[0] for pair in pairs], self.destination_lookup)
+        source_counts = np.array([len(pair) - 1 for pair in pairs], dtype=np.int64)
+        if source_counts.sum():
+            sources = [column for pair in pairs for column in pair[1:]]
+            missing_sources = ~self.is_loaded(sources, self.source_lookup)
+            source_pairs = np.repeat(np.arange(len(pairs)), source_counts)
+            usable &= np.bincount(source_pairs, weights=missing_sources, minlength=len(pairs)) == 0
+        
+        matched = np.bincount(pair_sessions, weights=usable, minlength=len(sessions)).astype(np.int64)
+        percents = np.divide(matched * 100.0, totals, out=np.zeros(len(sessions)), where=totals > 0)
+        
+        order = np.lexsort((-np.arange(len(sessions)), -percents))
+        return [
+            dict(sessions[position], matched=int(matched[position]), match_percent=float(percents[position]))
+            for position in order
+        ]
+    
+    def resolve_row_filter(self, row_filter: Optional[str]) -> Optional[str]:
+        """Point a saved row filter at the loaded source headers (None when it reads a column that isn't there)"""
+        if not row_filter:
+            return None
+        try:
+            referenced = ColumnExpression('=' + row_filter).columns
+        except (SyntaxError, ValueError):
+            return None
+        keys = self.get_keys(referenced).tolist()
+        if any(key not in self.source_lookup for key in keys):
+            return None
+        renames = {column: self.source_lookup[key] for column, key in zip(referenced, keys)}
+        return rename_referenced_columns('=' + row_filter, renames)[1:]
+    
+    def resolve(self, mappings: Dict[str, str],
+                transforms: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
+        """Split saved mappings into (those that fit, renamed to the loaded headers; their transform chains; the rest)"""
+        transforms = transforms or {}
+        usable, usable_transforms, skipped = {}, {}, {}
+        for destination, source in mappings.items():
+            try:
+                referenced = get_referenced_columns(source)
+            except ValueError:
+                referenced = [source]
+            keys = self.get_keys([destination, *referenced]).tolist()
+            if keys[0] not in self.destination_lookup or any(key not in self.source_lookup for key in keys[1:]):
+                skipped[destination] = source
+                continue
+            
+            renames = {column: self.source_lookup[key] for column, key in zip(referenced, keys[1:])}
+            loaded_destination = self.destination_lookup[keys[0]]
+            usable[loaded_destination] = rename_referenced_columns(source, renames)
+            if destination in transforms:
+                usable_transforms[loaded_destination] = transforms[destination]
+        return usable, usable_transforms, skipped
+
+def rename_referenced_columns(source_spec: str, renames: Dict[str, str]) -> str:
+    """Point a mapping's source column (or an expression's column references) at renamed columns"""
+    if not is_expression(source_spec):
+        return renames.get(source_spec, source_spec)
+    
+    def reference(match):
+        if match.group(1):
+            return match.group(1)
+        return f"[{renames.get(match.group(2), match.group(2))}]"
+    return EXPRESSION_TOKEN.sub(reference, source_spec)
+
+def get_history_transforms(history_df: pd.DataFrame) -> Dict[str, str]:
+    """Get the transform chains recorded in history rows (sessions saved before transforms have none)"""
+    if 'Transforms' not in history_df.columns:
+        return {}
+    return {
+        dest: spec for dest, spec in zip(history_df['Destination_Column'], history_df['Transforms'])
+        if isinstance(spec, str) and spec.strip()
+    }
+
+def get_history_row_filter(history_df: pd.DataFrame) -> Optional[str]:
+    """Get the row filter recorded with a history session, if any"""
+    if 'Row_Filter' not in history_df.columns:
+        return None
+    filters = [value for value in history_df['Row_Filter'] if isinstance(value, str) and value.strip()]
+    return filters[0] if filters else None
+
+def load_history_session(session_timestamp: Optional[str] = None,
+                         destination_file_name: Optional[str] = None) -> Dict[str, Any]:
+    """Get the mappings, transform chains and row filter of a history session, by timestamp or the latest one (optionally for a template)"""
+    history_index = HistoryIndex()
+    sessions = history_index.get_sessions()
+    if not sessions:
+        raise ValueError("No mapping history found")
+    
+    if destination_file_name:
+        sessions = [session for session in sessions if session['Destination_File'] == destination_file_name]
+    if session_timestamp:
+        sessions = [session for session in sessions if session['Timestamp'] == session_timestamp]
+    if not sessions:
+        raise ValueError("No matching mapping session found in history")
+    
+    # The latest session wins; of sessions saved in the same second, the last one written
+    latest = max(range(len(sessions)), key=lambda i: (sessions[i]['Timestamp'], i))
+    history_df = history_index.read_session(sessions[latest])
+    
+    return {
+        'mappings': dict(zip(history_df['Destination_Column'], history_df['Source_Column'])),
+        'transforms': get_history_transforms(history_df),
+        'row_filter': get_history_row_filter(history_df)
+    }
+
+def load_history_policy() -> Dict[str, Any]:
+    """Get the history retention settings: Config defaults, overridden by the "history" section of config.json"""
+    policy = {
+        'auto_compact': Config.HISTORY_AUTO_COMPACT,
+        'compact_bytes': Config.HISTORY_COMPACT_BYTES,
+        'archive_days': Config.HISTORY_ARCHIVE_DAYS,
+        'retention_days': Config.HISTORY_RETENTION_DAYS
+    }
+    try:
+        if Config.CONFIG_FILE.exists():
+            with open(Config.CONFIG_FILE, 'r') as f:
+                settings = json.load(f).get('history', {})
+            policy.update({key: value for key, value in settings.items() if key in policy})
+    except Exception as e:
+        print(f"Warning: Could not load history settings: {e}")
+    return policy
+
+class HistoryCompactor:
+    """Keeps the history small: merges repeated sessions, archives old ones by month and drops expired ones"""
+    
+    ARCHIVE_PREFIX = "mapping_history_"  # Archives are named mapping_history_YYYY-MM.csv.gz
+    
+    def __init__(self, history_file: Optional[Path] = None, archive_dir: Optional[Path] = None,
+                 policy: Optional[Dict[str, Any]] = None):
+        self.history_file = Path(history_file or Config.HISTORY_FILE)
+        self.archive_dir = Path(archive_dir or Config.HISTORY_ARCHIVE_DIR)
+        self.policy = policy or load_history_policy()
+    
+    def get_cutoff(self, days: int, now: datetime) -> Optional[pd.Timestamp]:
+        """Get the time before which a setting in days applies (None when it is switched off)"""
+        return pd.Timestamp(now) - pd.Timedelta(days=days) if days else None
+    
+    def is_due(self, now: Optional[datetime] = None) -> bool:
+        """Check whether the history has grown past its size limit or starts with a session due for archiving"""
+        if not self.history_file.exists():
+            return False
+        if self.history_file.stat().st_size >= self.policy['compact_bytes']:
+            return True
+        
+        # Checked with the standard library only, so the check at launch doesn't import pandas
+        days = self.policy['archive_days'] or self.policy['retention_days']
+        if not days:
+            return False
+        cutoff = (now or datetime.now()) - timedelta(days=days)
+        # Sessions are appended in time order, so the first row is the oldest
+        with open(self.history_file, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            first_row = next(reader, None)
+        if first_row is None or 'Timestamp' not in header:
+            return False
+        try:
+            oldest = datetime.fromisoformat(first_row[header.index('Timestamp')].strip())
+        except (ValueError, IndexError):
+            return False
+        return oldest < cutoff
+    
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Compact the history file; returns counts of what was merged, archived and deleted"""
+        now = now or datetime.now()
+        stats = {'sessions': 0, 'merged': 0, 'archived': 0, 'expired': 0, 'remaining': 0, 'archives_removed': 0}
+        retention_cutoff = self.get_cutoff(self.policy['retention_days'], now)
+        stats['archives_removed'] = self.remove_expired_archives(retention_cutoff)
+        if not self.history_file.exists():
+            return stats
+        
+        with open(self.history_file, 'rb') as f:
+            data = f.read()
+        history_df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+        for column in HISTORY_COLUMNS:
+            if column not in history_df.columns:
+                history_df[column] = ''
+        history_df = history_df[HISTORY_COLUMNS]
+        
+        # A session is a run of rows sharing timestamp and files, as the history index groups them
+        keys = history_df[SESSION_COLUMNS]
+        session_ids = (keys != keys.shift()).any(axis=1).cumsum()
+        rows = history_df['Destination_Column'] + '\x1f' + history_df['Source_Column'] + '\x1f' + history_df['Transforms']
+        sessions = history_df.groupby(session_ids)[['Timestamp', 'Destination_File', 'Row_Filter', 'Use_Count']].first()
+        # Identical sessions map the same columns the same way into the same template, whatever the source file
+        sessions['signature'] = (
+            sessions['Destination_File'] + '\x1d' + sessions['Row_Filter'] + '\x1d'
+            + rows.groupby(session_ids).agg(lambda session_rows: '\x1e'.join(sorted(session_rows)))
+        )
+        sessions['uses'] = pd.to_numeric(sessions['Use_Count'], errors='coerce').fillna(1).clip(lower=1).astype(int)
+        stats['sessions'] = len(sessions)
+        
+        # Keep the last use of each session with its uses summed; ties on time go to the one written last
+        latest = sessions.sort_values('Timestamp', kind='stable').groupby('signature').tail(1).sort_index()
+        total_uses = sessions.groupby('signature')['uses'].sum()
+        use_counts = latest['signature'].map(total_uses).astype(str)
+        stats['merged'] = len(sessions) - len(latest)
+        
+        last_used = pd.to_datetime(latest['Timestamp'], errors='coerce')
+        archive_cutoff = self.get_cutoff(self.policy['archive_days'], now)
+        expired = last_used < retention_cutoff if retention_cutoff is not None else pd.Series(False, index=latest.index)
+        archived = ~expired & (last_used < archive_cutoff) if archive_cutoff is not None else pd.Series(False, index=latest.index)
+        stats['expired'] = int(expired.sum())
+        stats['archived'] = int(archived.sum())
+        
+        history_df['Use_Count'] = session_ids.map(use_counts)
+        kept_rows = session_ids.isin(latest.index)
+        archived_rows = session_ids.isin(latest.index[archived])
+        hot_rows = kept_rows & ~archived_rows & ~session_ids.isin(latest.index[expired])
+        
+        if archived.any():
+            months = session_ids[archived_rows].map(last_used[archived].dt.strftime('%Y-%m'))
+            for month, month_df in history_df[archived_rows].groupby(months):
+                self.append_archive(month, month_df)
+        
+        stats['remaining'] = int(len(latest) - stats['expired'] - stats['archived'])
+        self.replace_history(history_df[hot_rows], len(data))
+        return stats
+    
+    def append_archive(self, month: str, month_df: pd.DataFrame):
+        """Add sessions to a month's gzip archive (each write adds a gzip member, which readers see as one file)"""
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        archive_path = self.archive_dir / f"{self.ARCHIVE_PREFIX}{month}.csv.gz"
+        write_header = not archive_path.exists()
+        with gzip.open(archive_path, 'at', encoding='utf-8', newline='') as f:
+            month_df.to_csv(f, header=write_header, index=False)
+    
+    def replace_history(self, hot_df: pd.DataFrame, read_bytes: int):
+        """Swap in the compacted history, keeping any rows another process appended while it was built"""
+        partial_path = self.history_file.with_name(f".{self.history_file.name}.partial")
+        hot_df.to_csv(partial_path, index=False)
+        with open(self.history_file, 'rb') as f:
+            f.seek(read_bytes)
+            appended = f.read()
+        if appended:
+            with open(partial_path, 'ab') as f:
+                f.write(appended)
+        os.replace(partial_path, self.history_file)
+    
+    def remove_expired_archives(self, cutoff: Optional[pd.Timestamp]) -> int:
+        """Delete monthly archives whose whole month is older than the retention window"""
+        if cutoff is None or not self.archive_dir.exists():
+            return 0
+        removed = 0
+        for archive_path in self.archive_dir.glob(f"{self.ARCHIVE_PREFIX}*.csv.gz"):
+            month = archive_path.name[len(self.ARCHIVE_PREFIX):-len(".csv.gz")]
+            try:
+                month_end = pd.Period(month, freq='M').end_time
+            except ValueError:
+                continue
+            if month_end < cutoff:
+                archive_path.unlink()
+                removed += 1
+        return removed
+
+def describe_compaction(stats: Dict[str, int]) -> str:
+    """Summarize a history compaction in one line"""
+    return (
+        f"History compacted: {stats['sessions']} sessions, {stats['merged']} repeats merged, "
+        f"{stats['archived']} archived, {stats['expired']} expired, {stats['remaining']} kept"
+        + (f"; {stats['archives_removed']} expired archives removed" if stats['archives_removed'] else "")
+    )
+
+def compact_history_if_due():
+    """Run the automatic history compaction when the retention settings call for it"""
+    compactor = HistoryCompactor()
+    if not compactor.policy['auto_compact']:
+        return
+    try:
+        if compactor.is_due():
+            print(describe_compaction(compactor.run()))
+    except Exception as e:
+        print(f"Warning: Could not compact history: {e}")
+
+def load_mapping_spec(file_path: Path) -> Dict[str, Any]:
+    """Load mappings ({"Destination": "Source" or {"source": ..., "transforms": ...}}), transform chains and row filter from a JSON file"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return parse_mapping_spec(data, Path(file_path).name)
+
+def parse_mapping_spec(data: Any, file_name: str) -> Dict[str, Any]:
+    """Get the mappings, transform chains and row filter from parsed mapping file (or profile) data"""
+    mappings = data.get('mappings', data) if isinstance(data, dict) else None
+    if not isinstance(mappings, dict) or not mappings:
+        raise ValueError(f"{file_name} does not contain any column mappings")
+    
+    transforms = {str(dest): str(spec) for dest, spec in (data.get('transforms') or {}).items()} if 'mappings' in data else {}
+    plain_mappings = {}
+    for dest, source in mappings.items():
+        if isinstance(source, dict):
+            if source.get('transforms'):
+                transforms[str(dest)] = str(source['transforms'])
+            source = source.get('source')
+        if source is None or not str(source).strip():
+            raise ValueError(f"Mapping for {dest!r} in {file_name} has no source column")
+        plain_mappings[str(dest)] = str(source)
+    
+    row_filter = data.get('row_filter') if 'mappings' in data else None
+    
+    # Fail on a bad chain or filter now rather than on the first file
+    MappingPlan(plain_mappings, transforms, row_filter=row_filter)
+    return {'mappings': plain_mappings, 'transforms': transforms, 'row_filter': row_filter}
+
+def get_header_signature(headers: List[str]) -> str:
+    """Fingerprint a template's header row, so profiles made for the same layout can be found"""
+    return hashlib.sha1("\x1f".join(str(header) for header in headers).encode('utf-8')).hexdigest()
+
+def write_json_atomic(file_path: Path, data: Any):
+    """Write a JSON file so readers never see it half written"""
+    partial_path = file_path.with_name(f".{file_path.name}.partial")
+    with open(partial_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(partial_path, file_path)
+
+class ProfileStore:
+    """Named mapping profiles saved as small JSON files, listed through an index file"""
+    
+    INDEX_NAME = "index.json"
+    
+    def __init__(self, profiles_dir: Optional[Path] = None):
+        self.profiles_dir = Path(profiles_dir or Config.PROFILES_DIR)
+        self.index_path = self.profiles_dir / self.INDEX_NAME
+    
+    def load_index(self) -> Dict[str, Dict[str, Any]]:
+        """Get the index of saved profiles (name -> summary), rebuilding it if it is missing or damaged"""
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read profile index, rebuilding it: {e}")
+        return self.rebuild_index()
+    
+    def rebuild_index(self) -> Dict[str, Dict[str, Any]]:
+        """Recreate the index from the profile files on disk"""
+        index = {}
+        for file_path in sorted(self.profiles_dir.glob("*.json")) if self.profiles_dir.exists() else []:
+            if file_path.name == self.INDEX_NAME:
+                continue
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    profile = json.load(f)
+                index[profile['name']] = self.get_summary(profile, file_path.name)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Skipping unreadable profile {file_path.name}: {e}")
+        if self.profiles_dir.exists():
+            write_json_atomic(self.index_path, index)
+        return index
+    
+    @staticmethod
+    def get_summary(profile: Dict[str, Any], file_name: str) -> Dict[str, Any]:
+        """Get the index entry for a profile"""
+        return {
+            'file': file_name,
+            'template': profile.get('template'),
+            'header_signature': profile.get('header_signature'),
+            'mappings_count': len(profile.get('mappings', {})),
+            'saved_at': profile.get('saved_at')
+        }
+    
+    def get_file_name(self, name: str, index: Dict[str, Dict[str, Any]]) -> str:
+        """Get the file a profile is stored in, keeping names that only differ in punctuation apart"""
+        if name in index:
+            return index[name]['file']
+        slug = re.sub(r'[^\w-]+', '_', name).strip('_') or "profile"
+        if any(entry['file'] == f"{slug}.json" for entry in index.values()):
+            slug = f"{slug}_{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}"
+        return f"{slug}.json"
+    
+    def save(self, name: str, mappings: Dict[str, str], destination_headers: List[str],
+             transforms: Optional[Dict[str, str]] = None, row_filter: Optional[str] = None,
+             template_name: Optional[str] = None) -> Path:
+        """Save (or replace) a named profile"""
+        name = name.strip()
+        if not name:
+            raise ValueError("A profile needs a name")
+        plan = MappingPlan(mappings, transforms, row_filter=row_filter)
+        
+        self.profiles_dir.mkdir(parents=True, exist_ok=True)
+        index = self.load_index()
+        file_name = self.get_file_name(name, index)
+        profile = {
+            'name': name,
+            'template': template_name,
+            'destination_headers': list(destination_headers),
+            'header_signature': get_header_signature(destination_headers),
+            'mappings': plan.mappings,
+            'transforms': plan.transforms,
+            'row_filter': plan.row_filter,
+            'saved_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        write_json_atomic(self.profiles_dir / file_name, profile)
+        
+        index[name] = self.get_summary(profile, file_name)
+        write_json_atomic(self.index_path, index)
+        return self.profiles_dir / file_name
+    
+    def load(self, name: str) -> Dict[str, Any]:
+        """Load a profile by name: one index lookup and one small file, however long the history is"""
+        entry = self.load_index().get(name)
+        if entry is None:
+            raise ValueError(f"No mapping profile named '{name}'")
+        file_path = self.profiles_dir / entry['file']
+        with open(file_path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+        profile.update(parse_mapping_spec(profile, file_path.name))
+        return profile
+    
+    def delete(self, name: str):
+        """Remove a profile and its index entry"""
+        index = self.load_index()
+        entry = index.pop(name, None)
+        if entry is None:
+            return
+        (self.profiles_dir / entry['file']).unlink(missing_ok=True)
+        write_json_atomic(self.index_path, index)
+    
+    def list_profiles(self, destination_headers: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """List profile summaries by name; profiles made for the given header row come first"""
+        signature = get_header_signature(destination_headers) if destination_headers is not None else None
+        profiles = [
+            dict(entry, name=name, matches_template=signature is not None and entry.get('header_signature') == signature)
+            for name, entry in self.load_index().items()
+        ]
+        return sorted(profiles, key=lambda profile: (not profile['matches_template'], profile['name'].lower()))
+
+def read_data_file(file_path: Path, token: Optional[CancellationToken] = None,
+                   chunk_filter: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None) -> pd.DataFrame:
+    """Read a whole Excel or CSV file through the chunked readers, optionally filtering each chunk as it is read"""
+    chunks = [
+        chunk_filter(chunk) if chunk_filter else chunk
+        for chunk in iter_file_chunks(Path(file_path), token=token)
+    ]
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+def remap_source_file(
+    file_path: str,
+    mappings: Dict[str, str],
+    destination_headers: List[str],
+    source_column: Optional[str] = None,
+    transforms: Optional[Dict[str, str]] = None,
+    row_filter: Optional[str] = None
+) -> pd.DataFrame:
+    """Read one source file and lay its mapped columns out as destination columns (worker process)"""
+    file_path = Path(file_path)
+    plan = MappingPlan(mappings, transforms, row_filter=row_filter)
+    source_df, mappings = plan.apply(read_data_file(file_path, chunk_filter=plan.filter_rows))
+    
+    remapped = remap_frame(source_df, mappings, destination_headers)
+    
+    if source_column:
+        remapped[source_column] = file_path.name
+    
+    return remapped
+
+def remap_frame(source_df: pd.DataFrame, mappings: Dict[str, str], destination_headers: List[str]) -> pd.DataFrame:
+    """Lay mapped source columns out as destination columns (unmapped destinations stay empty)"""
+    remapped = pd.DataFrame(index=source_df.index)
+    for dest_col in destination_headers:
+        source_col = mappings.get(dest_col)
+        if source_col is not None and source_col in source_df.columns:
+            remapped[dest_col] = source_df[source_col]
+        else:
+            remapped[dest_col] = float('nan')
+    return remapped
+
+def hash_rows(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Hash row contents of the given columns into one uint64 per row"""
+    normalized = pd.DataFrame(index=df.index)
+    for column in columns:
+        series = df[column] if column in df.columns else pd.Series(float('nan'), index=df.index)
+        # Hash numbers as floats so 25 and 25.0 (int vs float inference across chunks) match
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            series = series.astype('float64')
+        normalized[column] = series
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+def get_unseen_rows(hashes: np.ndarray, seen_hashes: np.ndarray) -> np.ndarray:
+    """Mark rows beyond the number of times their hash was already seen, so repeated rows count one by one"""
+    order = np.argsort(hashes, kind='stable')
+    sorted_hashes = hashes[order]
+    # 0 for the first row with a given hash, 1 for its first repeat, ...
+    occurrence = np.arange(len(hashes)) - np.searchsorted(sorted_hashes, sorted_hashes, side='left')
+    seen_sorted = np.sort(seen_hashes)
+    seen_count = (np.searchsorted(seen_sorted, sorted_hashes, side='right')
+                  - np.searchsorted(seen_sorted, sorted_hashes, side='left'))
+    unseen = np.empty(len(hashes), dtype=bool)
+    unseen[order] = occurrence >= seen_count
+    return unseen
+
+def append_output_rows(output_path: Path, rows: pd.DataFrame):
+    """Append rows (without header) to an existing CSV, gzip CSV or Excel output (CSV files are appended to in place;
+    an Excel workbook is loaded and saved again whole, so each append costs time and memory in the workbook's size)"""
+    output_path = Path(output_path)
+    output_format = get_output_format(output_path)
+    if output_format == 'csv':
+        rows.to_csv(output_path, mode='a', header=False, index=False)
+        return
+    if output_format == 'csv.gz':
+        # A gzip file may hold several compressed members, read back as one stream
+        with gzip.open(output_path, 'at', newline='', encoding='utf-8', compresslevel=Config.GZIP_LEVEL) as handle:
+            rows.to_csv(handle, header=False, index=False)
+        return
+    if not OUTPUT_WRITERS[output_format].appendable:
+        raise ValueError(f"Rows can't be appended to {output_format} files")
+    
+    with pd.ExcelWriter(output_path, mode='a', engine='openpyxl', if_sheet_exists='overlay') as writer:
+        sheet = writer.book.worksheets[0]
+        if sheet.max_row + len(rows) > XLSX_MAX_ROWS:
+            raise ValueError(f"Excel sheets hold at most {XLSX_MAX_ROWS:,} rows: save as CSV, Parquet or Feather instead")
+        rows.to_excel(writer, sheet_name=sheet.title, startrow=sheet.max_row, header=False, index=False)
+
+class IncrementalTransfer:
+    """Appends only source rows that are new since the last run to an existing output"""
+    
+    # Bytes before the last read position that must be unchanged to trust a CSV as append-only
+    BOUNDARY_BYTES = 64 * 1024
+    # The row-hash index holds one hash per transferred row, repeats included (older states held distinct hashes)
+    HASH_INDEX = "counts"
+    
+    def __init__(self, state_dir: Path = Config.INCREMENTAL_STATE_DIR, tracer: Optional[PerformanceTracer] = None,
+                 cast_policy: Optional[str] = None):
+        self.state_dir = Path(state_dir)
+        self.tracer = tracer or PerformanceTracer()
+        self.cast_policy = cast_policy
+    
+    def get_state_paths(self, source_path: Path, output_path: Path) -> Tuple[Path, Path]:
+        """Get the state JSON and row-hash index paths for a source/output pair"""
+        key = hashlib.sha1(f"{Path(source_path).resolve()}|{Path(output_path).resolve()}".encode('utf-8')).hexdigest()[:16]
+        return self.state_dir / f"{key}.json", self.state_dir / f"{key}.hashes"
+    
+    def load_state(self, source_path: Path, output_path: Path) -> Optional[Dict[str, Any]]:
+        """Load the saved state for a source/output pair, including its row-hash index"""
+        state_file, hashes_file = self.get_state_paths(source_path, output_path)
+        if not state_file.exists() or not hashes_file.exists():
+            return None
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            state['row_hashes'] = np.fromfile(hashes_file, dtype='uint64')
+            return state
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable incremental state: {e}")
+            return None
+    
+    def save_state(self, state: Dict[str, Any], row_hashes: np.ndarray):
+        """Save the state and row-hash index for a source/output pair"""
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        state_file, hashes_file = self.get_state_paths(Path(state['source_path']), Path(state['output_path']))
+        row_hashes.astype('uint64').tofile(hashes_file)
+        state = {key: value for key, value in state.items() if key != 'row_hashes'}
+        with open(state_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+    
+    @classmethod
+    def get_csv_checkpoint(cls, source_path: Path) -> Optional[Dict[str, Any]]:
+        """Record where a CSV ends so the next run can read only what is appended after it"""
+        size = source_path.stat().st_size
+        with open(source_path, 'rb') as f:
+            header_line = f.readline()
+            boundary_start = max(0, size - cls.BOUNDARY_BYTES)
+            f.seek(boundary_start)
+            boundary = f.read(size - boundary_start)
+        
+        # A file that doesn't end in a newline may still be mid-row; don't resume from it
+        if not boundary.endswith(b'\n'):
+            return None
+        return {
+            'byte_offset': size,
+            'header_digest': hashlib.sha1(header_line).hexdigest(),
+            'boundary_digest': hashlib.sha1(boundary).hexdigest()
+        }
+    
+    @classmethod
+    def take_csv_checkpoint(cls, source_path: Path) -> Optional[Dict[str, Any]]:
+        """Take a checkpoint of a plain CSV source before reading it (None for other formats and compressed files)"""
+        if source_path.suffix.lower() != '.csv' or not is_plain_file(source_path):
+            return None
+        return cls.get_csv_checkpoint(source_path)
+    
+    @classmethod
+    def read_csv_tail(cls, source_path: Path, previous: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]],
+                      columns: List[str]) -> Optional[pd.DataFrame]:
+        """Read only the rows between two checkpoints, or None if the CSV was rewritten"""
+        if not previous or not current or current['byte_offset'] < previous['byte_offset']:
+            return None
+        if current['header_digest'] != previous['header_digest']:
+            return None
+        
+        offset = previous['byte_offset']
+        with open(source_path, 'rb') as f:
+            boundary_start = max(0, offset - cls.BOUNDARY_BYTES)
+            f.seek(boundary_start)
+            if hashlib.sha1(f.read(offset - boundary_start)).hexdigest() != previous['boundary_digest']:
+                return None
+            
+            # Everything up to the previous checkpoint is unchanged: parse just the tail,
+            # stopping at the current checkpoint so rows still being written wait for next time
+            tail = f.read(current['byte_offset'] - offset)
+        if not tail:
+            return pd.DataFrame(columns=columns)
+        return pd.read_csv(io.BytesIO(tail), header=None, names=columns, encoding='utf-8')
+    
+    def run(
+        self,
+        source_path: Path,
+        destination_df: pd.DataFrame,
+        mappings: Dict[str, str],
+        output_path: Path,
+        source_df: Optional[pd.DataFrame] = None,
+        token: Optional[CancellationToken] = None,
+        report: Optional[Callable[..., None]] = None,
+        transforms: Optional[Dict[str, str]] = None,
+        row_filter: Optional[str] = None,
+        schema: Optional[DestinationSchema] = None
+    ) -> Dict[str, Any]:
+        """Append new source rows to the output, or do a full transfer the first time"""
+        report = report or (lambda message, progress=None: None)
+        source_path = Path(source_path)
+        output_path = Path(output_path)
+        plan = MappingPlan(mappings, transforms, row_filter=row_filter)
+        schema = schema or DestinationSchema()
+        source_columns = plan.source_columns
+        output_columns = destination_df.columns.tolist()
+        
+        state = self.load_state(source_path, output_path)
+        if state is not None and (
+            state.get('mappings') != mappings
+            or state.get('transforms', {}) != plan.transforms
+            or state.get('row_filter') != plan.row_filter
+            or state.get('column_types', {}) != schema.column_types
+            or state.get('rules', {}) != schema.rules
+            or state.get('output_columns') != output_columns
+            or state.get('hash_index') != self.HASH_INDEX
+            or not output_path.exists()
+            or not OUTPUT_WRITERS[get_output_format(output_path)].appendable
+        ):
+            # Mapping or template changed, the output is gone or can't be appended to: start over
+            state = None
+        
+        if state is None:
+            return self.run_full(source_path, destination_df, plan, output_path, source_df, token, report, schema)
+        
+        # Data handed in by the caller may predate the file on disk, so only checkpoint what we read ourselves
+        checkpoint = self.take_csv_checkpoint(source_path) if source_df is None else None
+        
+        # Fast path: an append-only CSV is read from where the last run stopped
+        new_rows = None
+        read_mode = 'tail'
+        if checkpoint is not None:
+            report("Reading new rows...", 20)
+            with self.tracer.span("read_source_tail", file=source_path.name) as span:
+                new_rows = self.read_csv_tail(source_path, state.get('csv_checkpoint'), checkpoint, state['source_header'])
+                span['rows'] = None if new_rows is None else len(new_rows)
+        
+        if new_rows is not None:
+            new_hashes = hash_rows(new_rows, source_columns)
+            row_hashes = np.concatenate([state['row_hashes'], new_hashes])
+            total_rows = state['row_count'] + len(new_rows)
+        else:
+            # General path: compare row content hashes against the index of rows already transferred,
+            # counting repeats so a row identical to an earlier one is still new, as on the tail path
+            read_mode = 'hash'
+            if source_df is None:
+                report("Reading source file...", 20)
+                source_df = read_data_file(source_path, token)
+                checkpoint = self.confirm_checkpoint(source_path, checkpoint)
+            check_cancelled(token)
+            
+            with self.tracer.span("hash_source_rows", rows=len(source_df)):
+                hashes = hash_rows(source_df, source_columns)
+                is_new = get_unseen_rows(hashes, state['row_hashes'])
+            new_rows = source_df[is_new]
+            row_hashes = np.concatenate([state['row_hashes'], hashes[is_new]])
+            total_rows = len(source_df)
+        
+        check_cancelled(token)
+        # Every new row is recorded in the hash index above, but only matching ones are appended
+        new_rows = plan.filter_rows(new_rows)
+        report(f"Appending {len(new_rows)} new rows...", 70)
+        validator = ChunkValidator(schema, self.cast_policy)
+        if len(new_rows):
+            new_rows, copy_mappings = plan.apply(new_rows)
+            with self.tracer.span("validate_output", rows=len(new_rows)):
+                appended = validator.check(remap_frame(new_rows, copy_mappings, output_columns))
+                validator.raise_if_invalid()
+            with self.tracer.span("append_output", rows=len(new_rows), file=output_path.name):
+                append_output_rows(output_path, appended)
+        
+        state.update({
+            'row_count': total_rows,
+            'source_signature': get_file_signature(source_path),
+            'csv_checkpoint': checkpoint,
+            'updated_at': datetime.now().isoformat()
+        })
+        self.save_state(state, row_hashes)
+        
+        return {
+            'mode': 'append', 'read_mode': read_mode, 'rows_appended': len(new_rows), 'source_rows': total_rows,
+            'violations': validator.get_violations()
+        }
+    
+    @staticmethod
+    def confirm_checkpoint(source_path: Path, checkpoint: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Drop the checkpoint if the file grew while it was being read (the extra rows would be read twice)"""
+        if checkpoint is None or source_path.stat().st_size != checkpoint['byte_offset']:
+            return None
+        return checkpoint
+    
+    def run_full(self, source_path: Path, destination_df: pd.DataFrame, plan: MappingPlan, output_path: Path,
+                 source_df: Optional[pd.DataFrame], token: Optional[CancellationToken],
+                 report: Callable[..., None], schema: Optional[DestinationSchema] = None) -> Dict[str, Any]:
+        """Do a full transfer and record the state later runs continue from"""
+        checkpoint = None
+        if source_df is None:
+            report("Reading source file...", 20)
+            checkpoint = self.take_csv_checkpoint(source_path)
+            source_df = read_data_file(source_path, token)
+            checkpoint = self.confirm_checkpoint(source_path, checkpoint)
+        
+        transformed_df, copy_mappings = plan.apply(plan.filter_rows(source_df))
+        result_df = build_transfer_frame(transformed_df, destination_df, copy_mappings, token, report, self.tracer)
+        validator = ChunkValidator(schema or DestinationSchema(), self.cast_policy)
+        report("Validating output...", 75)
+        with self.tracer.span("validate_output", rows=len(result_df)):
+            result_df = validator.check(result_df)
+            validator.raise_if_invalid()
+        report("Saving file...", 80)
+        with self.tracer.span("save_output", rows=len(result_df), file=output_path.name):
+            write_output_file(result_df, output_path, token)
+        
+        source_columns = plan.source_columns
+        state = {
+            'source_path': str(source_path),
+            'output_path': str(output_path),
+            'mappings': plan.mappings,
+            'transforms': plan.transforms,
+            'row_filter': plan.row_filter,
+            'column_types': validator.schema.column_types,
+            'rules': validator.schema.rules,
+            'output_columns': destination_df.columns.tolist(),
+            'hash_index': self.HASH_INDEX,
+            'source_header': source_df.columns.tolist(),
+            'row_count': len(source_df),
+            'source_signature': get_file_signature(source_path),
+            'csv_checkpoint': checkpoint,
+            'updated_at': datetime.now().isoformat()
+        }
+        self.save_state(state, hash_rows(source_df, source_columns))
+        
+        return {
+            'mode': 'full', 'read_mode': 'full', 'rows_appended': len(result_df), 'source_rows': len(source_df),
+            'violations': validator.get_violations()
+        }
+
+def wait_for_future(future: Future, token: Optional[CancellationToken] = None, poll_seconds: float = 0.1) -> Any:
+    """Wait for a future in short slices so the wait stays cancellable"""
+    while True:
+        check_cancelled(token)
+        try:
+            return future.result(timeout=poll_seconds)
+        except FutureTimeoutError:
+            continue
+
+def merge_source_files(
+    source_files: List[str],
+    mappings: Dict[str, str],
+    destination_headers: List[str],
+    save_path: Path,
+    source_column: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    token: Optional[CancellationToken] = None,
+    report: Optional[Callable[..., None]] = None,
+    tracer: Optional[PerformanceTracer] = None,
+    transforms: Optional[Dict[str, str]] = None,
+    row_filter: Optional[str] = None,
+    schema: Optional[DestinationSchema] = None,
+    cast_policy: Optional[str] = None
+) -> Dict[str, Any]:
+    """Apply one mapping to many source files in parallel processes and stream them into one output; returns the
+    rows written and any validation violations"""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    
+    if not source_files:
+        raise ValueError("No source files to merge")
+    report = report or (lambda message, progress=None: None)
+    tracer = tracer or PerformanceTracer()
+    total = len(source_files)
+    max_workers = max_workers or Config.MERGE_MAX_WORKERS or min(total, os.cpu_count() or 1)
+    columns = list(destination_headers) + ([source_column] if source_column else [])
+    
+    # Spawned workers don't inherit the Tk process state
+    context = multiprocessing.get_context('spawn')
+    pending: List[Tuple[Path, Future]] = []
+    remaining = iter(source_files)
+    merged = 0
+    # One validator for the whole output, so row numbers and uniqueness span all files
+    # Nobody confirms a merge before it is written, so type mismatches fail it unless the caller says otherwise
+    cast_policy = cast_policy or Config.UNATTENDED_CAST_ERROR_POLICY
+    validator = ChunkValidator(schema, cast_policy) if schema is not None else None
+    
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        def submit_next():
+            file_path = next(remaining, None)
+            if file_path is not None:
+                future = executor.submit(
+                    remap_source_file, str(file_path), mappings, destination_headers, source_column, transforms,
+                    row_filter
+                )
+                pending.append((Path(file_path), future))
+        
+        try:
+            # Keep a bounded window of files in flight so finished results don't pile up in memory
+            for _ in range(max_workers * 2):
+                submit_next()
+            
+            with ChunkedOutputWriter(save_path, columns) as writer:
+                while pending:
+                    file_path, future = pending.pop(0)
+                    with tracer.span("merge_source_file", file=file_path.name) as span:
+                        try:
+                            chunk = wait_for_future(future, token)
+                        except OperationCancelled:
+                            raise
+                        except Exception as e:
+                            raise Exception(f"Error merging {file_path.name}: {str(e)}")
+                        
+                        check_cancelled(token)
+                        if validator is not None:
+                            chunk = validator.check(chunk)
+                            validator.raise_if_invalid()
+                        writer.write(chunk)
+                        span['rows'] = len(chunk)
+                    
+                    merged += 1
+                    report(f"Merged {merged}/{total} files ({writer.rows_written} rows)...", 10 + 85 * merged / total)
+                    submit_next()
+                
+                check_cancelled(token)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    
+    return {'rows': writer.rows_written, 'violations': validator.get_violations() if validator is not None else []}
+
+def get_file_signature(file_path: Path) -> Optional[Tuple[int, int]]:
+    """Get a (size, mtime) signature used to tell whether a file changed"""
+    try:
+        # Members of a zip archive change with the archive
+        stat = split_archive_path(file_path)[0].stat()
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+class FilePrefetcher:
+    """Parses files in the background as soon as they are chosen so loading can reuse the result"""
+    
+    def __init__(self, reader: Callable[[Path, CancellationToken], Any]):
+        self.reader = reader
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def prefetch(self, role: str, file_path: str) -> Optional[Future]:
+        """Start parsing a file for a role ('source' or 'destination'), replacing any stale prefetch"""
+        self.cancel(role)
+        
+        path = Path(file_path)
+        signature = get_file_signature(path)
+        # Zip members are prefetched when their archive is a file
+        if signature is None or not split_archive_path(path)[0].is_file():
+            return None
+        
+        token = CancellationToken()
+        future: Future = Future()
+        
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self.reader(path, token))
+            except BaseException as e:
+                future.set_exception(e)
+        
+        with self._lock:
+            self._entries[role] = {'path': path, 'signature': signature, 'future': future, 'token': token}
+        
+        # Daemon thread so an abandoned prefetch never holds up application exit
+        threading.Thread(target=run, name=f"prefetch-{role}", daemon=True).start()
+        return future
+    
+    def take(self, role: str, file_path: str) -> Optional[Tuple[Future, CancellationToken]]:
+        """Hand over the prefetch for a role if it matches the file as it is now"""
+        with self._lock:
+            entry = self._entries.pop(role, None)
+        if entry is None:
+            return None
+        
+        if entry['path'] != Path(file_path) or entry['signature'] != get_file_signature(Path(file_path)):
+            # Stale: a different file was chosen or the file changed on disk
+            entry['token'].cancel()
+            entry['future'].cancel()
+            return None
+        
+        return entry['future'], entry['token']
+    
+    def cancel(self, role: str):
+        """Cancel the prefetch for a role, if any"""
+        with self._lock:
+            entry = self._entries.pop(role, None)
+        if entry is not None:
+            entry['token'].cancel()
+            entry['future'].cancel()
+    
+    def shutdown(self):
+        """Cancel all outstanding prefetches"""
+        for role in list(self._entries):
+            self.cancel(role)
+
+WATCH_FILE_SUFFIXES = INPUT_FILE_SUFFIXES
+
+def process_source_file(source_path: str, mappings: Dict[str, str], destination_df: pd.DataFrame,
+                        output_path: str, transforms: Optional[Dict[str, str]] = None,
+                        row_filter: Optional[str] = None, schema: Optional[DestinationSchema] = None,
+                        cast_policy: Optional[str] = None) -> Tuple[int, List[Dict[str, Any]]]:
+    """Transfer one source file into the destination layout and write the output, one chunk at a time so large
+    (or compressed) drops are processed in a single pass with bounded memory (watch worker process)"""
+    plan = MappingPlan(mappings, transforms, row_filter=row_filter)
+    validator = ChunkValidator(schema or DestinationSchema(), cast_policy)
+    destination_df = destination_df.reset_index(drop=True)
+    
+    with ChunkedOutputWriter(Path(output_path), destination_df.columns.tolist()) as writer:
+        for chunk in iter_file_chunks(Path(source_path)):
+            chunk, chunk_mappings = plan.apply(plan.filter_rows(chunk))
+            if not len(chunk):
+                continue
+            # Source rows overwrite the template's rows by position, as in a whole-file transfer
+            template = destination_df.iloc[writer.rows_written:writer.rows_written + len(chunk)]
+            result_chunk = validator.check(build_transfer_frame(chunk, template, chunk_mappings))
+            validator.raise_if_invalid()
+            writer.write(result_chunk)
+        
+        if writer.rows_written < len(destination_df):
+            writer.write(validator.check(destination_df.iloc[writer.rows_written:]))
+            validator.raise_if_invalid()
+    return writer.rows_written, validator.get_violations()
+
+class FolderWatcher:
+    """Polls a folder for new source files and hands each over once it has stopped changing"""
+    
+    def __init__(self, directory: Path, settle_seconds: float = Config.WATCH_SETTLE_SECONDS,
+                 suffixes: Tuple[str, ...] = WATCH_FILE_SUFFIXES):
+        self.directory = Path(directory)
+        self.settle_seconds = settle_seconds
+        self.suffixes = suffixes
+        # path -> (size/mtime signature, time the signature was first seen)
+        self._candidates: Dict[Path, Tuple[Tuple[int, int], float]] = {}
+        self._claimed: set = set()
+    
+    def is_watchable(self, name: str) -> bool:
+        """Whether a file name looks like a finished source file (not a temp or lock file)"""
+        if name.startswith(('.', '~$')):
+            return False
+        return name.lower().endswith(self.suffixes)
+    
+    def poll(self, limit: Optional[int] = None, now: Optional[float] = None) -> List[Path]:
+        """Scan the folder once and claim up to `limit` files that have settled"""
+        now = time.monotonic() if now is None else now
+        ready: List[Path] = []
+        seen = set()
+        
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not self.is_watchable(entry.name):
+                    continue
+                
+                path = Path(entry.path)
+                seen.add(path)
+                if path in self._claimed:
+                    continue
+                
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                previous = self._candidates.get(path)
+                
+                # Any change restarts the settle timer (the file is still being written)
+                if previous is None or previous[0] != signature:
+                    self._candidates[path] = (signature, now)
+                    continue
+                
+                settled = now - previous[1] >= self.settle_seconds and signature[0] > 0
+                if settled and (limit is None or len(ready) < limit):
+                    ready.append(path)
+                    self._claimed.add(path)
+                    del self._candidates[path]
+        
+        # Forget files that were moved away or deleted
+        self._candidates = {path: value for path, value in self._candidates.items() if path in seen}
+        self._claimed &= seen
+        return sorted(ready)
+
+class WatchFolderDaemon:
+    """Transforms files landing in the source folder with a saved mapping, unattended"""
+    
+    def __init__(
+        self,
+        mappings: Dict[str, str],
+        template_path: Path,
+        watch_dir: Path = Config.SOURCE_FILES_DIR,
+        output_dir: Path = Config.OUTPUT_DIR,
+        output_format: str = "xlsx",
+        max_workers: int = Config.WATCH_MAX_WORKERS,
+        settle_seconds: float = Config.WATCH_SETTLE_SECONDS,
+        transforms: Optional[Dict[str, str]] = None,
+        row_filter: Optional[str] = None
+    ):
+        self.mappings = mappings
+        plan = MappingPlan(mappings, transforms, row_filter=row_filter)
+        self.transforms = plan.transforms
+        self.row_filter = plan.row_filter
+        self.template_path = Path(template_path)
+        self.destination_df = read_data_file(self.template_path)
+        self.schema = DestinationSchema.from_template(self.destination_df, self.template_path)
+        self.watch_dir = Path(watch_dir)
+        self.output_dir = Path(output_dir)
+        self.output_format = output_format.lstrip('.')
+        self.max_workers = max_workers
+        self.processed_dir = self.watch_dir / "processed"
+        self.failed_dir = self.watch_dir / "failed"
+        self.watcher = FolderWatcher(self.watch_dir, settle_seconds)
+        self.stats_manager = StatisticsManager()
+        self.in_flight: Dict[Future, Tuple[Path, Path, float]] = {}
+        
+        for directory in [self.watch_dir, self.output_dir, self.processed_dir, self.failed_dir]:
+            directory.mkdir(parents=True, exist_ok=True)
+    
+    def run(self, poll_seconds: float = Config.WATCH_POLL_SECONDS, stop_event: Optional[threading.Event] = None):
+        """Watch the folder until interrupted"""
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        
+        stop_event = stop_event or threading.Event()
+        self.log(f"Watching {self.watch_dir} with {len(self.mappings)} mappings (Ctrl+C to stop)")
+        
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            while not stop_event.is_set():
+                self.run_once(executor)
+                stop_event.wait(poll_seconds)
+        except KeyboardInterrupt:
+            self.log("Stopping...")
+        finally:
+            # Let files that are already being transformed finish and be recorded
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.collect_finished()
+    
+    def run_once(self, executor):
+        """Record finished files and start work on newly settled ones"""
+        self.collect_finished()
+        
+        # Bounded queue: only claim files there is worker capacity for
+        capacity = self.max_workers * 2 - len(self.in_flight)
+        if capacity <= 0:
+            return
+        
+        for source_path in self.watcher.poll(limit=capacity):
+            output_path = self.get_output_path(source_path)
+            future = executor.submit(
+                process_source_file, str(source_path), self.mappings, self.destination_df, str(output_path),
+                self.transforms, self.row_filter, self.schema, Config.UNATTENDED_CAST_ERROR_POLICY
+            )
+            self.in_flight[future] = (source_path, output_path, time.perf_counter())
+            self.log(f"Processing {source_path.name}")
+    
+    def collect_finished(self):
+        """Write history for finished files and move them out of the watched folder"""
+        for future in [future for future in self.in_flight if future.done()]:
+            source_path, output_path, started = self.in_flight.pop(future)
+            try:
+                rows, violations = future.result()
+            except Exception as e:
+                self.log(f"Failed {source_path.name}: {e}")
+                self.move_source_file(source_path, self.failed_dir)
+                continue
+            
+            try:
+                append_mapping_history(
+                    self.mappings, source_path.name, get_input_name(self.template_path), output_path.name, self.transforms,
+                    self.row_filter
+                )
+            except Exception as e:
+                self.log(f"Warning: Could not save mapping history: {e}")
+            self.stats_manager.update_file_processed(len(self.mappings))
+            self.move_source_file(source_path, self.processed_dir)
+            for line in describe_violations(violations):
+                self.log(f"Warning: {source_path.name}: {line}")
+            
+            elapsed = time.perf_counter() - started
+            self.log(f"Done {source_path.name} → {output_path.name} ({rows} rows, {elapsed:.1f}s)")
+    
+    def get_output_path(self, source_path: Path) -> Path:
+        """Get an output path for a source file that is neither on disk nor reserved by a file still in flight"""
+        stem = get_input_stem(source_path)
+        # In-flight outputs are still .partial files, so they can't be seen on disk yet
+        reserved = {output_path for _, output_path, _ in self.in_flight.values()}
+        output_path = self.output_dir / f"{stem}_mapped.{self.output_format}"
+        counter = 1
+        while output_path in reserved or output_path.exists():
+            counter += 1
+            output_path = self.output_dir / f"{stem}_mapped_{counter}.{self.output_format}"
+        return output_path
+    
+    @staticmethod
+    def move_source_file(source_path: Path, target_dir: Path):
+        """Move a handled source file aside so it isn't picked up again"""
+        target_path = target_dir / source_path.name
+        if target_path.exists():
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            stem = get_input_stem(source_path)
+            target_path = target_dir / f"{stem}_{timestamp}{source_path.name[len(stem):]}"
+        try:
+            shutil.move(str(source_path), str(target_path))
+        except OSError as e:
+            print(f"Warning: Could not move {source_path.name}: {e}")
+    
+    @staticmethod
+    def log(message: str):
+        """Print a timestamped daemon message"""
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+def read_input_file(file_path: Path, token: Optional[CancellationToken] = None) -> pd.DataFrame:
+    """Read Excel or CSV data (in cancellable chunks when a token is given)"""
+    file_path = Path(file_path)
+    
+    try:
+        if token is None and is_plain_file(file_path):
+            if file_path.suffix.lower() == '.csv':
+                return pd.read_csv(file_path, encoding='utf-8')
+            else:
+                return pd.read_excel(file_path)
+        
+        return read_data_file(file_path, token)
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        raise Exception(f"Error reading file {file_path.name}: {str(e)}")
+
+def prepare_mapped_data(
+    source_df: pd.DataFrame,
+    destination_df: pd.DataFrame,
+    plan: MappingPlan,
+    key_column: Optional[str] = None,
+    schema: Optional[DestinationSchema] = None,
+    token: Optional[CancellationToken] = None,
+    report: Optional[Callable[..., None]] = None,
+    tracer: Optional[PerformanceTracer] = None
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Build the output rows and validate them against the destination schema, without writing"""
+    report = report or (lambda message, progress=None: None)
+    tracer = tracer or PerformanceTracer()
+    summary = {}
+    
+    mappings = plan.mappings
+    if plan.row_filter:
+        report("Filtering rows...", 10)
+        with tracer.span("filter_rows", rows=len(source_df)):
+            source_df = plan.filter_rows(source_df)
+    if plan.needs_apply:
+        report("Computing columns...", 15)
+        with tracer.span("apply_transforms", rows=len(source_df),
+                         columns=len(set(plan.steps) | set(plan.expressions))):
+            source_df, mappings = plan.apply(source_df)
+    
+    if key_column:
+        result_df, summary = upsert_transfer_frame(
+            source_df, destination_df, mappings, key_column, token, report, tracer
+        )
+    else:
+        result_df = build_transfer_frame(source_df, destination_df, mappings, token, report, tracer)
+    
+    validator = ChunkValidator(schema or DestinationSchema())
+    report("Validating output...", 75)
+    with tracer.span("validate_output", rows=len(result_df)):
+        result_df = validator.check(result_df)
+        validator.raise_if_invalid()
+    summary['violations'] = validator.get_violations()
+    
+    return result_df, summary
+
+def preview_mapped_rows(
+    source_df: pd.DataFrame,
+    destination_headers: List[str],
+    plan: MappingPlan,
+    start: int,
+    count: int,
+    schema: Optional[DestinationSchema] = None
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Compute the output values of source rows start to start + count only, indexed by source row number (1-based)"""
+    window = source_df.iloc[start:start + count]
+    kept = plan.get_row_mask(window)
+    window = window[kept]
+    
+    # Unmapped destination columns keep the template's values, which the preview leaves empty
+    columns = {}
+    for dest_col in destination_headers:
+        values = plan.column(window, dest_col) if dest_col in plan.mappings else None
+        columns[dest_col] = values.to_numpy() if values is not None else np.full(len(window), None, dtype=object)
+    rows = pd.DataFrame(columns, index=pd.Index(np.flatnonzero(kept) + start + 1, name="Row"))
+    
+    rows, problems = (schema or DestinationSchema()).align(rows, policy="blank")
+    summary = {
+        'first': start + 1,
+        'last': start + len(kept),
+        'total': len(source_df),
+        'kept': int(kept.sum()),
+        'cast_problems': sum(problem['count'] for problem in problems.values())
+    }
+    return rows, summary
+
+def save_mapped_data(
+    result_df: pd.DataFrame,
+    output_path: Path,
+    token: Optional[CancellationToken] = None,
+    report: Optional[Callable[..., None]] = None,
+    tracer: Optional[PerformanceTracer] = None
+):
+    """Write prepared output rows to an Excel or CSV file"""
+    report = report or (lambda message, progress=None: None)
+    tracer = tracer or PerformanceTracer()
+    report("Saving file...", 80)
+    with tracer.span("save_output", rows=len(result_df), file=Path(output_path).name):
+        write_output_file(result_df, Path(output_path), token)
+
+class MappingSession:
+    """Source and destination files with the column mappings between them: load, map, transfer and save history"""
+    
+    def __init__(self, tracer: Optional[PerformanceTracer] = None):
+        self.tracer = tracer or PerformanceTracer()
+        self.source_path: Optional[Path] = None
+        self.destination_path: Optional[Path] = None
+        self.source_df: Optional[pd.DataFrame] = None
+        self.destination_df: Optional[pd.DataFrame] = None
+        self.source_headers: List[str] = []
+        self.destination_headers: List[str] = []
+        self.column_mappings: Dict[str, str] = {}
+        self.mapping_transforms: Dict[str, str] = {}
+        self.row_filter: Optional[str] = None
+    
+    def load(self, source_path: Path, destination_path: Path,
+             token: Optional[CancellationToken] = None) -> 'MappingSession':
+        """Read the source and destination files"""
+        with self.tracer.span("read_source_file", file=Path(source_path).name) as span:
+            source_df = read_input_file(source_path, token)
+            span['rows'] = len(source_df)
+        with self.tracer.span("read_destination_file", file=Path(destination_path).name) as span:
+            destination_df = read_input_file(destination_path, token)
+            span['rows'] = len(destination_df)
+        self.set_files(source_path, source_df, destination_path, destination_df)
+        return self
+    
+    def set_files(self, source_path: Path, source_df: pd.DataFrame,
+                  destination_path: Path, destination_df: pd.DataFrame):
+        """Use already read source and destination data, dropping mappings made for other files"""
+        self.source_path = Path(source_path)
+        self.destination_path = Path(destination_path)
+        self.source_df = source_df
+        self.destination_df = destination_df
+        self.source_headers = source_df.columns.tolist()
+        self.destination_headers = destination_df.columns.tolist()
+        self.clear()
+    
+    def map(self, destination_column: str, source: str, transforms: Optional[str] = None):
+        """Fill a destination column from a source column or expression, optionally through a transform chain"""
+        if destination_column not in self.destination_headers:
+            raise ValueError(f"'{destination_column}' is not a destination column")
+        if not is_expression(source) and source not in self.source_headers:
+            raise ValueError(f"'{source}' is not a source column")
+        # Compiling checks the expression's columns and the transform chain
+        MappingPlan({destination_column: source}, {destination_column: transforms} if transforms else None,
+                    source_headers=self.source_headers)
+        self.column_mappings[destination_column] = source
+        if transforms:
+            self.mapping_transforms[destination_column] = transforms
+        else:
+            self.mapping_transforms.pop(destination_column, None)
+    
+    def unmap(self, destination_column: str):
+        """Stop filling a destination column"""
+        self.column_mappings.pop(destination_column, None)
+        self.mapping_transforms.pop(destination_column, None)
+    
+    def clear(self):
+        """Remove all mappings and the row filter"""
+        self.column_mappings.clear()
+        self.mapping_transforms.clear()
+        self.row_filter = None
+    
+    def get_plan(self) -> MappingPlan:
+        """Compile the mappings with their transform chains and row filter (raises ValueError if invalid)"""
+        return MappingPlan(dict(self.column_mappings), dict(self.mapping_transforms),
+                           source_headers=self.source_headers, row_filter=self.row_filter)
+    
+    def get_schema(self) -> DestinationSchema:
+        """Get the destination column types from the template's data and schema file (raises ValueError if invalid)"""
+        return DestinationSchema.from_template(self.destination_df, self.destination_path)
+    
+    def prepare(self, key_column: Optional[str] = None, token: Optional[CancellationToken] = None,
+                report: Optional[Callable[..., None]] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Build and validate the output rows without writing them"""
+        if not self.column_mappings:
+            raise ValueError("No column mappings configured")
+        return prepare_mapped_data(self.source_df, self.destination_df, self.get_plan(), key_column,
+                                   self.get_schema(), token, report, self.tracer)
+    
+    def preview(self, start: int = 0, count: int = 50) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Compute the output values of a window of source rows without building the whole output"""
+        return preview_mapped_rows(self.source_df, self.destination_headers, self.get_plan(), start, count,
+                                   self.get_schema())
+    
+    def transfer(self, output_path: Path, key_column: Optional[str] = None, token: Optional[CancellationToken] = None,
+                 report: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+        """Copy the mapped data into the destination layout and write it to output_path"""
+        result_df, summary = self.prepare(key_column, token, report)
+        save_mapped_data(result_df, output_path, token, report, self.tracer)
+        return summary
+    
+    def save_history(self, output_path: Path, source_file_name: Optional[str] = None):
+        """Record the current mappings in the mapping history"""
+        with self.tracer.span("write_history", rows=len(self.column_mappings)):
+            append_mapping_history(
+                self.column_mappings,
+                source_file_name or get_input_name(self.source_path),
+                get_input_name(self.destination_path),
+                Path(output_path).name,
+                self.mapping_transforms,
+                self.row_filter
+            )
@@ -7,50 +7,53 @@ License: MIT
 Version: 2.0.0
 """
 
+from __future__ import annotations
+
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import pandas as pd
+from tkinter import ttk, filedialog, messagebox, simpledialog
+import argparse
 import os
 import sys
-from datetime import datetime
+import queue
+import threading
+import zipfile
 from pathlib import Path
-import json
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 # Add the project root to the path for imports
-PROJECT_ROOT = Path(__file__).parent.parent
-sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Everything that doesn't need a window lives in the engine, which never imports tkinter
+from app.engine import (
+    Config, PerformanceTracer, StatisticsManager, CancellationToken, OperationCancelled,
+    pd, MappingPlan, MappingSession, DestinationSchema, ProfileStore, FilePrefetcher,
+    IncrementalTransfer, WatchFolderDaemon, HistoryIndex, HeaderIndex, HeaderMatcher, HistoryCompactor,
+    read_data_file, read_input_file, iter_file_chunks, prepare_mapped_data, preview_mapped_rows, save_mapped_data,
+    merge_source_files, wait_for_future, compile_transform_chain, is_expression, get_referenced_columns,
+    describe_violations, append_mapping_history, load_history_session, load_mapping_spec,
+    get_history_transforms, get_history_row_filter, get_header_signature,
+    compact_history_if_due, describe_compaction, OUTPUT_WRITERS,
+    ARCHIVE_MEMBER_SEPARATOR, list_archive_members, expand_archive_paths, get_input_name, get_input_stem
+)
 
-class Config:
-    """Configuration settings for the application"""
-    
-    # Application settings
-    APP_NAME = "Excel Column Mapper"
-    APP_VERSION = "1.0"
-    WINDOW_TITLE = f"{APP_NAME} v{APP_VERSION}"
-    WINDOW_SIZE = "1240x600"
-    WINDOW_MIN_SIZE = (1000, 600)
-    
-    # Directories
-    ASSETS_DIR = PROJECT_ROOT / "assets"
-    LOG_DIR = PROJECT_ROOT / "log"
-    SOURCE_FILES_DIR = PROJECT_ROOT / "data" / "source_files"
-    THEMES_DIR = PROJECT_ROOT / "themes"
-    
-    # Files
-    HISTORY_FILE = LOG_DIR / "mapping_history.csv"
-    CONFIG_FILE = PROJECT_ROOT / "config.json"
-    LOGO_FILE = ASSETS_DIR / "logo.png"
-    FAVICON_FILE = ASSETS_DIR / "favicon.ico"
-    
-    # Theme settings
-    THEME_NAME = "azure"  # Using Azure theme - a popular open-source theme
-    
-    @classmethod
-    def ensure_directories(cls):
-        """Ensure all required directories exist"""
-        for directory in [cls.ASSETS_DIR, cls.LOG_DIR, cls.SOURCE_FILES_DIR, cls.THEMES_DIR]:
-            directory.mkdir(exist_ok=True)
+# Open dialog choices: data files as they are, gzip-compressed or bundled in zip archives
+INPUT_FILETYPES = [
+    ("Data files", "*.xlsx *.xlsm *.xls *.csv *.csv.gz *.zip"),
+    ("Excel files", "*.xlsx *.xls"),
+    ("CSV files", "*.csv *.csv.gz"),
+    ("Zip archives", "*.zip"),
+    ("All files", "*.*")
+]
+
+# Save dialog choices, one per registered output writer
+OUTPUT_FILETYPES = [
+    ("Excel files", "*.xlsx"),
+    ("CSV files", "*.csv"),
+    ("Compressed CSV files", "*.csv.gz"),
+    ("Parquet files", "*.parquet"),
+    ("Feather files", "*.feather"),
+    ("All files", "*.*")
+]
 
 class ThemeManager:
     """Manages application themes and styling"""
@@ -60,6 +63,13 @@ class ThemeManager:
         self.style = ttk.Style()
         self.current_theme = "light"  # Track current theme
         
+        # Style tables are computed once per theme mode
+        self._style_tables: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = {}
+        # ttk keeps styles per ttk theme, so track what has been applied to each of them
+        self._applied_styles: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = {}
+        # Plain tk widgets that don't follow ttk styles, with their color role
+        self._themed_widgets: List[Tuple[tk.Widget, str]] = []
+        
     def setup_azure_theme(self, theme_mode="light"):
         """Setup the Azure theme - a modern open-source theme"""
         azure_tcl_path = Config.THEMES_DIR / "azure.tcl"
@@ -103,7 +113,7 @@ class ThemeManager:
                 self.root.tk.call("set_theme", "light")
                 self.current_theme = "light"
             
-            # Reapply custom styles
+            # Apply only the custom styles that differ from what this ttk theme already has
             self.apply_custom_styles()
             
             # Update any text widgets that need theme-specific colors
@@ -116,10 +126,45 @@ class ThemeManager:
             # Fallback to custom theme switching
             self.setup_custom_azure_theme()
     
-    def apply_custom_styles(self):
-        """Apply additional custom styles for specific widgets"""
+    def apply_custom_styles(self) -> int:
+        """Apply additional custom styles for specific widgets, returning the number of options changed"""
+        table = self.get_style_table(self.current_theme)
+        applied = self._applied_styles.setdefault(self.style.theme_use(), {})
+        changed = 0
+        
+        for style_name, spec in table.items():
+            applied_spec = applied.setdefault(style_name, {'configure': {}, 'map': {}})
+            
+            configure_diff = {
+                option: value for option, value in spec['configure'].items()
+                if applied_spec['configure'].get(option) != value
+            }
+            if configure_diff:
+                self.style.configure(style_name, **configure_diff)
+                applied_spec['configure'].update(configure_diff)
+            
+            map_diff = {
+                option: value for option, value in spec['map'].items()
+                if applied_spec['map'].get(option) != value
+            }
+            if map_diff:
+                self.style.map(style_name, **map_diff)
+                applied_spec['map'].update(map_diff)
+            
+            changed += len(configure_diff) + len(map_diff)
+        
+        return changed
+    
+    def get_style_table(self, mode: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Get the custom style table for a theme mode, computing it on first use"""
+        if mode not in self._style_tables:
+            self._style_tables[mode] = self.build_style_table(mode)
+        return self._style_tables[mode]
+    
+    def build_style_table(self, mode: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Build the custom style table ({style: {'configure': ..., 'map': ...}}) for a theme mode"""
         # Custom button styles that work with both light and dark themes
-        if self.current_theme == "dark":
+        if mode == "dark":
             colors = {
                 'primary': '#0078d4',
                 'primary_hover': '#106ebe',
@@ -142,17 +187,24 @@ class ThemeManager:
                 'light_bg': '#f5f5f5'
             }
         
-        # Configure custom button styles
-        self.configure_custom_button_styles(colors)
-        self.configure_custom_frame_styles(colors)
-        self.configure_custom_label_styles(colors)
-        self.configure_custom_entry_styles(colors)
-        self.configure_custom_treeview_styles(colors)
-        self.configure_custom_notebook_styles(colors)
-    
-    def get_theme_colors(self):
-        """Get current theme colors for use by other components"""
-        if self.current_theme == "dark":
+        table: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.build_button_styles(table, colors, mode)
+        self.build_frame_styles(table, colors, mode)
+        self.build_label_styles(table, colors, mode)
+        self.build_entry_styles(table, colors, mode)
+        self.build_treeview_styles(table, colors, mode)
+        self.build_notebook_styles(table, colors, mode)
+        return table
+    
+    @staticmethod
+    def add_style(table: Dict[str, Dict[str, Dict[str, Any]]], style_name: str,
+                  configure: Optional[Dict[str, Any]] = None, map: Optional[Dict[str, Any]] = None):
+        """Add a style entry to a style table"""
+        table[style_name] = {'configure': configure or {}, 'map': map or {}}
+    
+    def get_theme_colors(self, mode: Optional[str] = None):
+        """Get theme colors for use by other components (current theme by default)"""
+        if (mode or self.current_theme) == "dark":
             return {
                 'bg': '#2b2b2b',
                 'fg': '#ffffff',
@@ -170,185 +222,171 @@ class ThemeManager:
                 'field_bg': '#ffffff',
                 'border': '#d1d1d1'
             }
+    
+    def get_widget_theme_options(self, role: str) -> Dict[str, str]:
+        """Get the color options for a plain tk widget role ('text' or 'canvas')"""
+        colors = self.get_theme_colors()
+        if role == 'text':
+            return {
+                'bg': colors['field_bg'],
+                'fg': colors['fg'],
+                'insertbackground': colors['fg'],
+                'selectbackground': colors['select_bg'],
+                'selectforeground': colors['select_fg']
+            }
+        return {'bg': colors['bg']}
+    
+    def register_themed_widget(self, widget: tk.Widget, role: str = 'text'):
+        """Register a plain tk widget so theme switches recolor it, and color it now"""
+        self._themed_widgets.append((widget, role))
+        try:
+            widget.config(**self.get_widget_theme_options(role))
+        except tk.TclError as e:
+            print(f"Error applying theme colors to widget: {e}")
 
     def update_text_widget_colors(self):
-        """Update text widget colors based on current theme"""
-        try:
-            # This method can be called from the main app to update text widgets
-            # We'll implement this in the main app class
-            pass
-        except Exception as e:
-            print(f"Error updating text widget colors: {e}")
+        """Update registered text widget colors based on current theme"""
+        options_by_role: Dict[str, Dict[str, str]] = {}
+        alive = []
+        
+        for widget, role in self._themed_widgets:
+            try:
+                if not widget.winfo_exists():
+                    continue
+                if role not in options_by_role:
+                    options_by_role[role] = self.get_widget_theme_options(role)
+                widget.config(**options_by_role[role])
+                alive.append((widget, role))
+            except tk.TclError:
+                # Widget was destroyed along with its dialog
+                continue
+            except Exception as e:
+                print(f"Error updating text widget colors: {e}")
+                alive.append((widget, role))
+        
+        self._themed_widgets = alive
 
-    def configure_custom_button_styles(self, colors: Dict[str, str]):
-        """Configure custom button styles"""
-        # Primary button
-        self.style.configure(
-            'Primary.TButton',
-            background=colors['primary'],
-            foreground=colors['white'],
-            borderwidth=0,
-            focuscolor='none',
-            font=('Segoe UI', 10),
-            padding=(8, 4, 8, 4)
-        )
-        self.style.map(
-            'Primary.TButton',
-            background=[('active', colors['primary_hover']), ('pressed', colors['primary_hover'])],
-            relief=[('pressed', 'flat'), ('!pressed', 'flat')]
-        )
-        
-        # Success button
-        self.style.configure(
-            'Success.TButton',
-            background=colors['success'],
-            foreground=colors['white'],
-            borderwidth=0,
-            focuscolor='none',
-            font=('Segoe UI', 10),
-            padding=(8, 4, 8, 4)
-        )
-        self.style.map(
-            'Success.TButton',
-            background=[('active', '#0e6b0e'), ('pressed', '#0e6b0e')],
-            relief=[('pressed', 'flat'), ('!pressed', 'flat')]
-        )
-        
-        # Danger button
-        self.style.configure(
-            'Danger.TButton',
-            background=colors['danger'],
-            foreground=colors['white'],
-            borderwidth=0,
-            focuscolor='none',
-            font=('Segoe UI', 10),
-            padding=(8, 4, 8, 4)
-        )
-        self.style.map(
-            'Danger.TButton',
-            background=[('active', '#b02a2e'), ('pressed', '#b02a2e')],
-            relief=[('pressed', 'flat'), ('!pressed', 'flat')]
-        )
-        
-        # Secondary button
-        self.style.configure(
-            'Secondary.TButton',
-            background=colors['secondary'],
-            foreground=colors['white'],
-            borderwidth=0,
-            focuscolor='none',
-            font=('Segoe UI', 10),
-            padding=(8, 4, 8, 4)
-        )
-        self.style.map(
-            'Secondary.TButton',
-            background=[('active', '#5a6268'), ('pressed', '#5a6268')],
-            relief=[('pressed', 'flat'), ('!pressed', 'flat')]
-        )
-    
-    def configure_custom_frame_styles(self, colors: Dict[str, str]):
-        """Configure custom frame styles"""
-        self.style.configure(
-            'Card.TFrame',
-            background=colors['dark_bg'],
-            relief='flat',
-            borderwidth=1
-        )
-        
-        self.style.configure(
-            'Sidebar.TFrame',
-            background=colors['light_bg'],
-            relief='flat',
-            borderwidth=0
-        )
+    def build_button_styles(self, table: Dict[str, Dict[str, Dict[str, Any]]], colors: Dict[str, str], mode: str):
+        """Build custom button styles"""
+        button_variants = [
+            ('Primary.TButton', colors['primary'], colors['primary_hover']),
+            ('Success.TButton', colors['success'], '#0e6b0e'),
+            ('Danger.TButton', colors['danger'], '#b02a2e'),
+            ('Secondary.TButton', colors['secondary'], '#5a6268'),
+        ]
+        
+        for style_name, background, hover in button_variants:
+            self.add_style(
+                table,
+                style_name,
+                configure={
+                    'background': background,
+                    'foreground': colors['white'],
+                    'borderwidth': 0,
+                    'focuscolor': 'none',
+                    'font': ('Segoe UI', 10),
+                    'padding': (8, 4, 8, 4)
+                },
+                map={
+                    'background': [('active', hover), ('pressed', hover)],
+                    'relief': [('pressed', 'flat'), ('!pressed', 'flat')]
+                }
+            )
     
-    def configure_custom_label_styles(self, colors: Dict[str, str]):
-        """Configure custom label styles"""
+    def build_frame_styles(self, table: Dict[str, Dict[str, Dict[str, Any]]], colors: Dict[str, str], mode: str):
+        """Build custom frame styles"""
+        self.add_style(table, 'Card.TFrame', configure={
+            'background': colors['dark_bg'],
+            'relief': 'flat',
+            'borderwidth': 1
+        })
+        
+        self.add_style(table, 'Sidebar.TFrame', configure={
+            'background': colors['light_bg'],
+            'relief': 'flat',
+            'borderwidth': 0
+        })
+    
+    def build_label_styles(self, table: Dict[str, Dict[str, Dict[str, Any]]], colors: Dict[str, str], mode: str):
+        """Build custom label styles"""
         label_bg = colors['dark_bg']
-        label_fg = colors['white'] if self.current_theme == "dark" else '#000000'
-        
-        self.style.configure(
-            'Heading.TLabel',
-            background=label_bg,
-            foreground=label_fg,
-            font=('Segoe UI', 16, 'bold')
-        )
-        
-        self.style.configure(
-            'Subheading.TLabel',
-            background=label_bg,
-            foreground=label_fg,
-            font=('Segoe UI', 12, 'bold')
-        )
-        
-        self.style.configure(
-            'Body.TLabel',
-            background=label_bg,
-            foreground=label_fg,
-            font=('Segoe UI', 10)
-        )
-        
-        self.style.configure(
-            'Caption.TLabel',
-            background=label_bg,
-            foreground='#737373',
-            font=('Segoe UI', 9)
-        )
-    
-    def configure_custom_entry_styles(self, colors: Dict[str, str]):
-        """Configure custom entry styles"""
-        self.style.configure(
-            'Modern.TEntry',
-            fieldbackground=colors['dark_bg'] if self.current_theme == "light" else '#3c3c3c',
-            borderwidth=1,
-            relief='solid',
-            insertcolor='#000000' if self.current_theme == "light" else '#ffffff'
-        )
-    
-    def configure_custom_treeview_styles(self, colors: Dict[str, str]):
-        """Configure custom treeview styles"""
-        bg_color = colors['dark_bg'] if self.current_theme == "light" else '#3c3c3c'
-        fg_color = '#000000' if self.current_theme == "light" else '#ffffff'
-        
-        self.style.configure(
-            'Modern.Treeview',
-            background=bg_color,
-            foreground=fg_color,
-            fieldbackground=bg_color,
-            borderwidth=1,
-            relief='solid'
-        )
-        
-        self.style.configure(
-            'Modern.Treeview.Heading',
-            background=colors['primary'],
-            foreground=colors['white'],
-            font=('Segoe UI', 10, 'bold'),
-            relief='flat'
-        )
-    
-    def configure_custom_notebook_styles(self, colors: Dict[str, str]):
-        """Configure custom notebook styles"""
-        self.style.configure(
-            'Modern.TNotebook',
-            background=colors['light_bg'],
-            borderwidth=0
-        )
-        
-        tab_fg = '#000000' if self.current_theme == "light" else '#ffffff'
-        
-        self.style.configure(
-            'Modern.TNotebook.Tab',
-            background=colors['light_bg'],
-            foreground=tab_fg,
-            padding=[20, 10],
-            font=('Segoe UI', 10)
-        )
-        
-        self.style.map(
+        label_fg = colors['white'] if mode == "dark" else '#000000'
+        
+        self.add_style(table, 'Heading.TLabel', configure={
+            'background': label_bg,
+            'foreground': label_fg,
+            'font': ('Segoe UI', 16, 'bold')
+        })
+        
+        self.add_style(table, 'Subheading.TLabel', configure={
+            'background': label_bg,
+            'foreground': label_fg,
+            'font': ('Segoe UI', 12, 'bold')
+        })
+        
+        self.add_style(table, 'Body.TLabel', configure={
+            'background': label_bg,
+            'foreground': label_fg,
+            'font': ('Segoe UI', 10)
+        })
+        
+        self.add_style(table, 'Caption.TLabel', configure={
+            'background': label_bg,
+            'foreground': '#737373',
+            'font': ('Segoe UI', 9)
+        })
+    
+    def build_entry_styles(self, table: Dict[str, Dict[str, Dict[str, Any]]], colors: Dict[str, str], mode: str):
+        """Build custom entry styles"""
+        self.add_style(table, 'Modern.TEntry', configure={
+            'fieldbackground': colors['dark_bg'] if mode == "light" else '#3c3c3c',
+            'borderwidth': 1,
+            'relief': 'solid',
+            'insertcolor': '#000000' if mode == "light" else '#ffffff'
+        })
+    
+    def build_treeview_styles(self, table: Dict[str, Dict[str, Dict[str, Any]]], colors: Dict[str, str], mode: str):
+        """Build custom treeview styles"""
+        bg_color = colors['dark_bg'] if mode == "light" else '#3c3c3c'
+        fg_color = '#000000' if mode == "light" else '#ffffff'
+        
+        self.add_style(table, 'Modern.Treeview', configure={
+            'background': bg_color,
+            'foreground': fg_color,
+            'fieldbackground': bg_color,
+            'borderwidth': 1,
+            'relief': 'solid'
+        })
+        
+        self.add_style(table, 'Modern.Treeview.Heading', configure={
+            'background': colors['primary'],
+            'foreground': colors['white'],
+            'font': ('Segoe UI', 10, 'bold'),
+            'relief': 'flat'
+        })
+    
+    def build_notebook_styles(self, table: Dict[str, Dict[str, Dict[str, Any]]], colors: Dict[str, str], mode: str):
+        """Build custom notebook styles"""
+        self.add_style(table, 'Modern.TNotebook', configure={
+            'background': colors['light_bg'],
+            'borderwidth': 0
+        })
+        
+        tab_fg = '#000000' if mode == "light" else '#ffffff'
+        
+        self.add_style(
+            table,
             'Modern.TNotebook.Tab',
-            background=[('selected', colors['dark_bg']), ('active', colors['light_bg'])],
-            foreground=[('selected', colors['primary']), ('active', tab_fg)]
+            configure={
+                'background': colors['light_bg'],
+                'foreground': tab_fg,
+                'padding': [20, 10],
+                'font': ('Segoe UI', 10)
+            },
+            map={
+                'background': [('selected', colors['dark_bg']), ('active', colors['light_bg'])],
+                'foreground': [('selected', colors['primary']), ('active', tab_fg)]
+            }
         )
     
     def setup_custom_azure_theme(self):
@@ -361,62 +399,101 @@ class ThemeManager:
         # Apply custom styles
         self.apply_custom_styles()
 
-class StatisticsManager:
-    """Manages user statistics and achievements"""
-    
-    def __init__(self):
-        self.stats = {
-            'mappings_created': 0,
-            'files_processed': 0,
-            'total_columns_mapped': 0,
-            'sessions_completed': 0,
-            'last_activity': None
-        }
-        self.load_stats()
-    
-    def load_stats(self):
-        """Load statistics from file"""
+class BackgroundTask:
+    """Runs an operation in a worker thread and relays its progress to the Tk event loop"""
+    
+    POLL_INTERVAL_MS = 50
+    
+    def __init__(
+        self,
+        root: tk.Tk,
+        work: Callable[[CancellationToken, Callable[..., None]], Any],
+        on_success: Callable[[Any], None],
+        on_error: Callable[[Exception], None],
+        on_cancelled: Callable[[], None],
+        on_progress: Optional[Callable[[str, Optional[float]], None]] = None,
+        name: str = "background-task"
+    ):
+        self.root = root
+        self.work = work
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_cancelled = on_cancelled
+        self.on_progress = on_progress
+        self.name = name
+        self.token = CancellationToken()
+        self.finished = False
+        self._events: queue.Queue = queue.Queue()
+    
+    def start(self):
+        """Start the worker thread and begin polling for its events"""
+        threading.Thread(target=self._run, name=self.name, daemon=True).start()
+        self.root.after(self.POLL_INTERVAL_MS, self._poll)
+    
+    def cancel(self):
+        """Ask the operation to stop at its next cancellation check"""
+        self.token.cancel()
+    
+    def report(self, message: str, progress: Optional[float] = None):
+        """Report progress from the worker thread (thread-safe)"""
+        self._events.put(('progress', (message, progress)))
+    
+    def _run(self):
+        """Worker thread body; never touches Tk directly"""
         try:
-            if Config.CONFIG_FILE.exists():
-                with open(Config.CONFIG_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.stats.update(data.get('statistics', {}))
+            result = self.work(self.token, self.report)
+            self._events.put(('success', result))
+        except OperationCancelled:
+            self._events.put(('cancelled', None))
         except Exception as e:
-            print(f"Warning: Could not load statistics: {e}")
-    
-    def save_stats(self):
-        """Save statistics to file"""
-        try:
-            config_data = {}
-            if Config.CONFIG_FILE.exists():
-                with open(Config.CONFIG_FILE, 'r') as f:
-                    config_data = json.load(f)
+            self._events.put(('error', e))
+    
+    def _poll(self):
+        """Dispatch queued worker events on the Tk thread"""
+        while True:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
             
-            config_data['statistics'] = self.stats
-            config_data['last_updated'] = datetime.now().isoformat()
+            if kind == 'progress':
+                if self.on_progress:
+                    self.on_progress(*payload)
+                continue
             
-            with open(Config.CONFIG_FILE, 'w') as f:
-                json.dump(config_data, f, indent=2)
-        except Exception as e:
-            print(f"Warning: Could not save statistics: {e}")
-    
-    def update_mapping_created(self):
-        """Update mapping created count"""
-        self.stats['mappings_created'] += 1
-        self.stats['last_activity'] = datetime.now().isoformat()
-        self.save_stats()
-    
-    def update_file_processed(self, columns_count: int):
-        """Update file processed count"""
-        self.stats['files_processed'] += 1
-        self.stats['total_columns_mapped'] += columns_count
-        self.stats['sessions_completed'] += 1
-        self.stats['last_activity'] = datetime.now().isoformat()
-        self.save_stats()
+            self.finished = True
+            if kind == 'success':
+                self.on_success(payload)
+            elif kind == 'cancelled':
+                self.on_cancelled()
+            else:
+                self.on_error(payload)
+            return
+        
+        self.root.after(self.POLL_INTERVAL_MS, self._poll)
+
+def session_attribute(name: str) -> property:
+    """Expose an attribute of the window's MappingSession, which holds the loaded files and mappings"""
+    return property(lambda self: getattr(self.session, name), lambda self, value: setattr(self.session, name, value))
 
 class ExcelColumnMapper:
     """Main application class for Excel Column Mapping"""
     
+    MATCH_BY_POSITION = "(row position)"
+    EXPRESSION_OPTION = "= Expression..."
+    TRANSFORM_HINT = ("Transforms: trim | upper | lower | date:%d/%m/%Y | decimal_comma | scale:0.001 | "
+                      "map:Y=Yes,N=No | lookup:skus.xlsx,SKU,Description,miss=keep")
+    ROW_FILTER_HINT = ("Row filter: [Status] == 'Active' and [Date] >= '2026-01-01' | "
+                       "[Region] in ('North', 'South') | not [Qty] > 0  (blank copies every row)")
+    
+    # Loaded files and mappings live in the engine session; the window only shows and edits them
+    source_df = session_attribute('source_df')
+    destination_df = session_attribute('destination_df')
+    source_headers = session_attribute('source_headers')
+    destination_headers = session_attribute('destination_headers')
+    column_mappings = session_attribute('column_mappings')
+    mapping_transforms = session_attribute('mapping_transforms')
+    
     def __init__(self, root: tk.Tk):
         self.root = root
         self.setup_window()
@@ -424,17 +501,22 @@ class ExcelColumnMapper:
         # Initialize managers
         self.theme_manager = ThemeManager(root)
         self.stats_manager = StatisticsManager()
+        self.profile_store = ProfileStore()
+        self.tracer = PerformanceTracer()
+        self.session = MappingSession(self.tracer)
+        self.prefetcher = FilePrefetcher(self.prefetch_file)
         
         # Application state
         self.source_file_path = tk.StringVar()
         self.destination_file_path = tk.StringVar()
-        self.source_headers: List[str] = []
-        self.destination_headers: List[str] = []
-        self.source_df: Optional[pd.DataFrame] = None
-        self.destination_df: Optional[pd.DataFrame] = None
-        self.column_mappings: Dict[str, str] = {}
         self.mapping_combos: Dict[str, ttk.Combobox] = {}
-        self.combo_values: List[str] = []
+        self.transform_vars: Dict[str, tk.StringVar] = {}
+        self.header_index = HeaderIndex([])
+        self.preview_built = False
+        self.preview_start = 0
+        self.preview_plan: Optional[MappingPlan] = None
+        self.preview_schema: Optional[DestinationSchema] = None
+        self.active_task: Optional[BackgroundTask] = None
         
         # Setup theme and create UI
         self.theme_manager.setup_azure_theme("light")
@@ -442,6 +524,23 @@ class ExcelColumnMapper:
         
         # Ensure directories exist
         Config.ensure_directories()
+        
+        # Finish heavy startup work once the first frame has been painted
+        self.root.after_idle(self.warm_up_imports)
+    
+    def warm_up_imports(self):
+        """Import pandas in a background thread so the first file load doesn't pay for it"""
+        if pd.is_loaded:
+            return
+        
+        def warm_up():
+            with self.tracer.span("import_pandas"):
+                try:
+                    pd.load()
+                except ImportError as e:
+                    print(f"Warning: Could not import pandas: {e}")
+        
+        threading.Thread(target=warm_up, name="import-warmup", daemon=True).start()
     
     def setup_window(self):
         """Setup main window properties"""
@@ -480,9 +579,6 @@ class ExcelColumnMapper:
             # Update button text
             self.theme_button.config(text=self.get_theme_button_text())
             
-            # Update text widgets that don't automatically inherit theme colors
-            self.update_text_widgets_theme()
-            
             # Update status
             self.update_status(f"Switched to {new_theme} mode")
             
@@ -500,28 +596,6 @@ class ExcelColumnMapper:
         else:
             return "🌙 Dark Mode"
 
-    def update_text_widgets_theme(self):
-        """Update text widgets to match current theme"""
-        try:
-            colors = self.theme_manager.get_theme_colors()
-            
-            # Update preview text widget if it exists
-            if hasattr(self, 'preview_text'):
-                self.preview_text.config(
-                    bg=colors['field_bg'],
-                    fg=colors['fg'],
-                    insertbackground=colors['fg'],
-                    selectbackground=colors['select_bg'],
-                    selectforeground=colors['select_fg']
-                )
-            
-            # Update any other text widgets or canvas elements
-            if hasattr(self, 'mapping_canvas'):
-                self.mapping_canvas.config(bg=colors['bg'])
-                
-        except Exception as e:
-            print(f"Error updating text widget colors: {e}")
-
     def create_theme_toggle_button(self, parent):
         """Create theme toggle button"""
         theme_frame = ttk.Frame(parent)
@@ -600,35 +674,6 @@ class ExcelColumnMapper:
         stats_container.pack(pady=(10, 0))
         self.create_statistics_panel(stats_container)
 
-    def get_theme_button_text(self):
-        """Get the appropriate text for the theme button"""
-        if self.theme_manager.current_theme == "dark":
-            return "☀ Light Mode"
-        else:
-            return "🌙 Dark Mode"
-
-    def toggle_theme(self):
-        """Toggle between light and dark themes"""
-        try:
-            # Switch to opposite theme
-            new_theme = "light" if self.theme_manager.current_theme == "dark" else "dark"
-            
-            # Apply the theme
-            self.theme_manager.switch_theme(new_theme)
-            
-            # Update button text
-            self.theme_button.config(text=self.get_theme_button_text())
-            
-            # Update status
-            self.update_status(f"Switched to {new_theme} mode")
-            
-            # Force a refresh of the interface to apply theme changes
-            self.root.update_idletasks()
-            
-        except Exception as e:
-            print(f"Error toggling theme: {e}")
-            messagebox.showerror("Theme Error", f"Failed to switch theme: {str(e)}")
-
     def create_statistics_panel(self, parent):
         """Create statistics display panel"""
         stats = self.stats_manager.stats
@@ -726,6 +771,15 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         )
         self.copy_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.merge_button = ttk.Button(
+            button_frame,
+            text="Merge Many Sources...",
+            command=self.merge_many_sources,
+            style='Success.TButton',
+            state=tk.DISABLED
+        )
+        self.merge_button.pack(side=tk.LEFT, padx=(0, 10))
+        
         # Secondary actions
         ttk.Button(
             button_frame,
@@ -743,11 +797,66 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         )
         self.history_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.save_profile_button = ttk.Button(
+            button_frame,
+            text="Save Profile...",
+            command=self.save_profile,
+            style='Secondary.TButton',
+            state=tk.DISABLED
+        )
+        self.save_profile_button.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.load_profile_button = ttk.Button(
+            button_frame,
+            text="Load Profile...",
+            command=self.load_profile,
+            style='Secondary.TButton',
+            state=tk.DISABLED
+        )
+        self.load_profile_button.pack(side=tk.LEFT, padx=(0, 10))
+        
         ttk.Button(
             button_frame,
             text="View History",
             command=self.view_mapping_history,
             style='Secondary.TButton'
+        ).pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Button(
+            button_frame,
+            text="Export Timings",
+            command=self.export_timings,
+            style='Secondary.TButton'
+        ).pack(side=tk.LEFT)
+        
+        # Transfer options
+        options_frame = ttk.Frame(parent)
+        options_frame.grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=(10, 0))
+        
+        ttk.Label(options_frame, text="Match rows on:", style='Body.TLabel').pack(side=tk.LEFT, padx=(0, 10))
+        self.key_column_var = tk.StringVar(value=self.MATCH_BY_POSITION)
+        self.key_column_combo = ttk.Combobox(
+            options_frame,
+            textvariable=self.key_column_var,
+            values=[self.MATCH_BY_POSITION],
+            state="readonly",
+            width=30
+        )
+        self.key_column_combo.pack(side=tk.LEFT, padx=(0, 20))
+        
+        ttk.Label(options_frame, text="Row filter:", style='Body.TLabel').pack(side=tk.LEFT, padx=(0, 10))
+        self.row_filter_var = tk.StringVar()
+        row_filter_entry = ttk.Entry(options_frame, textvariable=self.row_filter_var, width=40)
+        row_filter_entry.pack(side=tk.LEFT, padx=(0, 20))
+        row_filter_entry.bind('<FocusIn>', lambda event: self.update_status(self.ROW_FILTER_HINT))
+        row_filter_entry.bind('<FocusOut>', lambda event: self.update_preview())
+        row_filter_entry.bind('<Return>', lambda event: self.update_preview())
+        
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            options_frame,
+            text="Incremental copy: append only rows that are new since the last run to the chosen output",
+            variable=self.incremental_var
         ).pack(side=tk.LEFT)
     
     def create_main_content(self, parent):
@@ -762,11 +871,24 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         
         self.create_mapping_interface(mapping_frame)
         
-        # Preview tab
-        preview_frame = ttk.Frame(self.notebook, padding="10")
-        self.notebook.add(preview_frame, text="Data Preview")
+        # Preview tab (its contents are built the first time the tab is opened)
+        self.preview_frame = ttk.Frame(self.notebook, padding="10")
+        self.notebook.add(self.preview_frame, text="Data Preview")
         
-        self.create_preview_interface(preview_frame)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+    
+    def on_tab_changed(self, event=None):
+        """Build rarely used tabs on demand when they are first selected"""
+        if self.notebook.select() == str(self.preview_frame) and not self.preview_built:
+            self.build_preview_tab()
+    
+    def build_preview_tab(self):
+        """Build the data preview tab and fill it with the current mappings"""
+        with self.tracer.span("create_preview_interface"):
+            self.create_preview_interface(self.preview_frame)
+        self.preview_built = True
+        
+        self.update_preview()
     
     def create_mapping_interface(self, parent):
         """Create the column mapping interface"""
@@ -802,7 +924,7 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         source_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S), pady=10)
         
         # Mapping section
-        mapping_label = ttk.Label(parent, text="Column Mappings", style='Subheading.TLabel')
+        mapping_label = ttk.Label(parent, text="Column Mappings  (destination ← source | transforms)", style='Subheading.TLabel')
         mapping_label.grid(row=0, column=1, sticky=tk.W, padx=(10, 0), pady=(0, 10))
         
         mapping_container = ttk.Frame(parent, style='Card.TFrame')
@@ -812,6 +934,7 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         
         # Scrollable mapping frame
         self.mapping_canvas = tk.Canvas(mapping_container, highlightthickness=0)
+        self.theme_manager.register_themed_widget(self.mapping_canvas, 'canvas')
         mapping_scrollbar = ttk.Scrollbar(mapping_container, orient=tk.VERTICAL, command=self.mapping_canvas.yview)
         self.mapping_frame = ttk.Frame(self.mapping_canvas)
         
@@ -832,23 +955,30 @@ Columns Mapped: {stats['total_columns_mapped']}"""
     def create_preview_interface(self, parent):
         """Create data preview interface"""
         parent.columnconfigure(0, weight=1)
-        parent.rowconfigure(0, weight=1)
+        parent.rowconfigure(1, weight=1)
         
-        # Preview text widget
+        # Preview header with the rows shown
         preview_label = ttk.Label(parent, text="Data Preview", style='Subheading.TLabel')
         preview_label.grid(row=0, column=0, sticky=tk.W, pady=(0, 10))
         
-        self.preview_text = tk.Text(
-            parent,
-            wrap=tk.WORD,
-            font=('Consolas', 10),
-            state=tk.DISABLED
+        self.preview_summary_var = tk.StringVar()
+        ttk.Label(parent, textvariable=self.preview_summary_var, style='Body.TLabel').grid(
+            row=0, column=0, sticky=tk.E, pady=(0, 10)
         )
-        preview_scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.preview_text.yview)
-        self.preview_text.configure(yscrollcommand=preview_scrollbar.set)
         
-        self.preview_text.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 10))
-        preview_scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        # Output grid holding one window of rows; the vertical scrollbar spans the whole source
+        self.preview_tree = ttk.Treeview(parent, show='headings', height=Config.PREVIEW_ROWS, style='Modern.Treeview')
+        self.preview_scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_preview_scroll)
+        preview_xscrollbar = ttk.Scrollbar(parent, orient=tk.HORIZONTAL, command=self.preview_tree.xview)
+        self.preview_tree.configure(xscrollcommand=preview_xscrollbar.set)
+        
+        self.preview_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.preview_scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        preview_xscrollbar.grid(row=2, column=0, sticky=(tk.W, tk.E))
+        
+        self.preview_tree.bind('<MouseWheel>', lambda e: self.on_preview_scroll('scroll', -e.delta // 40, 'units'))
+        self.preview_tree.bind('<Button-4>', lambda e: self.on_preview_scroll('scroll', -3, 'units'))
+        self.preview_tree.bind('<Button-5>', lambda e: self.on_preview_scroll('scroll', 3, 'units'))
     
     def create_status_bar(self, parent):
         """Create status bar"""
@@ -866,6 +996,14 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         )
         self.status_label.pack(side=tk.LEFT)
         
+        # Cancel button for background operations (initially hidden)
+        self.cancel_button = ttk.Button(
+            status_frame,
+            text="Cancel",
+            command=self.cancel_operation,
+            style='Danger.TButton'
+        )
+        
         # Progress bar (initially hidden)
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(
@@ -885,6 +1023,64 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         else:
             self.progress_bar.pack_forget()
     
+    def run_in_background(
+        self,
+        work: Callable[[CancellationToken, Callable[..., None]], Any],
+        on_success: Callable[[Any], None],
+        on_error: Callable[[Exception], None],
+        on_cancelled: Callable[[], None],
+        name: str = "background-task"
+    ) -> Optional[BackgroundTask]:
+        """Run a long operation off the Tk thread with a cancel button shown"""
+        if self.active_task is not None:
+            messagebox.showwarning("Busy", "Another operation is still running. Cancel it or wait for it to finish.")
+            return None
+        
+        def finish(callback: Callable, *args):
+            self.active_task = None
+            self.set_busy(False)
+            callback(*args)
+        
+        self.active_task = BackgroundTask(
+            self.root,
+            work,
+            on_success=lambda result: finish(on_success, result),
+            on_error=lambda error: finish(on_error, error),
+            on_cancelled=lambda: finish(on_cancelled),
+            on_progress=self.update_status,
+            name=name
+        )
+        self.set_busy(True)
+        self.active_task.start()
+        return self.active_task
+    
+    def set_busy(self, busy: bool):
+        """Toggle the interface between idle and running a background operation"""
+        state = tk.DISABLED if busy else tk.NORMAL
+        self.load_button.config(state=state)
+        
+        # Copy and history actions only make sense once files are loaded
+        if not busy and self.source_df is None:
+            state = tk.DISABLED
+        self.copy_button.config(state=state)
+        self.merge_button.config(state=state)
+        self.history_button.config(state=state)
+        self.save_profile_button.config(state=state)
+        self.load_profile_button.config(state=state)
+        
+        if busy:
+            self.cancel_button.config(state=tk.NORMAL)
+            self.cancel_button.pack(side=tk.RIGHT, padx=(0, 10))
+        else:
+            self.cancel_button.pack_forget()
+    
+    def cancel_operation(self):
+        """Cancel the running background operation at its next check"""
+        if self.active_task is not None:
+            self.active_task.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.update_status("Cancelling...")
+    
     def update_status(self, message: str, progress: Optional[float] = None):
         """Update status message and optional progress"""
         self.status_var.set(message)
@@ -900,43 +1096,112 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         filename = filedialog.askopenfilename(
             title="Select Source Excel File",
             initialdir=str(initial_dir),
-            filetypes=[
-                ("Excel files", "*.xlsx *.xls"),
-                ("CSV files", "*.csv"),
-                ("All files", "*.*")
-            ]
+            filetypes=INPUT_FILETYPES
         )
+        filename = filename and self.choose_archive_member(filename)
         
         if filename:
             self.source_file_path.set(filename)
+            self.prefetcher.prefetch('source', filename)
             self.update_status(f"Source file selected: {Path(filename).name}")
     
     def browse_destination_file(self):
         """Browse for destination Excel file"""
         filename = filedialog.askopenfilename(
             title="Select Destination Excel File",
-            filetypes=[
-                ("Excel files", "*.xlsx *.xls"),
-                ("CSV files", "*.csv"),
-                ("All files", "*.*")
-            ]
+            filetypes=INPUT_FILETYPES
         )
+        filename = filename and self.choose_archive_member(filename)
         
         if filename:
             self.destination_file_path.set(filename)
+            self.prefetcher.prefetch('destination', filename)
             self.update_status(f"Destination file selected: {Path(filename).name}")
     
-    def read_excel_data(self, file_path: str) -> pd.DataFrame:
-        """Read Excel or CSV data"""
-        file_path = Path(file_path)
-        
+    def choose_archive_member(self, file_path: str) -> Optional[str]:
+        """Ask which data file to read from a zip archive holding several (named as bundle.zip::file), or None"""
+        if not file_path.lower().endswith('.zip'):
+            return file_path
         try:
-            if file_path.suffix.lower() == '.csv':
-                return pd.read_csv(file_path, encoding='utf-8')
-            else:
-                return pd.read_excel(file_path)
-        except Exception as e:
-            raise Exception(f"Error reading file {file_path.name}: {str(e)}")
+            members = list_archive_members(Path(file_path))
+        except (OSError, zipfile.BadZipFile) as e:
+            messagebox.showerror("Error", f"Failed to open {Path(file_path).name}:\n{str(e)}")
+            return None
+        if len(members) == 1:
+            # The only data file is read without naming it
+            return file_path
+        if not members:
+            messagebox.showerror("Error", f"{Path(file_path).name} holds no .csv, .csv.gz or Excel files")
+            return None
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Choose File in Archive")
+        dialog.geometry("480x360")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        main_frame = ttk.Frame(dialog, padding="20")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.columnconfigure(0, weight=1)
+        main_frame.rowconfigure(1, weight=1)
+        
+        ttk.Label(
+            main_frame,
+            text=f"{Path(file_path).name} holds {len(members)} data files. Read:",
+            style='Subheading.TLabel'
+        ).grid(row=0, column=0, sticky=tk.W, pady=(0, 10))
+        
+        member_list = tk.Listbox(main_frame, activestyle='none')
+        self.theme_manager.register_themed_widget(member_list, 'text')
+        for member in members:
+            member_list.insert(tk.END, member)
+        member_list.selection_set(0)
+        member_list.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        
+        chosen = []
+        def choose(event=None):
+            selection = member_list.curselection()
+            if selection:
+                chosen.append(f"{file_path}{ARCHIVE_MEMBER_SEPARATOR}{members[selection[0]]}")
+            dialog.destroy()
+        member_list.bind('<Double-Button-1>', choose)
+        
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=2, column=0, sticky=tk.E)
+        ttk.Button(button_frame, text="Open", command=choose, style='Primary.TButton').pack(side=tk.RIGHT, padx=(5, 0))
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy, style='Secondary.TButton').pack(side=tk.RIGHT)
+        
+        self.root.wait_window(dialog)
+        return chosen[0] if chosen else None
+    
+    def prefetch_file(self, file_path: Path, token: CancellationToken) -> pd.DataFrame:
+        """Parse a just-selected file ahead of Load (prefetch worker thread)"""
+        with self.tracer.span("prefetch_file", file=file_path.name) as span:
+            df = self.read_excel_data(str(file_path), token)
+            span['rows'] = len(df)
+        return df
+    
+    def read_selected_file(self, role: str, file_path: str, token: Optional[CancellationToken] = None) -> pd.DataFrame:
+        """Read a selected file, reusing its background prefetch when it is still current"""
+        prefetched = self.prefetcher.take(role, file_path)
+        if prefetched is not None:
+            future, prefetch_token = prefetched
+            try:
+                return wait_for_future(future, token)
+            except OperationCancelled:
+                if token is not None and token.is_cancelled:
+                    # This load was cancelled, so stop the prefetch it took over too
+                    prefetch_token.cancel()
+                    raise
+            except Exception as e:
+                # Fall back to a fresh read, which reports the error if it persists
+                print(f"Warning: Prefetch of {Path(file_path).name} failed: {e}")
+        
+        return self.read_excel_data(file_path, token)
+    
+    def read_excel_data(self, file_path: str, token: Optional[CancellationToken] = None) -> pd.DataFrame:
+        """Read Excel or CSV data (in cancellable chunks when a token is given)"""
+        return read_input_file(Path(file_path), token)
     
     def load_headers(self):
         """Load column headers from both files"""
@@ -949,28 +1214,60 @@ Columns Mapped: {stats['total_columns_mapped']}"""
             messagebox.showerror("Error", "Please select a destination file")
             return
         
-        try:
-            self.show_progress(True)
-            
+        source_path = self.source_file_path.get()
+        destination_path = self.destination_file_path.get()
+        
+        # Prefetched files are reused, so this reads through the prefetcher rather than MappingSession.load
+        def load_files(token: CancellationToken, report: Callable[..., None]):
             # Load source file
-            self.update_status("Loading source file...", 25)
-            self.source_df = self.read_excel_data(self.source_file_path.get())
-            self.source_headers = self.source_df.columns.tolist()
+            report("Loading source file...", 25)
+            with self.tracer.span("read_source_file", file=Path(source_path).name) as span:
+                source_df = self.read_selected_file('source', source_path, token)
+                span['rows'] = len(source_df)
             
             # Load destination file
-            self.update_status("Loading destination file...", 50)
-            self.destination_df = self.read_excel_data(self.destination_file_path.get())
-            self.destination_headers = self.destination_df.columns.tolist()
+            report("Loading destination file...", 50)
+            with self.tracer.span("read_destination_file", file=Path(destination_path).name) as span:
+                destination_df = self.read_selected_file('destination', destination_path, token)
+                span['rows'] = len(destination_df)
+            
+            return source_df, destination_df
+        
+        def on_error(error: Exception):
+            self.show_progress(False)
+            messagebox.showerror("Error", f"Failed to load files:\n{str(error)}")
+            self.update_status("Error loading files")
+        
+        def on_cancelled():
+            self.show_progress(False)
+            self.update_status("Loading cancelled")
+        
+        self.show_progress(True)
+        self.run_in_background(load_files, self.on_files_loaded, on_error, on_cancelled, name="load-headers")
+    
+    def on_files_loaded(self, loaded: Tuple[pd.DataFrame, pd.DataFrame]):
+        """Show freshly loaded source and destination files in the interface"""
+        try:
+            source_df, destination_df = loaded
+            self.session.set_files(
+                Path(self.source_file_path.get()), source_df, Path(self.destination_file_path.get()), destination_df
+            )
             
             # Update UI
             self.update_status("Updating interface...", 75)
             self.populate_source_tree()
             self.create_mapping_widgets()
             self.update_preview()
+            self.key_column_combo['values'] = [self.MATCH_BY_POSITION] + self.destination_headers
+            if self.key_column_var.get() not in self.destination_headers:
+                self.key_column_var.set(self.MATCH_BY_POSITION)
             
             # Enable buttons
             self.copy_button.config(state=tk.NORMAL)
+            self.merge_button.config(state=tk.NORMAL)
             self.history_button.config(state=tk.NORMAL)
+            self.save_profile_button.config(state=tk.NORMAL)
+            self.load_profile_button.config(state=tk.NORMAL)
             
             self.update_status(
                 f"Files loaded successfully - Source: {len(self.source_headers)} columns, "
@@ -994,14 +1291,15 @@ Columns Mapped: {stats['total_columns_mapped']}"""
     
     def populate_source_tree(self):
         """Populate source tree with column headers and sample data"""
-        # Clear existing items
-        for item in self.source_tree.get_children():
-            self.source_tree.delete(item)
-        
-        # Add column headers with sample data
-        for header in self.source_headers:
-            sample_data = self.get_sample_data(header)
-            self.source_tree.insert('', 'end', iid=header, text=header, values=(sample_data,))
+        with self.tracer.span("populate_source_tree", rows=len(self.source_headers)):
+            # Clear existing items
+            for item in self.source_tree.get_children():
+                self.source_tree.delete(item)
+            
+            # Add column headers with sample data
+            for header in self.source_headers:
+                sample_data = self.get_sample_data(header)
+                self.source_tree.insert('', 'end', iid=header, text=header, values=(sample_data,))
     
     def get_sample_data(self, column_name: str, max_samples: int = 3) -> str:
         """Get sample data from a column"""
@@ -1035,21 +1333,24 @@ Columns Mapped: {stats['total_columns_mapped']}"""
     
     def create_mapping_widgets(self):
         """Create mapping widgets for destination columns"""
-        # Clear existing widgets
-        for widget in self.mapping_frame.winfo_children():
-            widget.destroy()
-        self.mapping_combos.clear()
-        
-        # Prepare combo values
-        self.combo_values = ["-- Select Source Column --"] + self.source_headers
-        
-        # Create mapping widgets
-        for i, dest_header in enumerate(self.destination_headers):
-            self.create_mapping_row(i, dest_header)
-        
-        # Update canvas scroll region
-        self.mapping_frame.update_idletasks()
-        self.mapping_canvas.configure(scrollregion=self.mapping_canvas.bbox("all"))
+        with self.tracer.span("create_mapping_widgets", rows=len(self.destination_headers)):
+            # Clear existing widgets
+            for widget in self.mapping_frame.winfo_children():
+                widget.destroy()
+            self.mapping_combos.clear()
+            self.transform_vars.clear()
+            self.mapping_transforms.clear()
+            
+            # One index of the source headers is shared by every mapping combobox
+            self.header_index = HeaderIndex(self.source_headers)
+            
+            # Create mapping widgets
+            for i, dest_header in enumerate(self.destination_headers):
+                self.create_mapping_row(i, dest_header)
+            
+            # Update canvas scroll region
+            self.mapping_frame.update_idletasks()
+            self.mapping_canvas.configure(scrollregion=self.mapping_canvas.bbox("all"))
     
     def create_mapping_row(self, row: int, dest_header: str):
         """Create a single mapping row"""
@@ -1065,28 +1366,106 @@ Columns Mapped: {stats['total_columns_mapped']}"""
             width=25
         ).grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
         
-        # Mapping combobox
+        # Mapping combobox (type to search; the list is filled only when it opens)
         combo = ttk.Combobox(
             row_frame,
-            values=self.combo_values,
             width=30,
-            state="readonly"
+            postcommand=lambda dest=dest_header: self.fill_mapping_choices(dest)
         )
         combo.grid(row=0, column=1, sticky=(tk.W, tk.E))
         combo.set("-- Select Source Column --")
         
+        # Transform chain applied to the copied values
+        transform_var = tk.StringVar()
+        transform_entry = ttk.Entry(row_frame, textvariable=transform_var, width=28, style='Modern.TEntry')
+        transform_entry.grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        
         # Store reference
         self.mapping_combos[dest_header] = combo
+        self.transform_vars[dest_header] = transform_var
         
         # Bind selection event
         combo.bind('<<ComboboxSelected>>', lambda e, dest=dest_header: self.on_mapping_changed(dest))
+        combo.bind('<KeyRelease>', lambda e, dest=dest_header: self.on_mapping_typed(dest, e))
+        combo.bind('<Return>', lambda e, dest=dest_header: self.commit_mapping_text(dest))
+        combo.bind('<FocusOut>', lambda e, dest=dest_header: self.commit_mapping_text(dest, exact_only=True))
+        transform_entry.bind('<FocusIn>', lambda e: self.update_status(self.TRANSFORM_HINT))
+        transform_entry.bind('<FocusOut>', lambda e, dest=dest_header: self.on_transform_changed(dest))
+        transform_entry.bind('<Return>', lambda e, dest=dest_header: self.on_transform_changed(dest))
+    
+    def get_mapping_query(self, dest_column: str) -> str:
+        """Get the search text typed into a mapping combobox (empty while it shows the current mapping)"""
+        text = self.mapping_combos[dest_column].get()
+        if text in ("-- Select Source Column --", self.EXPRESSION_OPTION, self.column_mappings.get(dest_column)):
+            return ""
+        return text
+    
+    def fill_mapping_choices(self, dest_column: str):
+        """Fill a mapping combobox's list with the source columns matching what was typed"""
+        matches = self.header_index.search(self.get_mapping_query(dest_column), Config.MAPPING_CHOICES_LIMIT)
+        self.mapping_combos[dest_column]['values'] = ["-- Select Source Column --", self.EXPRESSION_OPTION] + matches
+    
+    def on_mapping_typed(self, dest_column: str, event):
+        """Show which source columns match the text typed into a mapping combobox"""
+        if event.keysym in ('Return', 'Tab', 'Escape', 'Up', 'Down', 'Left', 'Right'):
+            return
+        query = self.get_mapping_query(dest_column)
+        if not query or is_expression(query):
+            return
+        
+        matches = self.header_index.search(query, Config.MAPPING_CHOICES_LIMIT)
+        if not matches:
+            self.update_status(f"No source column matches '{query}'")
+            return
+        more = "+" if len(matches) == Config.MAPPING_CHOICES_LIMIT else ""
+        shown = ", ".join(matches[:5]) + (", ..." if len(matches) > 5 else "")
+        self.update_status(f"{len(matches)}{more} source columns match '{query}': {shown} (press Down to choose)")
+    
+    def commit_mapping_text(self, dest_column: str, exact_only: bool = False):
+        """Map the column named by the typed text, or restore the current mapping if it names none"""
+        combo = self.mapping_combos[dest_column]
+        text = combo.get().strip()
+        current = self.column_mappings.get(dest_column) or "-- Select Source Column --"
+        if text == current:
+            return
+        
+        if not text:
+            choice = "-- Select Source Column --"
+        elif is_expression(text):
+            try:
+                MappingPlan({dest_column: text}, source_headers=self.source_headers)
+                choice = text
+            except ValueError as e:
+                choice = None
+                self.update_status(f"Invalid expression for {dest_column}: {e}")
+        else:
+            choice = self.header_index.lookup(text)
+            if choice is None and not exact_only:
+                matches = self.header_index.search(text, 2)
+                choice = matches[0] if len(matches) == 1 else None
+                if choice is None:
+                    self.update_status(f"No single source column matches '{text}' - press Down to choose one")
+        
+        if choice is None:
+            if not exact_only:
+                combo.set(current)
+            return
+        combo.set(choice)
+        self.on_mapping_changed(dest_column)
     
     def on_mapping_changed(self, dest_column: str):
         """Handle mapping selection change"""
         selected_source = self.mapping_combos[dest_column].get()
+        old_source = self.column_mappings.get(dest_column)
+        
+        if selected_source == self.EXPRESSION_OPTION:
+            selected_source = self.ask_expression(dest_column, old_source)
+            if selected_source is None:
+                self.mapping_combos[dest_column].set(old_source or "-- Select Source Column --")
+                return
+            self.mapping_combos[dest_column].set(selected_source)
         
         # Clear previous mapping
-        old_source = self.column_mappings.get(dest_column)
         if old_source and old_source != selected_source:
             self.update_source_tree_mapping(old_source, "", False)
         
@@ -1104,44 +1483,150 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         self.update_status(f"Column mappings configured: {mappings_count}")
         self.update_preview()
     
+    def ask_expression(self, dest_column: str, current: Optional[str] = None) -> Optional[str]:
+        """Ask for an expression computing a destination column, or None if cancelled"""
+        expression = current if is_expression(current) else "="
+        while True:
+            expression = simpledialog.askstring(
+                "Expression Mapping",
+                f"Compute '{dest_column}' from source columns, e.g.\n"
+                f"=[Qty] * [UnitPrice]    or    =[First] + ' ' + [Last]",
+                initialvalue=expression,
+                parent=self.root
+            )
+            if expression is None:
+                return None
+            
+            expression = expression.strip()
+            if not is_expression(expression):
+                expression = "=" + expression
+            try:
+                MappingPlan({dest_column: expression}, source_headers=self.source_headers)
+                return expression
+            except ValueError as e:
+                messagebox.showerror("Invalid Expression", str(e))
+    
+    def on_transform_changed(self, dest_column: str):
+        """Validate and store the transform chain typed for a destination column"""
+        spec = self.transform_vars[dest_column].get().strip()
+        if spec == self.mapping_transforms.get(dest_column, ''):
+            return
+        
+        try:
+            compile_transform_chain(spec)
+        except ValueError as e:
+            self.update_status(f"Invalid transform for {dest_column}: {e}")
+            return
+        
+        if spec:
+            self.mapping_transforms[dest_column] = spec
+        else:
+            self.mapping_transforms.pop(dest_column, None)
+        self.update_status(f"Transforms for {dest_column}: {spec or 'none'}")
+        self.update_preview()
+    
+    def get_mapping_plan(self, mappings: Dict[str, str]) -> MappingPlan:
+        """Compile the current mappings with their transform chains and row filter (raises ValueError if invalid)"""
+        transforms = {dest: var.get().strip() for dest, var in self.transform_vars.items() if var.get().strip()}
+        return MappingPlan(mappings, transforms, source_headers=self.source_headers,
+                           row_filter=self.row_filter_var.get())
+    
+    def get_destination_schema(self) -> DestinationSchema:
+        """Get the destination column types from the template's data and schema file (raises ValueError if invalid)"""
+        return self.session.get_schema()
+    
+    @staticmethod
+    def get_violations_text(violations: Optional[List[Dict[str, Any]]]) -> str:
+        """Describe values that broke the destination's types or rules (values of the wrong type are left empty)"""
+        if not violations:
+            return ""
+        lines = describe_violations(violations)
+        more = f"\n... and {len(lines) - 8} more" if len(lines) > 8 else ""
+        return "\n\n" + "\n".join(lines[:8]) + more
+    
     def update_source_tree_mapping(self, source_column: str, dest_column: str, is_mapped: bool):
-        """Update source tree to show mapping status"""
-        if source_column in self.source_headers:
-            if is_mapped:
-                self.source_tree.item(source_column, text=f"✓ {source_column} → {dest_column}")
-            else:
-                self.source_tree.item(source_column, text=source_column)
+        """Update source tree to show mapping status (for every column an expression reads)"""
+        for column in get_referenced_columns(source_column):
+            if column in self.source_headers:
+                if is_mapped:
+                    self.source_tree.item(column, text=f"✓ {column} → {dest_column}")
+                else:
+                    self.source_tree.item(column, text=column)
     
     def update_preview(self):
-        """Update the data preview"""
-        self.preview_text.config(state=tk.NORMAL)
-        self.preview_text.delete(1.0, tk.END)
+        """Update the data preview grid for the current mappings, keeping its scroll position"""
+        if not self.preview_built:
+            # Filled in when the preview tab is first opened
+            return
+        
+        self.preview_plan = None
+        columns = ['Row'] + self.destination_headers
+        self.preview_tree.configure(columns=columns)
+        for column in columns:
+            source = self.column_mappings.get(column) if column != 'Row' else None
+            self.preview_tree.heading(column, text=f"{column} ← {source}" if source else column, anchor=tk.W)
+            self.preview_tree.column(column, width=70 if column == 'Row' else 150, minwidth=50, stretch=False)
         
         if not self.column_mappings:
-            preview_text = "No column mappings configured yet.\n\nConfigure mappings to see preview."
-            self.preview_text.insert(tk.END, "No column mappings configured yet.\n\nConfigure mappings to see preview.")
+            self.preview_tree.delete(*self.preview_tree.get_children())
+            self.preview_summary_var.set("No column mappings configured yet. Configure mappings to see preview.")
+            return
+        try:
+            self.preview_plan = self.get_mapping_plan(dict(self.column_mappings))
+            self.preview_schema = self.get_destination_schema()
+        except ValueError as e:
+            self.preview_tree.delete(*self.preview_tree.get_children())
+            self.preview_summary_var.set(f"Error: {e}")
+            return
+        self.show_preview_window(self.preview_start)
+    
+    def on_preview_scroll(self, action: str, amount, unit: Optional[str] = None):
+        """Move the preview window when its scrollbar is dragged or clicked, or the mouse wheel turns"""
+        if self.preview_plan is None:
+            return
+        if action == 'moveto':
+            start = int(float(amount) * len(self.source_df))
+        elif unit == 'pages':
+            start = self.preview_start + int(amount) * Config.PREVIEW_ROWS
         else:
-            preview_text = "Current Column Mappings:\n" + "="*50 + "\n\n"
-            
-            for dest_col, source_col in self.column_mappings.items():
-                preview_text += f"Destination: {dest_col}\n"
-                preview_text += f"Source: {source_col}\n"
-                
-                # Show sample data transfer
-                if hasattr(self, 'source_df') and source_col in self.source_df.columns:
-                    sample = self.get_sample_data(source_col, 2)
-                    preview_text += f"Sample Data: {sample}\n"
-                
-                preview_text += "\n"
+            start = self.preview_start + int(amount)
+        self.show_preview_window(start)
+    
+    def show_preview_window(self, start: int):
+        """Compute and show the output rows for one window of source rows"""
+        total = len(self.source_df)
+        start = max(0, min(start, total - Config.PREVIEW_ROWS))
+        self.preview_start = start
+        try:
+            with self.tracer.span("preview_window", start=start, rows=Config.PREVIEW_ROWS):
+                rows, summary = preview_mapped_rows(self.source_df, self.destination_headers, self.preview_plan,
+                                                    start, Config.PREVIEW_ROWS, self.preview_schema)
+        except Exception as e:
+            self.preview_tree.delete(*self.preview_tree.get_children())
+            self.preview_summary_var.set(f"Error: {e}")
+            return
+        
+        self.preview_tree.delete(*self.preview_tree.get_children())
+        for row_number, values in zip(rows.index, rows.itertuples(index=False)):
+            self.preview_tree.insert('', tk.END, values=[row_number] + ["" if pd.isna(value) else str(value) for value in values])
         
-        self.preview_text.insert(tk.END, preview_text)
-        self.preview_text.config(state=tk.DISABLED)
+        text = f"Source rows {summary['first']:,}-{summary['last']:,} of {summary['total']:,}"
+        if self.preview_plan.row_filter:
+            text += f" · {summary['kept']} kept by the row filter"
+        if summary['cast_problems']:
+            text += f" · {summary['cast_problems']} values don't fit the destination types"
+        self.preview_summary_var.set(text)
+        if total:
+            self.preview_scrollbar.set(start / total, (start + Config.PREVIEW_ROWS) / total)
     
     def clear_mappings(self):
         """Clear all column mappings"""
         # Reset comboboxes
         for combo in self.mapping_combos.values():
             combo.set("-- Select Source Column --")
+        for transform_var in self.transform_vars.values():
+            transform_var.set("")
+        self.mapping_transforms.clear()
         
         # Clear source tree mappings
         for header in self.source_headers:
@@ -1160,118 +1645,312 @@ Columns Mapped: {stats['total_columns_mapped']}"""
             messagebox.showwarning("Warning", "No column mappings configured")
             return
         
+        key_column = self.key_column_var.get()
+        key_column = None if key_column == self.MATCH_BY_POSITION else key_column
+        incremental = self.incremental_var.get()
+        
+        if key_column and key_column not in self.column_mappings:
+            messagebox.showwarning("Warning", f"Map a source column to '{key_column}' to match rows on it")
+            return
+        if key_column and incremental:
+            messagebox.showwarning(
+                "Warning",
+                "Incremental copy only appends rows; choose row position matching to use it"
+            )
+            return
+        
+        try:
+            plan = self.get_mapping_plan(dict(self.column_mappings))
+        except ValueError as e:
+            messagebox.showwarning("Invalid Transform", str(e))
+            return
+        try:
+            schema = self.get_destination_schema()
+        except ValueError as e:
+            messagebox.showwarning("Invalid Schema", str(e))
+            return
+        
         try:
             # Confirm operation
             mappings_text = "\n".join([f"{dest} ← {source}" for dest, source in self.column_mappings.items()])
+            match_text = f"Rows are matched on '{key_column}': matches are updated, new keys appended." if key_column else ""
+            filter_text = f"Only rows where {plan.row_filter} are copied." if plan.row_filter else ""
             
             if not messagebox.askyesno(
                 "Confirm Data Copy",
-                f"Copy data with the following mappings?\n\n{mappings_text}\n\nContinue?"
+                f"Copy data with the following mappings?\n\n{mappings_text}\n\n{match_text}\n{filter_text}\n\nContinue?"
             ):
                 return
             
-            self.show_progress(True)
-            self.update_status("Preparing data transfer...", 10)
-            
-            # Create result dataframe
-            result_df = self.destination_df.copy()
-            
-            # Copy data for each mapping
-            total_mappings = len(self.column_mappings)
-            for i, (dest_col, source_col) in enumerate(self.column_mappings.items()):
-                progress = 20 + (60 * i / total_mappings)
-                self.update_status(f"Copying {source_col} → {dest_col}...", progress)
-                
-                if source_col in self.source_df.columns:
-                    source_data = self.source_df[source_col]
-                    
-                    # Handle different row counts
-                    if len(source_data) > len(result_df):
-                        additional_rows = len(source_data) - len(result_df)
-                        empty_rows = pd.DataFrame(index=range(additional_rows), columns=result_df.columns)
-                        result_df = pd.concat([result_df, empty_rows], ignore_index=True)
-                    
-                    # Copy data
-                    result_df[dest_col] = source_data
-            
-            # Save file
-            self.update_status("Saving file...", 80)
-            
+            # Choose the output file before doing any work
             save_path = filedialog.asksaveasfilename(
-                title="Save Updated Destination File",
+                title="Choose Output to Update" if incremental else "Save Updated Destination File",
                 defaultextension=".xlsx",
-                filetypes=[
-                    ("Excel files", "*.xlsx"),
-                    ("CSV files", "*.csv"),
-                    ("All files", "*.*")
-                ],
-                initialfile=f"{Path(self.destination_file_path.get()).stem}_updated.xlsx"
+                filetypes=OUTPUT_FILETYPES,
+                initialfile=f"{get_input_stem(self.destination_file_path.get())}_updated.xlsx",
+                confirmoverwrite=not incremental
             )
             
-            if save_path:
-                save_path = Path(save_path)
-                
-                if save_path.suffix.lower() == '.csv':
-                    result_df.to_csv(save_path, index=False)
-                else:
-                    result_df.to_excel(save_path, index=False)
-                
-                # Save history
-                self.save_mapping_history(str(save_path))
-                
-                # Update statistics
-                self.stats_manager.update_file_processed(len(self.column_mappings))
+            if not save_path:
+                self.update_status("Save cancelled")
+                return
+            
+            self.show_progress(True)
+            save_path = Path(save_path)
+            mappings = plan.mappings
+            transforms = plan.transforms
+            row_filter = plan.row_filter
+            source_df = self.source_df
+            destination_df = self.destination_df
+            source_path = Path(self.source_file_path.get())
+            
+            def transfer(token: CancellationToken, report: Callable[..., None]):
+                if incremental:
+                    # Re-read from disk so the saved checkpoint matches the file, not the loaded snapshot
+                    return IncrementalTransfer(tracer=self.tracer).run(
+                        source_path, destination_df, mappings, save_path, token=token, report=report,
+                        transforms=transforms, row_filter=row_filter, schema=schema
+                    )
+                return prepare_mapped_data(
+                    source_df, destination_df, plan, key_column, schema, token, report, self.tracer
+                )
+            
+            def on_success(result):
+                if incremental:
+                    self.on_incremental_completed(save_path, mappings, result, transforms, row_filter)
+                    return
                 
-                self.update_status(f"Data copied successfully to {save_path.name}", 100)
+                result_df, summary = result
+                if summary['violations'] and not messagebox.askyesno(
+                    "Validation Problems",
+                    f"The output doesn't pass validation:{self.get_violations_text(summary['violations'])}\n\n"
+                    f"Write {save_path.name} anyway?"
+                ):
+                    self.show_progress(False)
+                    self.update_status("Data copy stopped after validation - no output file was written")
+                    return
                 
-                # Hide progress bar after showing completion
-                self.root.after(2000, lambda: self.show_progress(False))
+                def write(token: CancellationToken, report: Callable[..., None]):
+                    save_mapped_data(result_df, save_path, token, report, self.tracer)
+                    return summary
                 
-                messagebox.showinfo(
-                    "Success",
-                    f"Data copied successfully!\n\n"
-                    f"Mapped {len(self.column_mappings)} columns\n"
-                    f"Output file: {save_path.name}"
+                self.run_in_background(
+                    write,
+                    lambda summary: self.on_copy_completed(save_path, mappings, summary, transforms, row_filter),
+                    on_error, on_cancelled, name="write-output"
                 )
-            else:
+            
+            def on_error(error: Exception):
                 self.show_progress(False)
-                self.update_status("Save cancelled")
+                messagebox.showerror("Error", f"Failed to copy data:\n{str(error)}")
+                self.update_status("Error copying data")
+            
+            def on_cancelled():
+                self.show_progress(False)
+                self.update_status("Data copy cancelled - no output file was written")
+            
+            self.update_status("Preparing data transfer...", 10)
+            self.run_in_background(transfer, on_success, on_error, on_cancelled, name="copy-mapped-data")
         
         except Exception as e:
             self.show_progress(False)
             messagebox.showerror("Error", f"Failed to copy data:\n{str(e)}")
             self.update_status("Error copying data")
     
-    def save_mapping_history(self, output_file_path: str):
+    def on_copy_completed(self, save_path: Path, mappings: Dict[str, str], summary: Optional[Dict[str, Any]] = None,
+                          transforms: Optional[Dict[str, str]] = None, row_filter: Optional[str] = None):
+        """Record a finished data transfer and tell the user"""
+        # Save history
+        self.save_mapping_history(str(save_path), mappings, transforms=transforms, row_filter=row_filter)
+        
+        # Update statistics
+        self.stats_manager.update_file_processed(len(mappings))
+        
+        self.update_status(f"Data copied successfully to {save_path.name}", 100)
+        
+        # Hide progress bar after showing completion
+        self.root.after(2000, lambda: self.show_progress(False))
+        
+        summary = summary or {}
+        rows_text = f"Updated {summary['updated']} rows, added {summary['inserted']} rows\n" if 'updated' in summary else ""
+        messagebox.showinfo(
+            "Success",
+            f"Data copied successfully!\n\n"
+            f"Mapped {len(mappings)} columns\n"
+            f"{rows_text}"
+            f"Output file: {save_path.name}"
+            f"{self.get_violations_text(summary.get('violations'))}"
+        )
+    
+    def on_incremental_completed(self, save_path: Path, mappings: Dict[str, str], result: Dict[str, Any],
+                                 transforms: Optional[Dict[str, str]] = None, row_filter: Optional[str] = None):
+        """Record a finished incremental transfer and tell the user"""
+        self.save_mapping_history(str(save_path), mappings, transforms=transforms, row_filter=row_filter)
+        self.stats_manager.update_file_processed(len(mappings))
+        
+        if result['mode'] == 'full':
+            summary = f"First incremental run: wrote {result['rows_appended']} rows to {save_path.name}"
+        else:
+            summary = f"Appended {result['rows_appended']} new rows to {save_path.name}"
+        self.update_status(summary, 100)
+        self.root.after(2000, lambda: self.show_progress(False))
+        
+        messagebox.showinfo(
+            "Success",
+            f"{summary}\n\n"
+            f"Source rows tracked: {result['source_rows']}\n"
+            f"Later runs against this output will append only new rows."
+            f"{self.get_violations_text(result.get('violations'))}"
+        )
+    
+    def merge_many_sources(self):
+        """Apply the current mappings to many source files and merge them into one output"""
+        if not self.column_mappings:
+            messagebox.showwarning("Warning", "No column mappings configured")
+            return
+        
+        source_files = filedialog.askopenfilenames(
+            title="Select Source Files to Merge",
+            initialdir=str(Config.SOURCE_FILES_DIR if Config.SOURCE_FILES_DIR.exists() else Path.cwd()),
+            filetypes=INPUT_FILETYPES
+        )
+        if not source_files:
+            return
+        # Zip bundles are merged file by file
+        try:
+            source_files = expand_archive_paths(list(source_files))
+        except (OSError, zipfile.BadZipFile) as e:
+            messagebox.showerror("Error", f"Failed to open archive:\n{str(e)}")
+            return
+        if not source_files:
+            messagebox.showerror("Error", "The archives hold no .csv, .csv.gz or Excel files")
+            return
+        
+        add_source_column = messagebox.askyesnocancel(
+            "Source File Column",
+            f"Merge {len(source_files)} files into one output.\n\n"
+            f"Add a '{Config.SOURCE_FILE_COLUMN}' column recording which file each row came from?"
+        )
+        if add_source_column is None:
+            return
+        
+        save_path = filedialog.asksaveasfilename(
+            title="Save Merged Destination File",
+            defaultextension=".xlsx",
+            filetypes=OUTPUT_FILETYPES,
+            initialfile=f"{get_input_stem(self.destination_file_path.get())}_merged.xlsx"
+        )
+        if not save_path:
+            self.update_status("Save cancelled")
+            return
+        
+        save_path = Path(save_path)
+        try:
+            plan = self.get_mapping_plan(dict(self.column_mappings))
+        except ValueError as e:
+            messagebox.showwarning("Invalid Transform", str(e))
+            return
+        try:
+            schema = self.get_destination_schema()
+        except ValueError as e:
+            messagebox.showwarning("Invalid Schema", str(e))
+            return
+        mappings = plan.mappings
+        transforms = plan.transforms
+        row_filter = plan.row_filter
+        destination_headers = list(self.destination_headers)
+        source_column = Config.SOURCE_FILE_COLUMN if add_source_column else None
+        
+        def merge(token: CancellationToken, report: Callable[..., None]):
+            report(f"Merging {len(source_files)} source files...", 5)
+            return merge_source_files(
+                list(source_files), mappings, destination_headers, save_path,
+                source_column=source_column, token=token, report=report, tracer=self.tracer,
+                transforms=transforms, row_filter=row_filter, schema=schema, cast_policy=Config.CAST_ERROR_POLICY
+            )
+        
+        def on_success(result: Dict[str, Any]):
+            self.save_mapping_history(
+                str(save_path), mappings, source_file_name=f"{len(source_files)} files merged", transforms=transforms,
+                row_filter=row_filter
+            )
+            self.stats_manager.update_file_processed(len(mappings))
+            self.update_status(f"Merged {len(source_files)} files ({result['rows']} rows) into {save_path.name}", 100)
+            self.root.after(2000, lambda: self.show_progress(False))
+            messagebox.showinfo(
+                "Success",
+                f"Merged {len(source_files)} source files!\n\n"
+                f"Rows written: {result['rows']}\n"
+                f"Output file: {save_path.name}"
+                f"{self.get_violations_text(result['violations'])}"
+            )
+        
+        def on_error(error: Exception):
+            self.show_progress(False)
+            messagebox.showerror("Error", f"Failed to merge source files:\n{str(error)}")
+            self.update_status("Error merging source files")
+        
+        def on_cancelled():
+            self.show_progress(False)
+            self.update_status("Merge cancelled - no output file was written")
+        
+        self.show_progress(True)
+        self.run_in_background(merge, on_success, on_error, on_cancelled, name="merge-sources")
+    
+    def save_mapping_history(self, output_file_path: str, mappings: Optional[Dict[str, str]] = None,
+                             source_file_name: Optional[str] = None, transforms: Optional[Dict[str, str]] = None,
+                             row_filter: Optional[str] = None):
         """Save mapping history to CSV file"""
+        mappings = self.column_mappings if mappings is None else mappings
+        transforms = self.mapping_transforms if transforms is None else transforms
+        source_file_name = source_file_name or get_input_name(self.source_file_path.get())
+        with self.tracer.span("write_history", rows=len(mappings)):
+            self._write_mapping_history(output_file_path, mappings, source_file_name, transforms, row_filter)
+    
+    def _write_mapping_history(self, output_file_path: str, mappings: Dict[str, str], source_file_name: str,
+                               transforms: Optional[Dict[str, str]] = None, row_filter: Optional[str] = None):
+        """Append the given mappings to the history CSV file"""
         try:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            history_data = []
-            for dest_col, source_col in self.column_mappings.items():
-                history_data.append({
-                    'Timestamp': timestamp,
-                    'Source_File': Path(self.source_file_path.get()).name,
-                    'Destination_File': Path(self.destination_file_path.get()).name,
-                    'Output_File': Path(output_file_path).name,
-                    'Source_Column': source_col,
-                    'Destination_Column': dest_col
-                })
-            
-            new_history_df = pd.DataFrame(history_data)
-            
-            # Append to existing history or create new
-            if Config.HISTORY_FILE.exists():
-                existing_history_df = pd.read_csv(Config.HISTORY_FILE)
-                combined_history_df = pd.concat([existing_history_df, new_history_df], ignore_index=True)
-            else:
-                combined_history_df = new_history_df
-            
-            combined_history_df.to_csv(Config.HISTORY_FILE, index=False)
-            
+            append_mapping_history(
+                mappings,
+                source_file_name,
+                get_input_name(self.destination_file_path.get()),
+                Path(output_file_path).name,
+                transforms,
+                row_filter
+            )
         except Exception as e:
             print(f"Warning: Could not save mapping history: {e}")
     
+    def export_timings(self):
+        """Export recorded stage timings as a Chrome trace or CSV file"""
+        if not self.tracer.spans:
+            messagebox.showinfo("No Timings", "No timings recorded yet. Load files or copy data first.")
+            return
+        
+        Config.ensure_directories()
+        default_path = PerformanceTracer.default_export_path('.json')
+        
+        export_path = filedialog.asksaveasfilename(
+            title="Export Stage Timings",
+            initialdir=str(Config.LOG_DIR),
+            initialfile=default_path.name,
+            defaultextension=".json",
+            filetypes=[
+                ("Chrome trace", "*.json"),
+                ("CSV files", "*.csv")
+            ]
+        )
+        
+        if not export_path:
+            return
+        
+        try:
+            export_path = self.tracer.export(Path(export_path))
+            self.update_status(f"Exported {len(self.tracer.spans)} timing spans to {export_path.name}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export timings:\n{str(e)}")
+    
     def view_mapping_history(self):
         """View mapping history file"""
         if not Config.HISTORY_FILE.exists():
@@ -1298,19 +1977,20 @@ Columns Mapped: {stats['total_columns_mapped']}"""
             return
         
         try:
-            history_df = pd.read_csv(Config.HISTORY_FILE)
+            history_index = HistoryIndex()
+            sessions = history_index.get_sessions()
             
-            if history_df.empty:
+            if not sessions:
                 messagebox.showinfo("No History", "No mapping history found.")
                 return
             
-            self.show_history_selection_dialog(history_df)
+            self.show_history_selection_dialog(history_index, sessions)
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load history:\n{str(e)}")
     
-    def show_history_selection_dialog(self, history_df: pd.DataFrame):
-        """Show dialog to select mapping configuration from history"""
+    def show_history_selection_dialog(self, history_index: HistoryIndex, sessions: List[Dict[str, Any]]):
+        """Show dialog to select mapping configuration from history (best matches first, a page at a time)"""
         dialog = tk.Toplevel(self.root)
         dialog.title("Load Mapping from History")
         dialog.geometry("800x600")
@@ -1336,16 +2016,21 @@ Columns Mapped: {stats['total_columns_mapped']}"""
             style='Subheading.TLabel'
         ).grid(row=0, column=0, sticky=tk.W, pady=(0, 10))
         
+        normalize_var = tk.BooleanVar(value=Config.HISTORY_NORMALIZE_HEADERS)
+        ttk.Checkbutton(
+            main_frame,
+            text="Ignore case and spacing",
+            variable=normalize_var,
+            command=lambda: rank_sessions()
+        ).grid(row=0, column=0, sticky=tk.E, pady=(0, 10))
+        
         # History treeview
         tree_frame = ttk.Frame(main_frame)
         tree_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
         tree_frame.columnconfigure(0, weight=1)
         tree_frame.rowconfigure(0, weight=1)
         
-        # Group history by operation
-        grouped_history = history_df.groupby(['Timestamp', 'Source_File', 'Destination_File', 'Output_File'])
-        
-        columns = ('timestamp', 'source_file', 'dest_file', 'output_file', 'mappings_count')
+        columns = ('timestamp', 'source_file', 'dest_file', 'output_file', 'mappings_count', 'uses', 'match')
         history_tree = ttk.Treeview(tree_frame, columns=columns, show='headings', style='Modern.Treeview')
         
         # Configure columns
@@ -1354,28 +2039,55 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         history_tree.heading('dest_file', text='Destination File')
         history_tree.heading('output_file', text='Output File')
         history_tree.heading('mappings_count', text='Mappings')
+        history_tree.heading('uses', text='Uses')
+        history_tree.heading('match', text='Match')
         
         history_tree.column('timestamp', width=150)
         history_tree.column('source_file', width=150)
         history_tree.column('dest_file', width=150)
         history_tree.column('output_file', width=150)
         history_tree.column('mappings_count', width=80)
+        history_tree.column('uses', width=60)
+        history_tree.column('match', width=100)
+        
+        # Populate tree a page at a time, best match first; details are read only for the selected session
+        history_records = {}
+        ranking = {}
+        
+        def rank_sessions():
+            ranking['matcher'] = HeaderMatcher(self.source_headers, self.destination_headers, normalize_var.get())
+            ranking['pending'] = iter(ranking['matcher'].rank(sessions))
+            history_tree.delete(*history_tree.get_children())
+            history_records.clear()
+            load_next_page()
+        
+        def load_next_page() -> bool:
+            added = 0
+            for session in ranking['pending']:
+                item_id = history_tree.insert('', 'end', values=(
+                    session['Timestamp'], session['Source_File'], session['Destination_File'],
+                    session['Output_File'], session['mappings_count'], session['use_count'],
+                    f"{session['match_percent']:.0f}% ({session['matched']}/{session['mappings_count']})"
+                ))
+                history_records[item_id] = session
+                added += 1
+                if added == Config.HISTORY_PAGE_SIZE:
+                    break
+            return added > 0
+        
+        def on_tree_scrolled(first: str, last: str):
+            history_scrollbar.set(first, last)
+            # Near the bottom: load the next page of older sessions
+            if float(last) > 0.9 and len(history_records) < len(sessions):
+                load_next_page()
         
         # Scrollbar
         history_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=history_tree.yview)
-        history_tree.configure(yscrollcommand=history_scrollbar.set)
+        history_tree.configure(yscrollcommand=on_tree_scrolled)
         
         history_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         history_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        
-        # Populate tree
-        history_records = {}
-        for (timestamp, source_file, dest_file, output_file), group in grouped_history:
-            mappings_count = len(group)
-            item_id = history_tree.insert('', 'end', values=(
-                timestamp, source_file, dest_file, output_file, mappings_count
-            ))
-            history_records[item_id] = group
+        rank_sessions()
         
         # Details section
         details_frame = ttk.LabelFrame(main_frame, text="Mapping Details", padding="10")
@@ -1383,6 +2095,7 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         details_frame.columnconfigure(0, weight=1)
         
         details_text = tk.Text(details_frame, height=6, wrap=tk.WORD, font=('Consolas', 9))
+        self.theme_manager.register_themed_widget(details_text, 'text')
         details_scrollbar = ttk.Scrollbar(details_frame, orient=tk.VERTICAL, command=details_text.yview)
         details_text.configure(yscrollcommand=details_scrollbar.set)
         
@@ -1392,11 +2105,23 @@ Columns Mapped: {stats['total_columns_mapped']}"""
         def on_history_select(event):
             selection = history_tree.selection()
             if selection:
-                selected_group = history_records[selection[0]]
+                selected_group = history_index.read_session(history_records[selection[0]])
                 details_text.delete(1.0, tk.END)
                 details_text.insert(tk.END, "Column Mappings:\n")
-                for _, row in selected_group.iterrows():
-                    details_text.insert(tk.END, f"• {row['Destination_Column']} ← {row['Source_Column']}\n")
+                transforms = get_history_transforms(selected_group)
+                lines = [
+                    f"• {dest_col} ← {source_col}" + (f"  [{transforms[dest_col]}]" if dest_col in transforms else "")
+                    for dest_col, source_col in zip(selected_group['Destination_Column'], selected_group['Source_Column'])
+                ]
+                details_text.insert(tk.END, "\n".join(lines) + "\n")
+                row_filter = get_history_row_filter(selected_group)
+                if row_filter:
+                    details_text.insert(tk.END, f"\nRow Filter: {row_filter}\n")
+                _, _, skipped = ranking['matcher'].resolve(
+                    dict(zip(selected_group['Destination_Column'], selected_group['Source_Column']))
+                )
+                if skipped:
+                    details_text.insert(tk.END, f"\nNot available in the loaded files: {', '.join(skipped)}\n")
         
         history_tree.bind('<<TreeviewSelect>>', on_history_select)
         
@@ -1410,53 +2135,320 @@ Columns Mapped: {stats['total_columns_mapped']}"""
                 messagebox.showwarning("No Selection", "Please select a mapping configuration.")
                 return
             
-            selected_group = history_records[selection[0]]
-            
-            # Check compatibility
-            missing_source = []
-            missing_dest = []
+            selected_group = history_index.read_session(history_records[selection[0]])
+            mappings = dict(zip(selected_group['Destination_Column'], selected_group['Source_Column']))
+            usable, _, skipped = ranking['matcher'].resolve(mappings)
+            row_filter = get_history_row_filter(selected_group)
+            filter_skipped = bool(row_filter) and ranking['matcher'].resolve_row_filter(row_filter) is None
             
-            for _, row in selected_group.iterrows():
-                if row['Source_Column'] not in self.source_headers:
-                    missing_source.append(row['Source_Column'])
-                if row['Destination_Column'] not in self.destination_headers:
-                    missing_dest.append(row['Destination_Column'])
-            
-            if missing_source or missing_dest:
-                error_msg = "Cannot load this mapping:\n\n"
-                if missing_source:
-                    error_msg += f"Missing source columns: {', '.join(set(missing_source))}\n"
-                if missing_dest:
-                    error_msg += f"Missing destination columns: {', '.join(set(missing_dest))}\n"
-                messagebox.showerror("Incompatible Mapping", error_msg)
+            # Check compatibility; a partial match can still be applied for the columns it covers
+            if not usable:
+                messagebox.showerror("Incompatible Mapping", self.get_incompatibility_message(skipped))
+                return
+            if (skipped or filter_skipped) and not messagebox.askyesno(
+                "Partially Compatible Mapping",
+                f"{len(usable)} of {len(mappings)} mappings fit the loaded files.\n\n"
+                + (f"Skipped destination columns: {', '.join(skipped)}\n" if skipped else "")
+                + (f"Skipped row filter: {row_filter}\n" if filter_skipped else "")
+                + "\nApply the matching mappings and skip the rest?"
+            ):
                 return
             
             # Apply mappings
-            self.apply_mappings_from_history(selected_group)
+            self.apply_mappings_from_history(selected_group, ranking['matcher'])
             dialog.destroy()
-            messagebox.showinfo("Success", f"Loaded {len(selected_group)} column mappings from history.")
+            messagebox.showinfo("Success", f"Loaded {len(usable)} column mappings from history.")
         
         ttk.Button(button_frame, text="Load Selected", command=load_selected, style='Primary.TButton').pack(side=tk.RIGHT, padx=(5, 0))
         ttk.Button(button_frame, text="Cancel", command=dialog.destroy, style='Secondary.TButton').pack(side=tk.RIGHT)
     
-    def apply_mappings_from_history(self, mappings_group: pd.DataFrame):
-        """Apply mappings from history to current interface"""
+    def get_incompatibility_message(self, mappings: Dict[str, str]) -> Optional[str]:
+        """Explain why saved mappings don't fit the loaded files (None when they do)"""
+        missing_source = []
+        missing_dest = []
+        
+        for dest_col, source_col in mappings.items():
+            try:
+                referenced = get_referenced_columns(source_col)
+            except ValueError:
+                referenced = [source_col]
+            missing_source.extend(column for column in referenced if column not in self.source_headers)
+            if dest_col not in self.destination_headers:
+                missing_dest.append(dest_col)
+        
+        if not (missing_source or missing_dest):
+            return None
+        error_msg = "Cannot load this mapping:\n\n"
+        if missing_source:
+            error_msg += f"Missing source columns: {', '.join(set(missing_source))}\n"
+        if missing_dest:
+            error_msg += f"Missing destination columns: {', '.join(set(missing_dest))}\n"
+        return error_msg
+    
+    def apply_mappings_from_history(self, mappings_group: pd.DataFrame, matcher: HeaderMatcher):
+        """Apply the mappings from history that fit the loaded files to current interface"""
+        usable, transforms, _ = matcher.resolve(
+            dict(zip(mappings_group['Destination_Column'], mappings_group['Source_Column'])),
+            get_history_transforms(mappings_group)
+        )
+        self.apply_mapping_spec(usable, transforms, matcher.resolve_row_filter(get_history_row_filter(mappings_group)))
+        self.update_status(f"Loaded {len(self.column_mappings)} column mappings from history")
+    
+    def apply_mapping_spec(self, mappings: Dict[str, str], transforms: Optional[Dict[str, str]] = None,
+                           row_filter: Optional[str] = None):
+        """Show saved mappings, transform chains and row filter in the interface"""
         self.clear_mappings()
+        transforms = transforms or {}
         
-        for _, row in mappings_group.iterrows():
-            source_col = row['Source_Column']
-            dest_col = row['Destination_Column']
-            
+        for dest_col, source_col in mappings.items():
             if dest_col in self.mapping_combos:
                 combo = self.mapping_combos[dest_col]
                 combo.set(source_col)
                 
                 self.column_mappings[dest_col] = source_col
                 self.update_source_tree_mapping(source_col, dest_col, True)
+                
+                if dest_col in transforms:
+                    self.transform_vars[dest_col].set(transforms[dest_col])
+                    self.mapping_transforms[dest_col] = transforms[dest_col]
         
-        mappings_count = len(self.column_mappings)
-        self.update_status(f"Loaded {mappings_count} column mappings from history")
+        self.row_filter_var.set(row_filter or "")
         self.update_preview()
+    
+    def save_profile(self):
+        """Save the current mappings as a named profile"""
+        if not self.column_mappings:
+            messagebox.showwarning("Warning", "No column mappings configured")
+            return
+        try:
+            plan = self.get_mapping_plan(dict(self.column_mappings))
+        except ValueError as e:
+            messagebox.showwarning("Invalid Transform", str(e))
+            return
+        
+        template_path = self.destination_file_path.get()
+        name = simpledialog.askstring(
+            "Save Mapping Profile", "Profile name:", parent=self.root, initialvalue=get_input_stem(template_path)
+        )
+        if not name or not name.strip():
+            return
+        name = name.strip()
+        if name in self.profile_store.load_index() and not messagebox.askyesno(
+            "Replace Profile", f"A profile named '{name}' already exists. Replace it?"
+        ):
+            return
+        
+        try:
+            self.profile_store.save(
+                name, plan.mappings, self.destination_headers, plan.transforms, plan.row_filter, get_input_name(template_path)
+            )
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save profile:\n{str(e)}")
+            return
+        self.update_status(f"Saved {len(plan.mappings)} column mappings as profile '{name}'")
+    
+    def load_profile(self):
+        """Pick a saved mapping profile and apply it"""
+        try:
+            profiles = self.profile_store.list_profiles(self.destination_headers)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to read profiles:\n{str(e)}")
+            return
+        if not profiles:
+            messagebox.showinfo("No Profiles", "No mapping profiles saved yet. Use 'Save Profile...' first.")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Load Mapping Profile")
+        dialog.geometry("640x400")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        main_frame = ttk.Frame(dialog, padding="20")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.columnconfigure(0, weight=1)
+        main_frame.rowconfigure(1, weight=1)
+        
+        ttk.Label(
+            main_frame,
+            text="Select a profile to load (✓ = saved for this template's columns):",
+            style='Subheading.TLabel'
+        ).grid(row=0, column=0, sticky=tk.W, pady=(0, 10))
+        
+        columns = ('name', 'template', 'mappings_count', 'saved_at')
+        profile_tree = ttk.Treeview(main_frame, columns=columns, show='headings', style='Modern.Treeview')
+        for column, heading, width in [('name', 'Profile', 200), ('template', 'Template', 180),
+                                       ('mappings_count', 'Mappings', 80), ('saved_at', 'Saved', 140)]:
+            profile_tree.heading(column, text=heading)
+            profile_tree.column(column, width=width)
+        profile_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        
+        profile_names = {}
+        for profile in profiles:
+            mark = "✓ " if profile['matches_template'] else ""
+            item = profile_tree.insert('', 'end', values=(
+                f"{mark}{profile['name']}", profile.get('template') or "", profile['mappings_count'],
+                profile.get('saved_at') or ""
+            ))
+            profile_names[item] = profile['name']
+        
+        def load_selected():
+            selection = profile_tree.selection()
+            if not selection:
+                messagebox.showwarning("No Selection", "Please select a profile.")
+                return
+            name = profile_names[selection[0]]
+            try:
+                profile = self.profile_store.load(name)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to load profile:\n{str(e)}")
+                return
+            
+            error_msg = self.get_incompatibility_message(profile['mappings'])
+            if error_msg:
+                messagebox.showerror("Incompatible Mapping", error_msg)
+                return
+            
+            self.apply_mapping_spec(profile['mappings'], profile['transforms'], profile['row_filter'])
+            dialog.destroy()
+            self.update_status(f"Loaded {len(self.column_mappings)} column mappings from profile '{name}'")
+        
+        def delete_selected():
+            selection = profile_tree.selection()
+            if not selection:
+                return
+            name = profile_names.pop(selection[0])
+            if messagebox.askyesno("Delete Profile", f"Delete profile '{name}'?", parent=dialog):
+                self.profile_store.delete(name)
+                profile_tree.delete(selection[0])
+            else:
+                profile_names[selection[0]] = name
+        
+        profile_tree.bind('<Double-1>', lambda event: load_selected())
+        
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=2, column=0, sticky=tk.E)
+        ttk.Button(button_frame, text="Load Selected", command=load_selected, style='Primary.TButton').pack(side=tk.RIGHT, padx=(5, 0))
+        ttk.Button(button_frame, text="Delete", command=delete_selected, style='Danger.TButton').pack(side=tk.RIGHT, padx=(5, 0))
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy, style='Secondary.TButton').pack(side=tk.RIGHT)
+
+def load_run_spec(args: argparse.Namespace) -> Dict[str, Any]:
+    """Get the mappings, transforms and row filter for a headless run from a profile, mapping file or history"""
+    if args.profile:
+        spec = ProfileStore().load(args.profile)
+        template_headers = next(iter_file_chunks(Path(args.template), chunk_rows=1)).columns.tolist()
+        if spec.get('header_signature') != get_header_signature(template_headers):
+            print(f"Warning: Profile '{args.profile}' was saved for a different template header row")
+        return spec
+    if args.mapping_file:
+        return load_mapping_spec(Path(args.mapping_file))
+    return load_history_session(args.history_session, get_input_name(args.template))
+
+def run_watch_daemon(args: argparse.Namespace) -> int:
+    """Start the watch-folder daemon from command line arguments"""
+    Config.ensure_directories()
+    
+    try:
+        spec = load_run_spec(args)
+        
+        daemon = WatchFolderDaemon(
+            spec['mappings'],
+            Path(args.template),
+            watch_dir=Path(args.watch_dir),
+            output_dir=Path(args.output_dir),
+            output_format=args.format,
+            max_workers=args.workers or Config.WATCH_MAX_WORKERS,
+            settle_seconds=args.settle,
+            transforms=spec['transforms'],
+            row_filter=spec['row_filter']
+        )
+    except Exception as e:
+        print(f"Error: Could not start watch mode: {e}")
+        return 1
+    
+    daemon.run(poll_seconds=args.interval)
+    return 0
+
+def run_incremental_refresh(args: argparse.Namespace) -> int:
+    """Append the rows added to a source file since the last refresh to an output (headless)"""
+    Config.ensure_directories()
+    
+    try:
+        spec = load_run_spec(args)
+        
+        destination_df = read_data_file(Path(args.template))
+        result = IncrementalTransfer(cast_policy=Config.UNATTENDED_CAST_ERROR_POLICY).run(
+            Path(args.refresh), destination_df, spec['mappings'], Path(args.output),
+            transforms=spec['transforms'], row_filter=spec['row_filter'],
+            schema=DestinationSchema.from_template(destination_df, Path(args.template))
+        )
+    except Exception as e:
+        print(f"Error: Incremental refresh failed: {e}")
+        return 1
+    
+    for line in describe_violations(result['violations']):
+        print(f"Warning: {line}")
+    print(f"{result['mode']} ({result['read_mode']}): {result['rows_appended']} rows written to {args.output}")
+    return 0
+
+def run_history_compaction(args: argparse.Namespace) -> int:
+    """Compact the mapping history now, whatever the automatic policy says (headless)"""
+    try:
+        stats = HistoryCompactor().run()
+    except Exception as e:
+        print(f"Error: History compaction failed: {e}")
+        return 1
+    print(describe_compaction(stats))
+    return 0
+
+def run_http_service(args: argparse.Namespace) -> int:
+    """Serve uploads, header inspection and mapping jobs over HTTP (headless)"""
+    Config.ensure_directories()
+    
+    try:
+        from app.service import run_service
+    except ImportError as e:
+        print(f"Error: Service mode needs bottle (pip install -r requirements.txt): {e}")
+        return 1
+    
+    run_service(args.host, args.port, args.workers)
+    return 0
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description=Config.WINDOW_TITLE)
+    parser.add_argument("--watch", action="store_true",
+                        help="Run headless, transforming every file that lands in the source folder")
+    parser.add_argument("--refresh", metavar="SOURCE",
+                        help="Run headless, appending rows added to SOURCE since the last refresh to --output")
+    parser.add_argument("--output", help="Output file updated by --refresh")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run headless as an HTTP service for uploads and mapping jobs")
+    parser.add_argument("--host", default=Config.SERVICE_HOST, help="Address the --serve service listens on")
+    parser.add_argument("--port", type=int, default=Config.SERVICE_PORT, help="Port the --serve service listens on")
+    parser.add_argument("--compact-history", action="store_true",
+                        help="Merge repeated history sessions, archive old ones and delete expired ones, then exit")
+    parser.add_argument("--template", help="Destination template file (required with --watch and --refresh)")
+    parser.add_argument("--mapping-file", help="JSON file with {destination: source} column mappings")
+    parser.add_argument("--profile", help="Name of a saved mapping profile to use")
+    parser.add_argument("--history-session",
+                        help="Timestamp of the history session to use (default: latest for the template)")
+    parser.add_argument("--watch-dir", default=str(Config.SOURCE_FILES_DIR), help="Folder to watch")
+    parser.add_argument("--output-dir", default=str(Config.OUTPUT_DIR), help="Folder for transformed files")
+    parser.add_argument("--format", default="xlsx", choices=list(OUTPUT_WRITERS),
+                        help="Output file format (parquet and feather need pyarrow)")
+    parser.add_argument("--workers", type=int,
+                        help=f"Worker processes (default: {Config.WATCH_MAX_WORKERS} for --watch, one per CPU for --serve)")
+    parser.add_argument("--interval", type=float, default=Config.WATCH_POLL_SECONDS, help="Seconds between scans")
+    parser.add_argument("--settle", type=float, default=Config.WATCH_SETTLE_SECONDS,
+                        help="Seconds a file must stay unchanged before it is processed")
+    
+    args = parser.parse_args(argv)
+    if args.watch and not args.template:
+        parser.error("--watch requires --template")
+    if args.refresh and not (args.template and args.output):
+        parser.error("--refresh requires --template and --output")
+    return args
 
 def create_asset_files():
     """Create logo and favicon files for the application"""
@@ -1486,8 +2478,18 @@ def create_asset_files():
         with open(Config.FAVICON_FILE.with_suffix('.txt'), 'w') as f:
             f.write(favicon_content)
 
-def main():
+def main(argv: Optional[List[str]] = None):
     """Main application entry point"""
+    args = parse_arguments(argv)
+    if args.watch:
+        sys.exit(run_watch_daemon(args))
+    if args.refresh:
+        sys.exit(run_incremental_refresh(args))
+    if args.compact_history:
+        sys.exit(run_history_compaction(args))
+    if args.serve:
+        sys.exit(run_http_service(args))
+    
     # Create asset files if they don't exist
     create_asset_files()
     
@@ -1497,8 +2499,12 @@ def main():
     # Create application
     app = ExcelColumnMapper(root)
     
+    # Compact the history once the window is up; not a daemon, so exiting never cuts a compaction short
+    root.after_idle(lambda: threading.Thread(target=compact_history_if_due, name="history-compaction").start())
+    
     # Set up proper window closing
     def on_closing():
+        app.prefetcher.shutdown()
         root.quit()
         root.destroy()
     
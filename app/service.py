@@ -0,0 +1,395 @@
+"""
+Excel Column Mapper HTTP service
+Upload files, inspect their headers and run mapping jobs over HTTP on localhost, so several people can share
+one machine. Jobs run on a bounded process pool fed by a bounded queue; requests only ever queue or report work.
+
+Author: Open Source Community
+License: MIT
+Version: 2.0.0
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from typing import Any, Dict, List, Optional, Tuple
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import bottle
+
+from app.engine import (
+    Config, MappingSession, ProfileStore, HeaderMatcher, WATCH_FILE_SUFFIXES, OUTPUT_WRITERS,
+    ARCHIVE_MEMBER_SEPARATOR, iter_file_chunks, list_archive_members, split_archive_path, get_input_stem,
+    get_input_name, parse_mapping_spec, save_mapped_data, append_mapping_history
+)
+
+FILE_ID = re.compile(r'[0-9a-f]{32}$')
+OUTPUT_FORMATS = tuple(OUTPUT_WRITERS)
+
+def run_job(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one mapping job: load, map, transfer (worker process)"""
+    session = MappingSession().load(Path(spec['source_path']), Path(spec['template_path']))
+    for destination, source in spec['mappings'].items():
+        session.map(destination, source, spec['transforms'].get(destination))
+    session.row_filter = spec['row_filter']
+
+    result_df, summary = session.prepare(spec['key_column'])
+    save_mapped_data(result_df, Path(spec['output_path']))
+    summary['rows'] = len(result_df)
+    return summary
+
+class JobQueue:
+    """Runs mapping jobs on a bounded process pool; jobs wait in a bounded queue until a worker is free"""
+
+    PUBLIC_FIELDS = ('id', 'status', 'source', 'template', 'output', 'submitted_at', 'started_at', 'finished_at',
+                     'rows', 'updated', 'inserted', 'violations', 'error')
+
+    def __init__(self, max_workers: Optional[int] = None, max_queued: Optional[int] = None,
+                 output_dir: Optional[Path] = None):
+        self.max_workers = max_workers or Config.SERVICE_MAX_WORKERS or os.cpu_count() or 1
+        self.output_dir = Path(output_dir or Config.SERVICE_DIR / "output")
+        self.pending: queue.Queue = queue.Queue(maxsize=max_queued or Config.SERVICE_MAX_QUEUED)
+        self.slots = threading.Semaphore(self.max_workers)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.executor = None
+        self.dispatcher: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the worker processes and the thread handing them queued jobs"""
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        self.dispatcher = threading.Thread(target=self.dispatch, name="job-dispatcher", daemon=True)
+        self.dispatcher.start()
+
+    def shutdown(self):
+        """Stop taking jobs, let running ones finish and drop those still queued"""
+        self.stopping.set()
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a job (raises queue.Full when the queue is at capacity)"""
+        job_id = uuid.uuid4().hex
+        output_name = f"{get_input_stem(spec['template_name'])}_{job_id[:8]}.{spec['format']}"
+        spec = dict(spec, output_path=str(self.output_dir / f"{job_id}.{spec['format']}"))
+        job = {
+            'id': job_id, 'status': 'queued', 'source': spec['source_name'], 'template': spec['template_name'],
+            'output': output_name, 'submitted_at': datetime.now().isoformat(timespec='seconds'), 'spec': spec
+        }
+        with self.lock:
+            self.pending.put_nowait(job_id)
+            self.jobs[job_id] = job
+        return self.get(job_id)
+
+    def dispatch(self):
+        """Hand queued jobs to the pool, one per free worker (dispatcher thread)"""
+        while not self.stopping.is_set():
+            try:
+                job_id = self.pending.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            while not self.slots.acquire(timeout=0.2):
+                if self.stopping.is_set():
+                    return
+
+            with self.lock:
+                job = self.jobs[job_id]
+                job['status'] = 'running'
+                job['started_at'] = datetime.now().isoformat(timespec='seconds')
+            try:
+                future = self.executor.submit(run_job, job['spec'])
+            except Exception as e:
+                # A broken pool fails the job rather than the dispatcher
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(partial(self.finish, job_id))
+
+    def finish(self, job_id: str, future: Future):
+        """Record a job's result and free its worker"""
+        self.slots.release()
+        with self.lock:
+            job = self.jobs[job_id]
+            job['finished_at'] = datetime.now().isoformat(timespec='seconds')
+            try:
+                summary = future.result()
+            except Exception as e:
+                job.update({'status': 'failed', 'error': str(e) or e.__class__.__name__})
+                return
+            job.update({'status': 'done', **summary})
+
+            # Written here rather than in the workers, so concurrent jobs never interleave history rows
+            spec = job['spec']
+            try:
+                append_mapping_history(spec['mappings'], spec['source_name'], spec['template_name'], job['output'],
+                                       spec['transforms'], spec['row_filter'])
+            except Exception as e:
+                print(f"Warning: Could not save mapping history: {e}")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's status, or None for an unknown job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return {field: job[field] for field in self.PUBLIC_FIELDS if field in job} if job else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Get every job's status, newest first"""
+        with self.lock:
+            job_ids = list(self.jobs)
+        return [self.get(job_id) for job_id in reversed(job_ids)]
+
+    def get_output_path(self, job_id: str) -> Optional[Path]:
+        """Get the output file of a finished job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return Path(job['spec']['output_path']) if job and job['status'] == 'done' else None
+
+def json_error(status: int, message: str) -> bottle.HTTPResponse:
+    """Build a JSON error response"""
+    return bottle.HTTPResponse(json.dumps({'error': message}), status=status,
+                               headers={'Content-Type': 'application/json'})
+
+def read_file_headers(file_path: Path, sample_rows: int = 0) -> Tuple[List[str], List[List[str]]]:
+    """Read a file's header row and its first few rows as text, without reading the rest"""
+    first_chunk = next(iter_file_chunks(file_path, chunk_rows=max(sample_rows, 1)))
+    sample = first_chunk.head(sample_rows).fillna('').astype(str).values.tolist()
+    return [str(header) for header in first_chunk.columns], sample
+
+def create_app(jobs: JobQueue, upload_dir: Optional[Path] = None) -> bottle.Bottle:
+    """Build the web application: uploads, header inspection, job submission and job status"""
+    upload_dir = Path(upload_dir or Config.SERVICE_DIR / "uploads")
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    app = bottle.Bottle()
+
+    def get_upload_path(file_id: str) -> Path:
+        """Find an uploaded file by id"""
+        folder = upload_dir / file_id
+        files = list(folder.iterdir()) if FILE_ID.match(file_id) and folder.is_dir() else []
+        if len(files) != 1:
+            raise json_error(404, f"No uploaded file with id '{file_id}'")
+        return files[0]
+
+    def get_input_path(file_id: str, member: Optional[str] = None) -> Path:
+        """Find an uploaded file by id, or a data file inside an uploaded zip archive"""
+        file_path = get_upload_path(file_id)
+        return Path(f"{file_path}{ARCHIVE_MEMBER_SEPARATOR}{member}") if member else file_path
+
+    @app.post('/files')
+    def upload_file():
+        upload = bottle.request.files.get('file')
+        if upload is None:
+            raise json_error(400, "Send the file as multipart form field 'file'")
+        if not upload.filename.lower().endswith(WATCH_FILE_SUFFIXES):
+            raise json_error(400, f"Only {', '.join(WATCH_FILE_SUFFIXES)} files can be mapped")
+
+        file_id = uuid.uuid4().hex
+        (upload_dir / file_id).mkdir()
+        upload.save(str(upload_dir / file_id / upload.filename))
+        return {'file_id': file_id, 'name': upload.filename}
+
+    @app.get('/files/<file_id>/headers')
+    def get_headers(file_id: str):
+        file_path = get_input_path(file_id, bottle.request.query.get('member'))
+        try:
+            sample_rows = min(int(bottle.request.query.get('sample', 5)), 100)
+            headers, sample = read_file_headers(file_path, sample_rows)
+        except Exception as e:
+            raise json_error(400, f"Could not read {get_input_name(file_path)}: {e}")
+        result = {'file_id': file_id, 'name': get_input_name(file_path), 'headers': headers, 'sample': sample}
+        archive_path, _ = split_archive_path(file_path)
+        if archive_path.name.lower().endswith('.zip'):
+            result['members'] = list_archive_members(archive_path)
+        return result
+
+    @app.post('/jobs')
+    def submit_job():
+        body = bottle.request.json
+        if not isinstance(body, dict):
+            raise json_error(400, "Send the job as a JSON object")
+
+        source_path = get_input_path(str(body.get('source', '')), body.get('source_member'))
+        template_path = get_input_path(str(body.get('template', '')), body.get('template_member'))
+        try:
+            if body.get('profile'):
+                spec = ProfileStore().load(body['profile'])
+            else:
+                spec = parse_mapping_spec({key: body.get(key) for key in ('mappings', 'transforms', 'row_filter')},
+                                          "The job")
+
+            # Refuse jobs that can't run now, rather than failing them later in a worker
+            source_headers, _ = read_file_headers(source_path)
+            template_headers, _ = read_file_headers(template_path)
+            _, _, skipped = HeaderMatcher(source_headers, template_headers).resolve(spec['mappings'])
+            if skipped:
+                raise ValueError(f"Mappings don't fit the uploaded files: {', '.join(skipped)}")
+            key_column = body.get('key_column') or None
+            if key_column and key_column not in spec['mappings']:
+                raise ValueError(f"Map a source column to '{key_column}' to match rows on it")
+            output_format = body.get('format', 'xlsx')
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError(f"format must be one of {', '.join(OUTPUT_FORMATS)}")
+        except ValueError as e:
+            raise json_error(400, str(e))
+
+        try:
+            job = jobs.submit({
+                'source_path': str(source_path), 'source_name': get_input_name(source_path),
+                'template_path': str(template_path), 'template_name': get_input_name(template_path),
+                'mappings': spec['mappings'], 'transforms': spec.get('transforms') or {},
+                'row_filter': spec.get('row_filter'), 'key_column': key_column, 'format': output_format
+            })
+        except queue.Full:
+            raise json_error(503, "Too many jobs are waiting; try again shortly")
+        bottle.response.status = 202
+        return job
+
+    @app.get('/jobs')
+    def list_jobs():
+        return {'jobs': jobs.list_jobs()}
+
+    @app.get('/jobs/<job_id>')
+    def get_job(job_id: str):
+        job = jobs.get(job_id)
+        if job is None:
+            raise json_error(404, f"No job with id '{job_id}'")
+        return job
+
+    @app.get('/jobs/<job_id>/output')
+    def download_output(job_id: str):
+        output_path = jobs.get_output_path(job_id)
+        if output_path is None:
+            raise json_error(404, f"Job '{job_id}' has no output (yet)")
+        return bottle.static_file(output_path.name, root=str(output_path.parent), download=jobs.get(job_id)['output'])
+
+    return app
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """WSGI server handling each request on its own thread, so a slow upload never holds up status polls"""
+
+    daemon_threads = True
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler that doesn't log every status poll"""
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+def create_server(jobs: JobQueue, host: Optional[str] = None, port: Optional[int] = None,
+                  upload_dir: Optional[Path] = None) -> ThreadingWSGIServer:
+    """Bind the service to a local address (port 0 picks a free one)"""
+    host = Config.SERVICE_HOST if host is None else host
+    port = Config.SERVICE_PORT if port is None else port
+    return make_server(host, port, create_app(jobs, upload_dir), ThreadingWSGIServer, QuietRequestHandler)
+
+def run_service(host: Optional[str] = None, port: Optional[int] = None, max_workers: Optional[int] = None):
+    """Serve until interrupted"""
+    jobs = JobQueue(max_workers)
+    jobs.start()
+    server = create_server(jobs, host, port)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_port} "
+          f"with {jobs.max_workers} workers (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        server.server_close()
+        jobs.shutdown()
+
+class ServiceError(Exception):
+    """An error response from the service"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+class ServiceClient:
+    """Small client for the service, for scripts and tests"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                content_type: Optional[str] = None) -> bytes:
+        """Send a request and return the response body (raises ServiceError for error responses)"""
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            payload = e.read()
+            try:
+                message = json.loads(payload)['error']
+            except (ValueError, KeyError, TypeError):
+                message = payload.decode('utf-8', 'replace')
+            raise ServiceError(e.code, message)
+
+    def request_json(self, method: str, path: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send JSON (if any) and decode the JSON response"""
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        return json.loads(self.request(method, path, body, 'application/json' if body else None))
+
+    def upload(self, file_path: Path) -> str:
+        """Upload a file; returns its file id"""
+        file_path = Path(file_path)
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_path.name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8') + file_path.read_bytes() + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        response = self.request('POST', '/files', body, f'multipart/form-data; boundary={boundary}')
+        return json.loads(response)['file_id']
+
+    def get_headers(self, file_id: str, sample: int = 5, member: Optional[str] = None) -> Dict[str, Any]:
+        """Get an uploaded file's (or zip member's) headers and first rows"""
+        query = f'&member={urllib.parse.quote(member)}' if member else ''
+        return self.request_json('GET', f'/files/{file_id}/headers?sample={sample}{query}')
+
+    def submit(self, source: str, template: str, mappings: Optional[Dict[str, str]] = None, **options) -> Dict[str, Any]:
+        """Submit a job (options: transforms, row_filter, key_column, format, profile, source_member, template_member)"""
+        return self.request_json('POST', '/jobs', {'source': source, 'template': template, 'mappings': mappings,
+                                                   **options})
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """Get a job's status"""
+        return self.request_json('GET', f'/jobs/{job_id}')
+
+    def wait(self, job_id: str, timeout: float = 60.0, poll_seconds: float = 0.2) -> Dict[str, Any]:
+        """Poll a job until it is done or failed"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job['status'] in ('done', 'failed'):
+                return job
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} still {job['status']} after {timeout}s")
+            time.sleep(poll_seconds)
+
+    def download(self, job_id: str, save_path: Path) -> Path:
+        """Save a finished job's output file"""
+        save_path = Path(save_path)
+        save_path.write_bytes(self.request('GET', f'/jobs/{job_id}/output'))
+        return save_path
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Output Writer Benchmark for ExcelColumnMapper
+Compares write time and file size of every registered output format on typical output sizes
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.engine import Config, OUTPUT_WRITERS, write_output_file
+
+# Typical mapped outputs run from a few thousand to a few hundred thousand rows
+DEFAULT_ROWS = [10_000, 100_000]
+
+
+def make_output_frame(rows: int) -> pd.DataFrame:
+    """Build an output table shaped like a typical transfer: ids, codes, names, amounts, dates and flags"""
+    rng = np.random.default_rng(42)
+    regions = np.array(['North', 'South', 'East', 'West'])
+    quantities = pd.array(rng.integers(1, 500, rows), dtype='Int64')
+    quantities[rng.random(rows) < 0.05] = pd.NA
+    return pd.DataFrame({
+        'Order_ID': np.arange(1, rows + 1),
+        'SKU': [f"SKU-{code:05d}" for code in rng.integers(0, 20_000, rows)],
+        'Customer': [f"Customer {code}" for code in rng.integers(0, 5_000, rows)],
+        'Region': regions[rng.integers(0, len(regions), rows)],
+        'Quantity': quantities,
+        'Unit_Price': rng.random(rows).round(4) * 100,
+        'Total': rng.random(rows).round(2) * 10_000,
+        'Order_Date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+        'Shipped': rng.random(rows) < 0.8,
+        'Notes': np.where(rng.random(rows) < 0.9, None, 'Rush order')
+    })
+
+
+def write_with_pandas(df: pd.DataFrame, path: Path):
+    """The writer used before the registry: pandas to_excel through openpyxl"""
+    df.to_excel(path, index=False)
+
+
+def get_writers() -> list:
+    """Get (label, suffix, write function) for every format, with both XLSX engines and the old pandas writer"""
+    writers = [("xlsx (pandas to_excel)", ".xlsx", write_with_pandas)]
+    for name, writer_class in OUTPUT_WRITERS.items():
+        if name != "xlsx":
+            writers.append((name, writer_class.suffix, partial(write_with_engine, engine="auto")))
+            continue
+        if is_installed("xlsxwriter"):
+            writers.append(("xlsx (xlsxwriter)", ".xlsx", partial(write_with_engine, engine="auto")))
+        writers.append(("xlsx (openpyxl write-only)", ".xlsx", partial(write_with_engine, engine="openpyxl")))
+    return writers
+
+
+def write_with_engine(df: pd.DataFrame, path: Path, engine: str):
+    """Write through the registered writer, choosing the XLSX engine"""
+    Config.XLSX_ENGINE = engine
+    try:
+        write_output_file(df, path)
+    finally:
+        Config.XLSX_ENGINE = "auto"
+
+
+def is_installed(module_name: str) -> bool:
+    """Whether an optional module can be imported"""
+    try:
+        __import__(module_name)
+        return True
+    except ImportError:
+        return False
+
+
+def measure(write, df: pd.DataFrame, path: Path, memory: bool) -> dict:
+    """Write once and return the time, file size and (optionally) peak Python memory"""
+    started = time.perf_counter()
+    write(df, path)
+    seconds = time.perf_counter() - started
+    result = {'seconds': seconds, 'size': path.stat().st_size, 'peak': None}
+
+    if memory:
+        # Measured in a second run, as tracing allocations slows the writers down
+        path.unlink()
+        tracemalloc.start()
+        write(df, path)
+        result['peak'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    path.unlink()
+    return result
+
+
+def main():
+    """Run the benchmark and print one table per output size"""
+    parser = argparse.ArgumentParser(description="Compare output writers")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="Output sizes to write")
+    parser.add_argument("--memory", action="store_true", help="Also measure peak Python memory (slower)")
+    args = parser.parse_args()
+
+    temp_dir = Path(tempfile.mkdtemp())
+    try:
+        for rows in args.rows:
+            df = make_output_frame(rows)
+            print(f"\n📊 {rows:,} rows x {len(df.columns)} columns")
+            print(f"{'Format':<28}{'Seconds':>10}{'Size (MB)':>12}" + (f"{'Peak (MB)':>12}" if args.memory else ""))
+            for label, suffix, write in get_writers():
+                try:
+                    result = measure(write, df, temp_dir / f"output{suffix}", args.memory)
+                except ValueError as e:
+                    print(f"{label:<28}skipped: {e}")
+                    continue
+                line = f"{label:<28}{result['seconds']:>10.2f}{result['size'] / 1e6:>12.2f}"
+                if args.memory:
+                    line += f"{result['peak'] / 1e6:>12.1f}"
+                print(line)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Unit Tests for the Excel Column Mapper engine
+Exercises the Tk-free API (load, map, transfer, save history) without any window or mocks
+"""
+
+import unittest
+from unittest.mock import patch
+import subprocess
+import tempfile
+import shutil
+from pathlib import Path
+import sys
+import time
+import zipfile
+
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.engine import (
+    MappingSession, MappingPlan, HistoryIndex, HeaderIndex, load_history_session, prepare_mapped_data,
+    read_input_file, expand_archive_paths, get_input_stem, process_source_file
+)
+
+
+class TestEngineImport(unittest.TestCase):
+    """Test suite for importing the engine on its own"""
+
+    def test_engine_does_not_load_tkinter(self):
+        """Test that the engine can be imported without tkinter (or pandas until data is read)"""
+        script = (
+            "import sys; import app.engine; "
+            "print('tkinter' in sys.modules, 'pandas' in sys.modules)"
+        )
+        completed = subprocess.run(
+            [sys.executable, "-c", script], cwd=str(PROJECT_ROOT), capture_output=True, text=True, check=True
+        )
+        self.assertEqual(completed.stdout.split(), ['False', 'False'])
+
+    def test_history_compaction_check_does_not_load_pandas(self):
+        """Test that checking at launch whether the history is due for compaction leaves pandas unloaded"""
+        temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        history_file = temp_dir / 'history.csv'
+        history_file.write_text("Timestamp,Destination_Column\n2020-01-05 10:00:00,Customer\n", encoding='utf-8')
+        script = (
+            "import sys; from app.engine import HistoryCompactor; "
+            "policy = {'auto_compact': True, 'compact_bytes': 10**6, 'archive_days': 90, 'retention_days': 0}; "
+            f"print(HistoryCompactor({str(history_file)!r}, policy=policy).is_due(), 'pandas' in sys.modules)"
+        )
+        completed = subprocess.run(
+            [sys.executable, "-c", script], cwd=str(PROJECT_ROOT), capture_output=True, text=True, check=True
+        )
+        self.assertEqual(completed.stdout.split(), ['True', 'False'])
+
+
+class TestMappingSession(unittest.TestCase):
+    """Test suite for MappingSession"""
+
+    def setUp(self):
+        """Create source and destination files"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source_file = self.temp_dir / 'source.csv'
+        self.destination_file = self.temp_dir / 'template.csv'
+        pd.DataFrame({
+            'ID': [1, 2, 3],
+            'Name': [' ann ', 'ben', 'cy'],
+            'Qty': [2, 5, 1],
+            'Price': [1.5, 2.0, 10.0]
+        }).to_csv(self.source_file, index=False)
+        pd.DataFrame({'Key': [2, 9], 'Customer': ['old', 'keep'], 'Total': [0.0, 4.0]}).to_csv(
+            self.destination_file, index=False
+        )
+        self.history_patch = patch('app.engine.Config.HISTORY_FILE', self.temp_dir / 'history.csv')
+        self.history_patch.start()
+        self.session = MappingSession().load(self.source_file, self.destination_file)
+
+    def tearDown(self):
+        """Clean up test files"""
+        self.history_patch.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_load_reads_headers(self):
+        """Test that loading exposes both header rows"""
+        self.assertEqual(self.session.source_headers, ['ID', 'Name', 'Qty', 'Price'])
+        self.assertEqual(self.session.destination_headers, ['Key', 'Customer', 'Total'])
+        self.assertEqual(self.session.column_mappings, {})
+
+    def test_map_rejects_unknown_columns(self):
+        """Test that mappings are checked against the loaded files"""
+        with self.assertRaises(ValueError):
+            self.session.map('Missing', 'Name')
+        with self.assertRaises(ValueError):
+            self.session.map('Customer', 'Surname')
+        with self.assertRaises(ValueError):
+            self.session.map('Total', '=[Qty] * [Discount]')
+        with self.assertRaises(ValueError):
+            self.session.map('Customer', 'Name', 'shout')
+        self.assertEqual(self.session.column_mappings, {})
+
+    def test_transfer_writes_output_and_history(self):
+        """Test the whole load, map, transfer and save history flow"""
+        self.session.map('Customer', 'Name', 'trim | upper')
+        self.session.map('Total', '=[Qty] * [Price]')
+        self.session.row_filter = '[Qty] > 1'
+        output_file = self.temp_dir / 'output.csv'
+
+        summary = self.session.transfer(output_file)
+        self.session.save_history(output_file)
+
+        output = pd.read_csv(output_file)
+        self.assertEqual(output['Customer'].tolist(), ['ANN', 'BEN'])
+        self.assertEqual(output['Total'].tolist(), [3.0, 10.0])
+        self.assertEqual(summary['violations'], [])
+
+        saved = load_history_session(destination_file_name='template.csv')
+        self.assertEqual(saved['mappings'], {'Customer': 'Name', 'Total': '=[Qty] * [Price]'})
+        self.assertEqual(saved['transforms'], {'Customer': 'trim | upper'})
+        self.assertEqual(saved['row_filter'], '[Qty] > 1')
+        self.assertEqual(HistoryIndex().get_sessions()[0]['Source_File'], 'source.csv')
+
+    def test_preview_computes_only_the_window(self):
+        """Test that a preview window gets the transfer's values for just those source rows"""
+        self.session.map('Customer', 'Name', 'trim | upper')
+        self.session.map('Total', '=[Qty] * [Price]')
+        self.session.row_filter = '[Qty] > 1'
+
+        rows, summary = self.session.preview(start=1, count=2)
+        self.assertEqual(rows.index.tolist(), [2])
+        self.assertEqual(rows.columns.tolist(), ['Key', 'Customer', 'Total'])
+        self.assertEqual(rows.loc[2, 'Customer'], 'BEN')
+        self.assertEqual(rows.loc[2, 'Total'], 10.0)
+        self.assertTrue(pd.isna(rows.loc[2, 'Key']))
+        self.assertEqual((summary['first'], summary['last'], summary['total'], summary['kept']), (2, 3, 3, 1))
+
+    def test_prepare_upserts_on_key_column(self):
+        """Test that matching on a key updates existing rows and appends new ones"""
+        self.session.map('Key', 'ID')
+        self.session.map('Customer', 'Name', 'trim')
+
+        result_df, summary = self.session.prepare(key_column='Key')
+        self.assertEqual((summary['updated'], summary['inserted']), (1, 2))
+        self.assertEqual(dict(zip(result_df['Key'], result_df['Customer'])), {2: 'ben', 9: 'keep', 1: 'ann', 3: 'cy'})
+
+    def test_prepare_without_mappings_fails(self):
+        """Test that a transfer needs at least one mapping"""
+        with self.assertRaises(ValueError):
+            self.session.prepare()
+
+        self.session.map('Customer', 'Name')
+        self.session.unmap('Customer')
+        with self.assertRaises(ValueError):
+            self.session.transfer(self.temp_dir / 'output.csv')
+
+    def test_prepare_mapped_data_works_on_frames(self):
+        """Test the frame-level call used by worker threads and processes"""
+        source_df = pd.DataFrame({'Name': ['a', 'b']})
+        destination_df = pd.DataFrame({'Customer': []})
+        result_df, summary = prepare_mapped_data(source_df, destination_df, MappingPlan({'Customer': 'Name'}, {'Customer': 'upper'}))
+        self.assertEqual(result_df['Customer'].tolist(), ['A', 'B'])
+
+
+class TestHeaderIndex(unittest.TestCase):
+    """Test suite for the type-ahead header index"""
+
+    def setUp(self):
+        """Index a few headers"""
+        self.index = HeaderIndex(['Order ID', 'Customer Name', 'Name', 'Ship Date', 'Order Date', 'Surname'])
+
+    def test_prefix_matches_come_first(self):
+        """Test that names starting with the text come before names containing it, each in column order"""
+        self.assertEqual(self.index.search('name'), ['Name', 'Customer Name', 'Surname'])
+        self.assertEqual(self.index.search('ORDER'), ['Order ID', 'Order Date'])
+        self.assertEqual(self.index.search(' date'), ['Ship Date', 'Order Date'])
+        self.assertEqual(self.index.search('er d'), ['Order Date'])
+        self.assertEqual(self.index.search('zzz'), [])
+
+    def test_empty_search_and_limit(self):
+        """Test that an empty search lists the columns in order, up to the limit"""
+        self.assertEqual(self.index.search('', 2), ['Order ID', 'Customer Name'])
+        self.assertEqual(self.index.search('a', 1), ['Customer Name'])
+
+    def test_lookup_ignores_case(self):
+        """Test that a column can be found by its exact name in any case"""
+        self.assertEqual(self.index.lookup('ship date '), 'Ship Date')
+        self.assertIsNone(self.index.lookup('Ship'))
+
+    def test_search_is_fast_on_wide_files(self):
+        """Test that searching thousands of headers takes a few milliseconds per keystroke"""
+        index = HeaderIndex([f"Column {i} {'total' if i % 7 else 'price'}" for i in range(5000)])
+        started = time.perf_counter()
+        for query in ['c', 'co', 'col', 'column 4', 'price', '12 t', 'missing']:
+            index.search(query, 200)
+        self.assertLess((time.perf_counter() - started) / 7, 0.01)
+        self.assertEqual(index.search('column 48 ')[0], 'Column 48 total')
+
+
+class TestCompressedInputs(unittest.TestCase):
+    """Test suite for reading gzip files and zip archive members without extracting them"""
+
+    def setUp(self):
+        """Create a gzip CSV and a zip archive holding several data files"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.df = pd.DataFrame({'Name': ['ann', 'ben', 'cy'], 'Qty': [1, 2, 3]})
+        self.gzip_file = self.temp_dir / 'orders.csv.gz'
+        self.df.to_csv(self.gzip_file, index=False)
+
+        self.df.to_excel(self.temp_dir / 'orders.xlsx', index=False)
+        self.archive = self.temp_dir / 'bundle.zip'
+        with zipfile.ZipFile(self.archive, 'w') as archive:
+            archive.write(self.gzip_file, 'daily/orders.csv.gz')
+            archive.write(self.temp_dir / 'orders.xlsx', 'orders.xlsx')
+            archive.writestr('__MACOSX/._orders.xlsx', b'')
+
+    def tearDown(self):
+        """Clean up test files"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_gzip_and_archive_members_are_read(self):
+        """Test that gzip files and named zip members (even compressed ones) read like plain files"""
+        pd.testing.assert_frame_equal(read_input_file(self.gzip_file), self.df)
+        pd.testing.assert_frame_equal(read_input_file(f"{self.archive}::daily/orders.csv.gz"), self.df)
+        pd.testing.assert_frame_equal(read_input_file(f"{self.archive}::orders.xlsx"), self.df)
+
+        single = self.temp_dir / 'single.zip'
+        with zipfile.ZipFile(single, 'w') as archive:
+            archive.writestr('orders.csv', self.df.to_csv(index=False))
+        pd.testing.assert_frame_equal(read_input_file(single), self.df)
+
+    def test_archive_member_must_be_clear(self):
+        """Test that an archive with several data files needs a member, and the member must exist"""
+        with self.assertRaisesRegex(Exception, 'holds 2 data files'):
+            read_input_file(self.archive)
+        with self.assertRaisesRegex(Exception, 'no data file named'):
+            read_input_file(f"{self.archive}::missing.csv")
+        self.assertEqual(
+            expand_archive_paths([str(self.archive), str(self.gzip_file)]),
+            [f"{self.archive}::daily/orders.csv.gz", f"{self.archive}::orders.xlsx", str(self.gzip_file)]
+        )
+        self.assertEqual(get_input_stem(self.gzip_file), 'orders')
+        self.assertEqual(get_input_stem(f"{self.archive}::daily/orders.csv.gz"), 'orders')
+
+    def test_session_history_names_archive_members(self):
+        """Test that a session over zip members records the members' own names in the history"""
+        with patch('app.engine.Config.HISTORY_FILE', self.temp_dir / 'history.csv'):
+            session = MappingSession().load(f"{self.archive}::daily/orders.csv.gz", f"{self.archive}::orders.xlsx")
+            session.map('Qty', 'Qty')
+            session.save_history(self.temp_dir / 'orders_updated.csv')
+            self.assertEqual(HistoryIndex().get_sessions()[0]['Source_File'], 'orders.csv.gz')
+            self.assertEqual(load_history_session(destination_file_name='orders.xlsx')['mappings'], {'Qty': 'Qty'})
+
+    def test_watch_worker_streams_compressed_drops(self):
+        """Test that a compressed drop is transferred chunk by chunk over the template's own rows"""
+        output_file = self.temp_dir / 'output.csv'
+        destination_df = pd.DataFrame({'Customer': ['x', 'y', 'z', 'w'], 'Quantity': [0, 0, 0, 9]})
+        with patch('app.engine.Config.CHUNK_ROWS', 2):
+            rows, violations = process_source_file(
+                str(self.gzip_file), {'Customer': 'Name', 'Quantity': 'Qty'}, destination_df, str(output_file),
+                transforms={'Customer': 'upper'}
+            )
+
+        output = pd.read_csv(output_file)
+        self.assertEqual((rows, violations), (4, []))
+        self.assertEqual(output['Customer'].tolist(), ['ANN', 'BEN', 'CY', 'w'])
+        self.assertEqual(output['Quantity'].tolist(), [1, 2, 3, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,8 @@ import pandas as pd
 import tempfile
 import os
 import json
+import gzip
+from datetime import datetime
 from pathlib import Path
 import sys
 
@@ -30,14 +32,50 @@ def setup_imports():
 setup_imports()
 
 try:
-    from main import ExcelColumnMapper, Config, ThemeManager, StatisticsManager
+    from main import (
+        ExcelColumnMapper, Config, ThemeManager, BackgroundTask, load_run_spec, parse_arguments
+    )
+    from app.engine import (
+        StatisticsManager, PerformanceTracer,
+        CancellationToken, OperationCancelled, iter_file_chunks, write_output_file,
+        FilePrefetcher, merge_source_files,
+        FolderWatcher, WatchFolderDaemon, IncrementalTransfer, upsert_transfer_frame,
+        MappingPlan, append_mapping_history, load_history_session, load_mapping_spec,
+        ColumnExpression,
+        read_data_file,
+        DestinationSchema, build_transfer_frame, describe_cast_problems, get_schema_path,
+        ChunkValidator, describe_violations,
+        ProfileStore, get_header_signature,
+        HistoryIndex, get_history_transforms, get_history_row_filter,
+        HeaderMatcher,
+        HistoryCompactor, load_history_policy,
+        OUTPUT_WRITERS, get_output_format, append_output_rows
+    )
     IMPORT_SUCCESS = True
     print("✅ Successfully imported from main module")
 except ImportError as e:
     print(f"❌ Failed to import from main: {e}")
     try:
         sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-        from app.main import ExcelColumnMapper, Config, ThemeManager, StatisticsManager
+        from app.main import (
+            ExcelColumnMapper, Config, ThemeManager, BackgroundTask, load_run_spec, parse_arguments
+        )
+        from app.engine import (
+            StatisticsManager, PerformanceTracer,
+            CancellationToken, OperationCancelled, iter_file_chunks, write_output_file,
+            FilePrefetcher, merge_source_files,
+            FolderWatcher, WatchFolderDaemon, IncrementalTransfer, upsert_transfer_frame,
+            MappingPlan, append_mapping_history, load_history_session, load_mapping_spec,
+            ColumnExpression,
+            read_data_file,
+            DestinationSchema, build_transfer_frame, describe_cast_problems, get_schema_path,
+            ChunkValidator, describe_violations,
+            ProfileStore, get_header_signature,
+            HistoryIndex, get_history_transforms, get_history_row_filter,
+            HeaderMatcher,
+            HistoryCompactor, load_history_policy,
+            OUTPUT_WRITERS, get_output_format, append_output_rows
+        )
         IMPORT_SUCCESS = True
         print("✅ Successfully imported from app.main module")
     except ImportError as e2:
@@ -328,6 +366,63 @@ class TestExcelColumnMapper(unittest.TestCase):
             self.assertEqual(mapper.source_file_path.get(), test_file_path)
             mapper.update_status.assert_called_with('Source file selected: test_file.xlsx')
     
+    @patch('tkinter.StringVar', MockStringVar)
+    def test_cancelled_save_leaves_progress_hidden(self):
+        """Test that cancelling the save dialog doesn't leave the progress bar showing"""
+        main_module = 'main' if 'main' in sys.modules else 'app.main'
+        with patch.object(ExcelColumnMapper, 'create_widgets'), \
+             patch(f'{main_module}.ThemeManager'), \
+             patch(f'{main_module}.StatisticsManager'), \
+             patch(f'{main_module}.Config.ensure_directories'), \
+             patch('tkinter.messagebox.askyesno', return_value=True), \
+             patch('tkinter.filedialog.asksaveasfilename', return_value=''):
+            
+            mapper = ExcelColumnMapper(self.mock_root)
+            mapper.key_column_var = MockStringVar(value=mapper.MATCH_BY_POSITION)
+            mapper.incremental_var = Mock(get=Mock(return_value=False))
+            mapper.row_filter_var = MockStringVar()
+            mapper.column_mappings = {'Full_Name': 'Name'}
+            mapper.get_destination_schema = Mock(return_value=DestinationSchema())
+            mapper.show_progress = Mock()
+            mapper.update_status = Mock()
+            
+            mapper.copy_mapped_data()
+            
+            mapper.show_progress.assert_not_called()
+            mapper.update_status.assert_called_with('Save cancelled')
+    
+    @patch('tkinter.StringVar', MockStringVar)
+    def test_archive_members_are_named_by_member(self):
+        """Test that files picked inside a zip suggest outputs and record history under the member's own name"""
+        main_module = 'main' if 'main' in sys.modules else 'app.main'
+        history_file = Path(self.temp_dir) / 'history.csv'
+        with patch.object(ExcelColumnMapper, 'create_widgets'), \
+             patch(f'{main_module}.ThemeManager'), \
+             patch(f'{main_module}.StatisticsManager'), \
+             patch(f'{main_module}.Config.ensure_directories'), \
+             patch('app.engine.Config.HISTORY_FILE', history_file), \
+             patch('tkinter.messagebox.askyesno', return_value=True), \
+             patch('tkinter.filedialog.asksaveasfilename', return_value='') as ask_save:
+            
+            mapper = ExcelColumnMapper(self.mock_root)
+            mapper.source_file_path.set('/data/bundle.zip::exports/orders.csv.gz')
+            mapper.destination_file_path.set('/data/bundle.zip::template.xlsx')
+            mapper.key_column_var = MockStringVar(value=mapper.MATCH_BY_POSITION)
+            mapper.incremental_var = Mock(get=Mock(return_value=False))
+            mapper.row_filter_var = MockStringVar()
+            mapper.column_mappings = {'Full_Name': 'Name'}
+            mapper.get_destination_schema = Mock(return_value=DestinationSchema())
+            mapper.update_status = Mock()
+            
+            mapper.copy_mapped_data()
+            self.assertEqual(ask_save.call_args.kwargs['initialfile'], 'template_updated.xlsx')
+            
+            mapper.save_mapping_history('/out/template_updated.xlsx')
+        
+        history = pd.read_csv(history_file)
+        self.assertEqual(history['Source_File'].tolist(), ['orders.csv.gz'])
+        self.assertEqual(history['Destination_File'].tolist(), ['template.xlsx'])
+    
     @patch('tkinter.StringVar', MockStringVar)
     def test_status_update(self):
         """Test status update functionality"""
@@ -415,6 +510,49 @@ class TestExcelColumnMapper(unittest.TestCase):
             mock_combo1.set.assert_called_with('-- Select Source Column --')
             mock_combo2.set.assert_called_with('-- Select Source Column --')
             mapper.update_status.assert_called_with('All mappings cleared')
+    
+    @patch('tkinter.StringVar', MockStringVar)
+    def test_preview_shows_one_window_of_output_rows(self):
+        """Test that the preview grid computes only the rows in view, with transforms and the row filter"""
+        with patch.object(ExcelColumnMapper, 'create_widgets'), \
+             patch('main.ThemeManager' if 'main' in sys.modules else 'app.main.ThemeManager'), \
+             patch('main.StatisticsManager' if 'main' in sys.modules else 'app.main.StatisticsManager'), \
+             patch('main.Config.ensure_directories' if 'main' in sys.modules else 'app.main.Config.ensure_directories'), \
+             patch('main.Config.PREVIEW_ROWS' if 'main' in sys.modules else 'app.main.Config.PREVIEW_ROWS', 4):
+            
+            mapper = ExcelColumnMapper(self.mock_root)
+            
+            # Set up test data
+            mapper.source_df = pd.DataFrame({'Name': [f"n{i}" for i in range(100)], 'Qty': list(range(100))})
+            mapper.source_headers = ['Name', 'Qty']
+            mapper.destination_headers = ['Customer', 'Quantity', 'Note']
+            mapper.column_mappings = {'Customer': 'Name', 'Quantity': '=[Qty] * 2'}
+            mapper.transform_vars = {'Customer': MockStringVar('upper')}
+            mapper.row_filter_var = MockStringVar('[Qty] % 2 == 0')
+            mapper.get_destination_schema = Mock(return_value=DestinationSchema())
+            
+            # Mock widgets
+            mapper.preview_tree = Mock()
+            mapper.preview_tree.get_children.return_value = ()
+            mapper.preview_scrollbar = Mock()
+            mapper.preview_summary_var = MockStringVar()
+            mapper.preview_built = True
+            
+            mapper.update_preview()
+            shown = [call.kwargs['values'] for call in mapper.preview_tree.insert.call_args_list]
+            self.assertEqual(shown, [[1, 'N0', '0.0', ''], [3, 'N2', '4.0', '']])
+            self.assertIn("Source rows 1-4 of 100", mapper.preview_summary_var.get())
+            
+            # Dragging the scrollbar computes only the window it lands on
+            mapper.preview_tree.insert.reset_mock()
+            mapper.on_preview_scroll('moveto', '0.5')
+            shown = [call.kwargs['values'] for call in mapper.preview_tree.insert.call_args_list]
+            self.assertEqual([values[0] for values in shown], [51, 53])
+            mapper.preview_scrollbar.set.assert_called_with(0.5, 0.54)
+            
+            # The last window stays full
+            mapper.on_preview_scroll('scroll', '30', 'pages')
+            self.assertEqual(mapper.preview_start, 96)
 
 
 class TestExcelColumnMapperIntegration(unittest.TestCase):
@@ -493,6 +631,1629 @@ class TestExcelColumnMapperIntegration(unittest.TestCase):
             self.assertIn('Full_Name', dest_df.columns)
 
 
+class TestPerformanceTracer(unittest.TestCase):
+    """Test suite for stage timing instrumentation"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Set up tracer with a couple of recorded spans"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.tracer = PerformanceTracer()
+        
+        with self.tracer.span("read_source_file", file="source.xlsx") as span:
+            span['rows'] = 3
+        with self.tracer.span("copy_mapping", rows=3, source="Name", destination="Full_Name"):
+            pass
+    
+    def tearDown(self):
+        """Clean up exported files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_span_records_duration_and_rows(self):
+        """Test that spans record wall time and rows processed"""
+        self.assertEqual(len(self.tracer.spans), 2)
+        
+        first = self.tracer.spans[0]
+        self.assertEqual(first['name'], "read_source_file")
+        self.assertEqual(first['rows'], 3)
+        self.assertGreaterEqual(first['duration_ms'], 0)
+        self.assertIn('memory_delta_bytes', first)
+        self.assertLessEqual(first['start_ms'], self.tracer.spans[1]['start_ms'])
+    
+    def test_span_recorded_when_stage_fails(self):
+        """Test that a failing stage still records its span"""
+        with self.assertRaises(ValueError):
+            with self.tracer.span("save_output"):
+                raise ValueError("disk full")
+        
+        self.assertEqual(self.tracer.spans[-1]['name'], "save_output")
+    
+    def test_export_chrome_trace(self):
+        """Test exporting spans as Chrome trace events"""
+        trace_path = self.tracer.export(Path(self.temp_dir) / "trace.json")
+        
+        with open(trace_path) as f:
+            trace = json.load(f)
+        
+        complete_events = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual([e['name'] for e in complete_events], ["read_source_file", "copy_mapping"])
+        self.assertEqual(complete_events[1]['args']['destination'], "Full_Name")
+        self.assertEqual(complete_events[1]['args']['rows'], 3)
+    
+    def test_export_csv(self):
+        """Test exporting spans as CSV"""
+        csv_path = self.tracer.export(Path(self.temp_dir) / "trace.csv")
+        
+        exported = pd.read_csv(csv_path)
+        self.assertEqual(exported['name'].tolist(), ["read_source_file", "copy_mapping"])
+        self.assertEqual(exported['rows'].tolist(), [3, 3])
+
+
+class TestStartup(unittest.TestCase):
+    """Test suite for cold start behaviour"""
+    
+    def test_import_does_not_load_pandas(self):
+        """Test that importing the application defers the pandas import"""
+        import subprocess
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = (
+            "import sys; sys.path.insert(0, {!r}); import app.main; "
+            "print('pandas' in sys.modules)"
+        ).format(project_root)
+        
+        completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+        self.assertEqual(completed.stdout.strip().splitlines()[-1], "False")
+    
+    @patch('tkinter.StringVar', MockStringVar)
+    def test_preview_built_on_demand(self):
+        """Test that the preview tab is only populated once it has been built"""
+        mock_root = Mock(spec=tk.Tk)
+        mock_root.winfo_width.return_value = 1400
+        mock_root.winfo_height.return_value = 800
+        mock_root.winfo_screenwidth.return_value = 1920
+        mock_root.winfo_screenheight.return_value = 1080
+        
+        with patch.object(ExcelColumnMapper, 'create_widgets'), \
+             patch('main.ThemeManager' if 'main' in sys.modules else 'app.main.ThemeManager'), \
+             patch('main.StatisticsManager' if 'main' in sys.modules else 'app.main.StatisticsManager'), \
+             patch('main.Config.ensure_directories' if 'main' in sys.modules else 'app.main.Config.ensure_directories'):
+            
+            mapper = ExcelColumnMapper(mock_root)
+            
+            # Warm-up is deferred until the event loop is idle
+            mock_root.after_idle.assert_called_with(mapper.warm_up_imports)
+            
+            # Updating the preview before the tab exists is a no-op
+            self.assertFalse(mapper.preview_built)
+            mapper.update_preview()
+
+
+class TestThemeManager(unittest.TestCase):
+    """Test suite for cached theme style tables"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create a theme manager backed by a mock ttk style"""
+        with patch('main.ttk.Style' if 'main' in sys.modules else 'app.main.ttk.Style') as mock_style_class:
+            self.mock_style = Mock()
+            self.mock_style.theme_use.return_value = 'clam'
+            mock_style_class.return_value = self.mock_style
+            self.theme_manager = ThemeManager(Mock(spec=tk.Tk))
+    
+    def test_style_table_computed_once(self):
+        """Test that style tables are cached per theme mode"""
+        with patch.object(ThemeManager, 'build_style_table', wraps=self.theme_manager.build_style_table) as build:
+            first = self.theme_manager.get_style_table("dark")
+            second = self.theme_manager.get_style_table("dark")
+            
+            self.assertIs(first, second)
+            build.assert_called_once_with("dark")
+    
+    def test_reapplying_same_theme_is_noop(self):
+        """Test that applying an already applied theme configures nothing"""
+        self.assertGreater(self.theme_manager.apply_custom_styles(), 0)
+        
+        self.mock_style.configure.reset_mock()
+        self.mock_style.map.reset_mock()
+        
+        self.assertEqual(self.theme_manager.apply_custom_styles(), 0)
+        self.mock_style.configure.assert_not_called()
+        self.mock_style.map.assert_not_called()
+    
+    def test_switch_applies_only_diff(self):
+        """Test that switching modes on one ttk theme only reconfigures changed options"""
+        self.theme_manager.apply_custom_styles()
+        self.mock_style.configure.reset_mock()
+        
+        self.theme_manager.current_theme = "dark"
+        self.theme_manager.apply_custom_styles()
+        
+        configured = {c.args[0]: c.kwargs for c in self.mock_style.configure.call_args_list}
+        # Button colors are identical in both modes and are not touched
+        self.assertNotIn('Primary.TButton', configured)
+        self.assertEqual(configured['Card.TFrame'], {'background': '#2b2b2b'})
+    
+    def test_registered_widgets_follow_theme(self):
+        """Test that registered text widgets are recolored and destroyed ones dropped"""
+        text_widget = Mock()
+        destroyed_widget = Mock()
+        self.theme_manager.register_themed_widget(text_widget, 'text')
+        self.theme_manager.register_themed_widget(destroyed_widget, 'canvas')
+        destroyed_widget.winfo_exists.return_value = False
+        
+        self.theme_manager.current_theme = "dark"
+        self.theme_manager.update_text_widget_colors()
+        
+        text_widget.config.assert_called_with(
+            bg='#3c3c3c', fg='#ffffff', insertbackground='#ffffff',
+            selectbackground='#0078d4', selectforeground='#ffffff'
+        )
+        self.assertEqual(self.theme_manager._themed_widgets, [(text_widget, 'text')])
+
+
+class TestCancellation(unittest.TestCase):
+    """Test suite for cancellable chunked reading and writing"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create test files"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.data = pd.DataFrame({
+            'Name': ['John', 'Jane', 'Bob', 'Alice', 'Eve'],
+            'Age': [25, 30, None, 41, 38],
+            'City': ['New York', 'London', 'Paris', float('nan'), 'Rome']
+        })
+        self.xlsx_file = Path(self.temp_dir) / 'source.xlsx'
+        self.data.to_excel(self.xlsx_file, index=False)
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_token(self):
+        """Test cancellation token state"""
+        token = CancellationToken()
+        self.assertFalse(token.is_cancelled)
+        token.raise_if_cancelled()
+        
+        token.cancel()
+        self.assertTrue(token.is_cancelled)
+        with self.assertRaises(OperationCancelled):
+            token.raise_if_cancelled()
+    
+    def test_chunked_excel_read_matches_pandas(self):
+        """Test that streaming an .xlsx file in chunks gives the same data as pandas"""
+        chunks = list(iter_file_chunks(self.xlsx_file, chunk_rows=2, token=CancellationToken()))
+        
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        combined = pd.concat(chunks, ignore_index=True)
+        pd.testing.assert_frame_equal(combined, pd.read_excel(self.xlsx_file))
+    
+    def test_cancelled_read_raises(self):
+        """Test that a cancelled reader stops with OperationCancelled"""
+        token = CancellationToken()
+        token.cancel()
+        
+        with self.assertRaises(OperationCancelled):
+            list(iter_file_chunks(self.xlsx_file, chunk_rows=2, token=token))
+    
+    def test_write_output_in_chunks(self):
+        """Test that chunked writes produce the complete file"""
+        for name in ('output.csv', 'output.xlsx'):
+            output_file = Path(self.temp_dir) / name
+            write_output_file(self.data, output_file, CancellationToken(), chunk_rows=2)
+            
+            written = pd.read_csv(output_file) if name.endswith('.csv') else pd.read_excel(output_file)
+            pd.testing.assert_frame_equal(written, self.data)
+    
+    def test_cancelled_write_removes_partial_output(self):
+        """Test that cancelling a write leaves no output or partial file behind"""
+        output_file = Path(self.temp_dir) / 'output.csv'
+        token = CancellationToken()
+        
+        # Cancel while the second chunk is being prepared
+        original_check = token.raise_if_cancelled
+        calls = []
+        def cancel_on_second_check():
+            calls.append(1)
+            if len(calls) == 2:
+                token.cancel()
+            original_check()
+        token.raise_if_cancelled = cancel_on_second_check
+        
+        with self.assertRaises(OperationCancelled):
+            write_output_file(self.data, output_file, token, chunk_rows=2)
+        
+        self.assertEqual(os.listdir(self.temp_dir), ['source.xlsx'])
+    
+    def test_background_task_dispatch(self):
+        """Test that worker results and progress are dispatched on poll"""
+        on_success, on_error, on_cancelled, on_progress = Mock(), Mock(), Mock(), Mock()
+        
+        def work(token, report):
+            report("Halfway", 50)
+            return 42
+        
+        task = BackgroundTask(Mock(), work, on_success, on_error, on_cancelled, on_progress)
+        task._run()
+        task._poll()
+        
+        on_progress.assert_called_once_with("Halfway", 50)
+        on_success.assert_called_once_with(42)
+        self.assertTrue(task.finished)
+        
+        def cancelled_work(token, report):
+            token.cancel()
+            token.raise_if_cancelled()
+        
+        task = BackgroundTask(Mock(), cancelled_work, on_success, on_error, on_cancelled)
+        task._run()
+        task._poll()
+        on_cancelled.assert_called_once_with()
+        on_error.assert_not_called()
+
+
+class TestFilePrefetcher(unittest.TestCase):
+    """Test suite for background prefetching of selected files"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create two selectable files"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.first_file = Path(self.temp_dir) / 'first.csv'
+        self.second_file = Path(self.temp_dir) / 'second.csv'
+        pd.DataFrame({'A': [1, 2]}).to_csv(self.first_file, index=False)
+        pd.DataFrame({'B': [3]}).to_csv(self.second_file, index=False)
+        
+        self.seen_tokens = []
+        def reader(path, token):
+            self.seen_tokens.append(token)
+            return pd.read_csv(path)
+        self.prefetcher = FilePrefetcher(reader)
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_prefetched_result_is_reused(self):
+        """Test that loading the prefetched file hands over the parsed result"""
+        self.prefetcher.prefetch('source', str(self.first_file))
+        
+        future, _ = self.prefetcher.take('source', str(self.first_file))
+        self.assertEqual(future.result(timeout=5).columns.tolist(), ['A'])
+        
+        # The result is handed over once
+        self.assertIsNone(self.prefetcher.take('source', str(self.first_file)))
+    
+    def test_choosing_another_file_cancels_stale_prefetch(self):
+        """Test that a new selection cancels the previous prefetch"""
+        self.prefetcher.prefetch('source', str(self.first_file)).result(timeout=5)
+        self.prefetcher.prefetch('source', str(self.second_file)).result(timeout=5)
+        
+        self.assertTrue(self.seen_tokens[0].is_cancelled)
+        self.assertFalse(self.seen_tokens[1].is_cancelled)
+        self.assertIsNone(self.prefetcher.take('source', str(self.first_file)))
+    
+    def test_modified_file_is_not_reused(self):
+        """Test that a file changed after selection is read again"""
+        self.prefetcher.prefetch('destination', str(self.first_file)).result(timeout=5)
+        pd.DataFrame({'A': [1, 2, 3, 4]}).to_csv(self.first_file, index=False)
+        
+        self.assertIsNone(self.prefetcher.take('destination', str(self.first_file)))
+    
+    def test_missing_file_is_not_prefetched(self):
+        """Test that nonexistent paths are ignored"""
+        self.assertIsNone(self.prefetcher.prefetch('source', str(Path(self.temp_dir) / 'missing.csv')))
+    
+    def test_archive_member_is_prefetched(self):
+        """Test that a file picked inside a zip archive is prefetched like a plain file"""
+        import zipfile
+        archive = Path(self.temp_dir) / 'bundle.zip'
+        with zipfile.ZipFile(archive, 'w') as bundle:
+            bundle.write(self.first_file, 'exports/first.csv')
+            bundle.write(self.second_file, 'second.csv')
+        member_path = f"{archive}::exports/first.csv"
+        prefetcher = FilePrefetcher(read_data_file)
+        
+        self.assertIsNotNone(prefetcher.prefetch('source', member_path))
+        future, _ = prefetcher.take('source', member_path)
+        self.assertEqual(future.result(timeout=5)['A'].tolist(), [1, 2])
+        self.assertIsNone(prefetcher.prefetch('source', f"{Path(self.temp_dir) / 'missing.zip'}::first.csv"))
+
+
+class TestMultiSourceMerge(unittest.TestCase):
+    """Test suite for merging many source files into one destination layout"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create regional source files"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_files = []
+        for region, names in [('north', ['Ann', 'Ben']), ('south', ['Cat']), ('east', ['Dan', 'Eve', 'Fay'])]:
+            file_path = os.path.join(self.temp_dir, f'{region}.csv')
+            pd.DataFrame({'Name': names, 'Region': [region] * len(names)}).to_csv(file_path, index=False)
+            self.source_files.append(file_path)
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_merge_preserves_file_order_and_records_source(self):
+        """Test that remapped files are streamed into one output in selection order"""
+        output_file = Path(self.temp_dir) / 'merged.csv'
+        
+        result = merge_source_files(
+            self.source_files,
+            {'Full_Name': 'Name', 'Area': 'Region'},
+            ['Full_Name', 'Area', 'Notes'],
+            output_file,
+            source_column='Source_File',
+            max_workers=2
+        )
+        
+        merged = pd.read_csv(output_file)
+        self.assertEqual(result, {'rows': 6, 'violations': []})
+        self.assertEqual(merged.columns.tolist(), ['Full_Name', 'Area', 'Notes', 'Source_File'])
+        self.assertEqual(merged['Full_Name'].tolist(), ['Ann', 'Ben', 'Cat', 'Dan', 'Eve', 'Fay'])
+        self.assertEqual(merged['Source_File'].tolist()[2], 'south.csv')
+        self.assertTrue(merged['Notes'].isna().all())
+    
+    def test_cancelled_merge_writes_nothing(self):
+        """Test that a cancelled merge leaves no output behind"""
+        output_file = Path(self.temp_dir) / 'merged.xlsx'
+        token = CancellationToken()
+        token.cancel()
+        
+        with self.assertRaises(OperationCancelled):
+            merge_source_files(self.source_files, {'Full_Name': 'Name'}, ['Full_Name'], output_file,
+                               max_workers=1, token=token)
+        
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['east.csv', 'north.csv', 'south.csv'])
+    
+    def test_empty_merge_is_refused(self):
+        """Test that merging no files fails with a clear message before any worker starts"""
+        with self.assertRaisesRegex(ValueError, 'No source files to merge'):
+            merge_source_files([], {'Full_Name': 'Name'}, ['Full_Name'], Path(self.temp_dir) / 'merged.csv')
+
+
+class TestWatchFolder(unittest.TestCase):
+    """Test suite for the watch-folder daemon"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create watched, output and template locations"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.watch_dir = self.temp_dir / 'incoming'
+        self.watch_dir.mkdir()
+        self.template_file = self.temp_dir / 'template.csv'
+        pd.DataFrame({'Full_Name': [], 'Location': []}).to_csv(self.template_file, index=False)
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_files_are_debounced_until_settled(self):
+        """Test that a file is only handed over once it stopped changing"""
+        watcher = FolderWatcher(self.watch_dir, settle_seconds=2)
+        landing = self.watch_dir / 'export.csv'
+        landing.write_text('Name\nAnn\n')
+        (self.watch_dir / '~$export.xlsx').write_text('lock')
+        
+        self.assertEqual(watcher.poll(now=0), [])
+        
+        # Still being written
+        landing.write_text('Name\nAnn\nBen\n')
+        self.assertEqual(watcher.poll(now=1), [])
+        self.assertEqual(watcher.poll(now=2), [])
+        
+        self.assertEqual(watcher.poll(now=3.5), [landing])
+        # Claimed files are not handed over twice
+        self.assertEqual(watcher.poll(now=10), [])
+    
+    def test_daemon_processes_settled_file(self):
+        """Test that a settled file is transformed, recorded in history and moved aside"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        stats_module = 'app.engine.StatisticsManager'
+        history_file = self.temp_dir / 'history.csv'
+        
+        with patch(f'{config_module}.HISTORY_FILE', history_file), patch(stats_module):
+            daemon = WatchFolderDaemon(
+                {'Full_Name': 'Name', 'Location': 'City'},
+                self.template_file,
+                watch_dir=self.watch_dir,
+                output_dir=self.temp_dir / 'output',
+                output_format='csv',
+                settle_seconds=0
+            )
+            pd.DataFrame({'Name': ['Ann', 'Ben'], 'City': ['Oslo', 'Rome']}).to_csv(
+                self.watch_dir / 'export.csv', index=False
+            )
+            
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                daemon.run_once(executor)  # first sighting
+                daemon.run_once(executor)  # settled, submitted
+                for future in list(daemon.in_flight):
+                    future.result(timeout=10)
+                daemon.collect_finished()
+            
+            output = pd.read_csv(self.temp_dir / 'output' / 'export_mapped.csv')
+            self.assertEqual(output['Full_Name'].tolist(), ['Ann', 'Ben'])
+            self.assertTrue((self.watch_dir / 'processed' / 'export.csv').exists())
+            self.assertFalse((self.watch_dir / 'export.csv').exists())
+            
+            history = pd.read_csv(history_file)
+            self.assertEqual(set(history['Source_File']), {'export.csv'})
+            self.assertEqual(set(history['Output_File']), {'export_mapped.csv'})
+    
+    def test_values_not_fitting_template_types_fail_the_file(self):
+        """Test that unattended runs fail a file instead of writing blanks for values of the wrong type"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        pd.DataFrame({'Full_Name': ['Ann'], 'Zip': [1234]}).to_csv(self.template_file, index=False)
+        with patch('app.engine.Config.HISTORY_FILE', self.temp_dir / 'history.csv'), patch('app.engine.StatisticsManager'):
+            daemon = WatchFolderDaemon(
+                {'Full_Name': 'Name', 'Zip': 'Code'}, self.template_file, watch_dir=self.watch_dir,
+                output_dir=self.temp_dir / 'output', output_format='csv', settle_seconds=0
+            )
+            pd.DataFrame({'Name': ['Ben'], 'Code': ['pending']}).to_csv(self.watch_dir / 'export.csv', index=False)
+            
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                daemon.run_once(executor)
+                daemon.run_once(executor)
+                for future in list(daemon.in_flight):
+                    future.exception(timeout=10)
+                daemon.collect_finished()
+        
+        self.assertTrue((self.watch_dir / 'failed' / 'export.csv').exists())
+        self.assertEqual(list((self.temp_dir / 'output').iterdir()), [])
+    
+    def test_files_settling_together_get_their_own_outputs(self):
+        """Test that sources with the same stem in one poll don't share an output while still running"""
+        from concurrent.futures import Future
+        
+        with patch('app.engine.StatisticsManager'):
+            daemon = WatchFolderDaemon(
+                {'Full_Name': 'Name'}, self.template_file, watch_dir=self.watch_dir,
+                output_dir=self.temp_dir / 'output', output_format='csv', settle_seconds=0
+            )
+        for name in ['export.csv', 'export.csv.gz', 'export.xlsx']:
+            (self.watch_dir / name).write_bytes(b'Name\nAnn\n')
+        (self.temp_dir / 'output' / 'export_mapped_2.csv').write_text('done earlier')
+        
+        executor = Mock()
+        executor.submit.side_effect = lambda *args: Future()
+        daemon.run_once(executor)  # first sighting
+        daemon.run_once(executor)  # all settled, none finished
+        
+        outputs = sorted(output_path.name for _, output_path, _ in daemon.in_flight.values())
+        self.assertEqual(outputs, ['export_mapped.csv', 'export_mapped_3.csv', 'export_mapped_4.csv'])
+
+
+class TestIncrementalTransfer(unittest.TestCase):
+    """Test suite for incremental (append-only) transfers"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create a source file, template and state directory"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source_file = self.temp_dir / 'daily.csv'
+        self.source_file.write_text('Name,City\nAnn,Oslo\nBen,Rome\n', encoding='utf-8')
+        self.destination_df = pd.DataFrame({'Full_Name': [], 'Location': []})
+        self.mappings = {'Full_Name': 'Name', 'Location': 'City'}
+        self.transfer = IncrementalTransfer(state_dir=self.temp_dir / 'state')
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def run_transfer(self, output_file, **kwargs):
+        return self.transfer.run(self.source_file, self.destination_df, self.mappings, output_file, **kwargs)
+    
+    def test_csv_appends_read_only_the_tail(self):
+        """Test that rows appended to a CSV source are read from the checkpoint and appended"""
+        output_file = self.temp_dir / 'out.csv'
+        first = self.run_transfer(output_file)
+        self.assertEqual(first['mode'], 'full')
+        
+        with open(self.source_file, 'a', encoding='utf-8') as f:
+            f.write('Cleo,Lima\n')
+        second = self.run_transfer(output_file)
+        self.assertEqual((second['mode'], second['read_mode'], second['rows_appended']), ('append', 'tail', 1))
+        
+        # Nothing new: nothing appended
+        third = self.run_transfer(output_file)
+        self.assertEqual(third['rows_appended'], 0)
+        
+        output = pd.read_csv(output_file)
+        self.assertEqual(output['Full_Name'].tolist(), ['Ann', 'Ben', 'Cleo'])
+        self.assertEqual(output['Location'].tolist(), ['Oslo', 'Rome', 'Lima'])
+    
+    def test_rewritten_source_appends_new_and_changed_rows(self):
+        """Test that a rewritten source falls back to comparing row hashes"""
+        output_file = self.temp_dir / 'out.xlsx'
+        self.run_transfer(output_file)
+        
+        # Rewritten in a different order, one row changed and one added
+        self.source_file.write_text('Name,City\nBen,Rome\nAnn,Bergen\nDan,Kyiv\n', encoding='utf-8')
+        result = self.run_transfer(output_file)
+        self.assertEqual((result['read_mode'], result['rows_appended']), ('hash', 2))
+        
+        output = pd.read_excel(output_file)
+        self.assertEqual(output['Full_Name'].tolist(), ['Ann', 'Ben', 'Ann', 'Dan'])
+        self.assertEqual(output['Location'].tolist(), ['Oslo', 'Rome', 'Bergen', 'Kyiv'])
+    
+    def test_repeated_rows_are_appended_on_both_read_paths(self):
+        """Test that a row identical to one already transferred is still appended, whether read as tail or by hash"""
+        for rewrite in (False, True):
+            with self.subTest(rewrite=rewrite):
+                self.source_file.write_text('Name,City\nAnn,Oslo\nBen,Rome\n', encoding='utf-8')
+                output_file = self.temp_dir / f'repeats_{rewrite}.csv'
+                self.run_transfer(output_file)
+                
+                if rewrite:
+                    self.source_file.write_text('Name,City\nBen,Rome\nAnn,Oslo\nAnn,Oslo\nAnn,Oslo\n', encoding='utf-8')
+                else:
+                    with open(self.source_file, 'a', encoding='utf-8') as f:
+                        f.write('Ann,Oslo\nAnn,Oslo\n')
+                result = self.run_transfer(output_file)
+                self.assertEqual((result['read_mode'], result['rows_appended']), ('hash' if rewrite else 'tail', 2))
+                self.assertEqual(self.run_transfer(output_file)['rows_appended'], 0)
+                self.assertEqual(pd.read_csv(output_file)['Full_Name'].tolist(), ['Ann', 'Ben', 'Ann', 'Ann'])
+    
+    def test_changed_mappings_start_over(self):
+        """Test that changing the mappings rewrites the output instead of appending"""
+        output_file = self.temp_dir / 'out.csv'
+        self.run_transfer(output_file)
+        
+        self.mappings = {'Full_Name': 'City'}
+        result = self.run_transfer(output_file)
+        self.assertEqual(result['mode'], 'full')
+        self.assertEqual(pd.read_csv(output_file)['Full_Name'].tolist(), ['Oslo', 'Rome'])
+
+
+class TestKeyUpsert(unittest.TestCase):
+    """Test suite for key-based upserts into the destination"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create destination rows with a unique key"""
+        self.destination_df = pd.DataFrame({
+            'ID': [101, 102, 103],
+            'Name': ['Ann', 'Ben', 'Cleo'],
+            'Region': ['North', 'South', 'East']
+        })
+        self.mappings = {'ID': 'Code', 'Name': 'Full_Name'}
+    
+    def test_matches_are_updated_and_new_keys_appended(self):
+        """Test that rows are matched on the key rather than on their position"""
+        source_df = pd.DataFrame({'Code': [103, 104, 101], 'Full_Name': ['Cleo B', 'Dan', 'Ann B']})
+        
+        result_df, summary = upsert_transfer_frame(source_df, self.destination_df, self.mappings, 'ID')
+        
+        self.assertEqual(summary, {'updated': 2, 'inserted': 1})
+        self.assertEqual(result_df['ID'].tolist(), [101, 102, 103, 104])
+        self.assertEqual(result_df['Name'].tolist(), ['Ann B', 'Ben', 'Cleo B', 'Dan'])
+        # Unmapped destination columns keep their values; inserted rows leave them empty
+        self.assertEqual(result_df['Region'].tolist()[:3], ['North', 'South', 'East'])
+        self.assertTrue(pd.isna(result_df['Region'].iloc[3]))
+    
+    def test_text_keys_match_numeric_keys(self):
+        """Test that keys read as text from a CSV still match numeric template keys"""
+        source_df = pd.DataFrame({'Code': ['102', ' 105', None, '102'], 'Full_Name': ['Old', 'Eve', 'Anon', 'Ben C']})
+        
+        result_df, summary = upsert_transfer_frame(source_df, self.destination_df, self.mappings, 'ID')
+        
+        # The last duplicate wins; rows without a key are always inserted
+        self.assertEqual(summary, {'updated': 1, 'inserted': 2})
+        self.assertEqual(result_df['Name'].tolist(), ['Ann', 'Ben C', 'Cleo', 'Eve', 'Anon'])
+        self.assertEqual(result_df['ID'].iloc[1], 102)
+    
+    def test_huge_and_infinite_keys_still_match(self):
+        """Test that float keys beyond the integer range don't stop the other keys from matching"""
+        destination_df = pd.DataFrame({'ID': [102.0, 1e20, float('inf')], 'Name': ['Ben', 'Big', 'Inf']})
+        source_df = pd.DataFrame({'Code': ['102', '7'], 'Full_Name': ['Ben C', 'Gus']})
+        
+        result_df, summary = upsert_transfer_frame(source_df, destination_df, self.mappings, 'ID')
+        
+        self.assertEqual(summary, {'updated': 1, 'inserted': 1})
+        self.assertEqual(result_df['Name'].tolist(), ['Ben C', 'Big', 'Inf', 'Gus'])
+    
+    def test_duplicate_destination_keys_are_rejected(self):
+        """Test that an ambiguous destination key raises a clear error"""
+        destination_df = pd.DataFrame({'ID': [1, 1], 'Name': ['a', 'b']})
+        source_df = pd.DataFrame({'Code': [1], 'Full_Name': ['c']})
+        
+        with self.assertRaisesRegex(ValueError, 'duplicate'):
+            upsert_transfer_frame(source_df, destination_df, self.mappings, 'ID')
+        with self.assertRaisesRegex(ValueError, 'must be mapped'):
+            upsert_transfer_frame(source_df, destination_df, {'Name': 'Full_Name'}, 'ID')
+
+
+class TestTransformChains(unittest.TestCase):
+    """Test suite for per-mapping transform chains"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create raw source data"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source_df = pd.DataFrame({
+            'Name': ['  ann ', 'ben', None],
+            'Joined': ['17/08/2025', 'not a date', '01/01/2024'],
+            'Amount': ['1.234,50', '7,25', ''],
+            'Grams': [1500, 250, None],
+            'Active': ['Y', 'N', 'maybe']
+        })
+        self.mappings = {'Full_Name': 'Name', 'Start': 'Joined', 'Total': 'Amount', 'Kg': 'Grams', 'Status': 'Active'}
+        self.transforms = {
+            'Full_Name': 'trim | upper',
+            'Start': 'date:%d/%m/%Y',
+            'Total': 'decimal_comma',
+            'Kg': 'scale:0.001',
+            'Status': 'map:Y=Yes,N=No'
+        }
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_chains_are_applied_to_whole_columns(self):
+        """Test that each destination gets its chain applied, keyed by destination name"""
+        result_df, copy_mappings = MappingPlan(self.mappings, self.transforms).apply(self.source_df)
+        
+        self.assertEqual(copy_mappings, {dest: dest for dest in self.mappings})
+        self.assertEqual(result_df['Full_Name'].tolist()[:2], ['ANN', 'BEN'])
+        self.assertTrue(pd.isna(result_df['Full_Name'].iloc[2]))
+        self.assertEqual(result_df['Start'].iloc[0], pd.Timestamp('2025-08-17'))
+        self.assertTrue(pd.isna(result_df['Start'].iloc[1]))
+        self.assertEqual(result_df['Total'].tolist()[:2], [1234.5, 7.25])
+        self.assertEqual(result_df['Kg'].tolist()[:2], [1.5, 0.25])
+        self.assertEqual(result_df['Status'].tolist(), ['Yes', 'No', 'maybe'])
+    
+    def test_without_transforms_source_is_passed_through(self):
+        """Test that plain mappings don't copy the source data"""
+        result_df, copy_mappings = MappingPlan(self.mappings).apply(self.source_df)
+        self.assertIs(result_df, self.source_df)
+        self.assertEqual(copy_mappings, self.mappings)
+    
+    def test_invalid_chains_are_rejected(self):
+        """Test that unknown transforms and bad arguments fail when compiled"""
+        with self.assertRaisesRegex(ValueError, 'Unknown transform'):
+            MappingPlan(self.mappings, {'Full_Name': 'trim | shout'})
+        with self.assertRaisesRegex(ValueError, 'scale needs a number'):
+            MappingPlan(self.mappings, {'Kg': 'scale:lots'})
+    
+    def test_transforms_round_trip_through_history_and_mapping_files(self):
+        """Test that transform chains are saved in history and read back from mapping files"""
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        with patch(f'{config_module}.HISTORY_FILE', self.temp_dir / 'history.csv'):
+            append_mapping_history(self.mappings, 'source.csv', 'template.xlsx', 'out.xlsx', self.transforms)
+            session = load_history_session(destination_file_name='template.xlsx')
+        self.assertEqual(session['mappings'], self.mappings)
+        self.assertEqual(session['transforms'], self.transforms)
+        
+        mapping_file = self.temp_dir / 'mappings.json'
+        mapping_file.write_text(json.dumps({
+            'Full_Name': {'source': 'Name', 'transforms': 'trim | upper'},
+            'Kg': 'Grams'
+        }), encoding='utf-8')
+        self.assertEqual(
+            load_mapping_spec(mapping_file),
+            {'mappings': {'Full_Name': 'Name', 'Kg': 'Grams'}, 'transforms': {'Full_Name': 'trim | upper'},
+             'row_filter': None}
+        )
+        
+        mapping_file.write_text(json.dumps({'mappings': {'Full_Name': {'transforms': 'trim'}}}), encoding='utf-8')
+        with self.assertRaisesRegex(ValueError, "Mapping for 'Full_Name' in mappings.json has no source column"):
+            load_mapping_spec(mapping_file)
+
+
+class TestExpressionMappings(unittest.TestCase):
+    """Test suite for computed (expression) mappings"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create source data with columns to combine"""
+        self.source_df = pd.DataFrame({
+            'First': ['Ann', 'Ben', None],
+            'Last Name': ['Lee', 'Moe', 'Roe'],
+            'Qty': [2, 3, 4],
+            'Unit Price': [1.5, 2.0, 0.25],
+            'Id': [7, 8, 9]
+        })
+    
+    def test_expressions_are_evaluated_on_whole_columns(self):
+        """Test arithmetic, text joins and transforms applied to computed columns"""
+        plan = MappingPlan(
+            {
+                'FullName': "=[First] + ' ' + [Last Name]",
+                'Total': '=[Qty] * [Unit Price]',
+                'Code': "='ID-' + [Id]",
+                'Name': 'First'
+            },
+            {'FullName': 'trim | upper'},
+            source_headers=self.source_df.columns.tolist()
+        )
+        result_df, copy_mappings = plan.apply(self.source_df)
+        
+        self.assertEqual(result_df['FullName'].tolist(), ['ANN LEE', 'BEN MOE', 'ROE'])
+        self.assertEqual(result_df['Total'].tolist(), [3.0, 6.0, 1.0])
+        self.assertEqual(result_df['Code'].tolist(), ['ID-7', 'ID-8', 'ID-9'])
+        self.assertEqual(result_df['Name'].tolist()[:2], ['Ann', 'Ben'])
+        self.assertEqual(plan.source_columns, ['First', 'Id', 'Last Name', 'Qty', 'Unit Price'])
+    
+    def test_references_are_validated_against_source_headers(self):
+        """Test that unknown columns and unsupported syntax are rejected when the mapping is loaded"""
+        with self.assertRaisesRegex(ValueError, 'unknown source columns: Discount'):
+            MappingPlan({'Total': '=[Qty] * [Discount]'}, source_headers=self.source_df.columns.tolist())
+        with self.assertRaisesRegex(ValueError, 'Unsupported syntax'):
+            ColumnExpression("=__import__('os')")
+        with self.assertRaisesRegex(ValueError, 'Invalid expression'):
+            ColumnExpression('=[Qty] *')
+        # Brackets inside text are not column references
+        self.assertEqual(ColumnExpression("='[x] ' + [Qty]").columns, ['Qty'])
+    
+    def test_numexpr_backend_matches_python_backend(self):
+        """Test that the optional fast backend gives the same numbers"""
+        try:
+            import numexpr  # noqa: F401
+        except ImportError:
+            self.skipTest("numexpr is not installed")
+        
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        expression = ColumnExpression('=([Qty] + 1) * [Unit Price] ** 2')
+        fast = expression.evaluate(self.source_df)
+        with patch(f'{config_module}.EXPRESSION_ENGINE', 'python'):
+            slow = expression.evaluate(self.source_df)
+        pd.testing.assert_series_equal(fast, slow, check_names=False)
+
+
+class TestLookupMappings(unittest.TestCase):
+    """Test suite for lookup mappings against reference tables"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create a reference file and an isolated lookup cache"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.reference_file = self.temp_dir / 'skus.csv'
+        pd.DataFrame({
+            'SKU': [1001, 1002, 1003, 1002],
+            'Description': ['Bolt', 'Nut', 'Washer', 'Duplicate']
+        }).to_csv(self.reference_file, index=False)
+        
+        self.engine_module = sys.modules['app.engine']
+        self.cache = self.engine_module.ReferenceTableCache(cache_dir=self.temp_dir / 'cache')
+        self.cache_patch = patch.object(self.engine_module, 'REFERENCE_TABLES', self.cache)
+        self.cache_patch.start()
+        self.source_df = pd.DataFrame({'Code': ['1002', '1001', '9999', None]})
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        self.cache_patch.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def lookup(self, options=''):
+        plan = MappingPlan({'Item': 'Code'}, {'Item': f'lookup:{self.reference_file},SKU,Description{options}'})
+        return plan.apply(self.source_df)[0]['Item'].tolist()
+    
+    def test_lookup_with_miss_policies(self):
+        """Test that codes are replaced and misses follow the chosen policy"""
+        self.assertEqual(self.lookup()[:2], ['Nut', 'Bolt'])
+        self.assertTrue(all(pd.isna(value) for value in self.lookup()[2:]))
+        self.assertEqual(self.lookup(',miss=keep')[:3], ['Nut', 'Bolt', '9999'])
+        self.assertEqual(self.lookup(',default=Unknown'), ['Nut', 'Bolt', 'Unknown', 'Unknown'])
+        with self.assertRaisesRegex(ValueError, '2 values not found'):
+            self.lookup(',miss=error')
+        with self.assertRaisesRegex(ValueError, 'miss policy'):
+            self.lookup(',miss=ignore')
+    
+    def test_reference_table_is_cached_until_the_file_changes(self):
+        """Test that the reference file is read once, reused from disk, and re-read after it changes"""
+        with patch.object(self.engine_module.ReferenceTableCache, 'read_reference_file',
+                          wraps=self.engine_module.ReferenceTableCache.read_reference_file) as read:
+            self.lookup()
+            self.lookup()
+            self.assertEqual(read.call_count, 1)
+            
+            # A new process starts with an empty memory cache but finds the disk cache
+            self.cache._tables.clear()
+            self.lookup()
+            self.assertEqual(read.call_count, 1)
+            
+            pd.DataFrame({'SKU': [1002], 'Description': ['Hex nut']}).to_csv(self.reference_file, index=False)
+            os.utime(self.reference_file, ns=(0, 10**18))
+            self.assertEqual(self.lookup()[0], 'Hex nut')
+            self.assertEqual(read.call_count, 2)
+
+
+class TestRowFilters(unittest.TestCase):
+    """Test suite for row filters applied while reading the source"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create source data with columns to filter on"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source_df = pd.DataFrame({
+            'Name': ['Ann', 'Ben', 'Cat', 'Dan', 'Eve'],
+            'Status': ['Active', 'Closed', 'Active', 'Active', None],
+            'Date': ['2026-02-01', '2026-03-01', '2025-12-31', '2026-01-15', '2026-05-01'],
+            'Region': ['North', 'South', 'East', 'South', 'North'],
+            'Qty': [5, 0, 3, 12, 7]
+        })
+        self.source_file = self.temp_dir / 'orders.csv'
+        self.source_df.to_csv(self.source_file, index=False)
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def kept_names(self, row_filter):
+        return MappingPlan({}, row_filter=row_filter).filter_rows(self.source_df)['Name'].tolist()
+    
+    def test_conditions_select_matching_rows(self):
+        """Test comparisons, dates, membership, ranges and boolean operators"""
+        self.assertEqual(self.kept_names("[Status] == 'Active' and [Date] >= '2026-01-01'"), ['Ann', 'Dan'])
+        self.assertEqual(self.kept_names("[Region] in ('North', 'East')"), ['Ann', 'Cat', 'Eve'])
+        self.assertEqual(self.kept_names("[Region] not in ('North', 'East') or [Qty] > 6"), ['Ben', 'Dan', 'Eve'])
+        self.assertEqual(self.kept_names('0 < [Qty] <= 5'), ['Ann', 'Cat'])
+        self.assertEqual(self.kept_names("not [Status] == 'Active'"), ['Ben', 'Eve'])
+        # not is logical on numbers (only 0 is false), not a bitwise invert
+        self.assertEqual(self.kept_names("not [Qty]"), ['Ben'])
+        self.assertEqual(ColumnExpression('=not [Qty]').evaluate(self.source_df).tolist(), [False, True, False, False, False])
+        self.assertEqual(self.kept_names("not [Status]"), ['Eve'])
+        
+        filtered = MappingPlan({}, row_filter='[Qty] > 4').filter_rows(self.source_df)
+        self.assertEqual(filtered.index.tolist(), [0, 1, 2])
+    
+    def test_invalid_filters_are_rejected(self):
+        """Test that unknown columns and non-condition filters fail before any rows are read"""
+        headers = self.source_df.columns.tolist()
+        with self.assertRaisesRegex(ValueError, 'Row filter references unknown source columns: Owner'):
+            MappingPlan({}, row_filter="[Owner] == 'me'", source_headers=headers)
+        with self.assertRaisesRegex(ValueError, 'must be a condition'):
+            MappingPlan({}, row_filter='[Qty] * 2').filter_rows(self.source_df)
+    
+    def test_filter_is_applied_to_each_chunk_while_reading(self):
+        """Test that the filter runs per chunk so non-matching rows are never concatenated"""
+        plan = MappingPlan({}, row_filter="[Status] == 'Active'")
+        chunk_sizes = []
+        
+        def chunk_filter(chunk):
+            chunk_sizes.append(len(chunk))
+            return plan.filter_rows(chunk)
+        
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        with patch(f'{config_module}.CHUNK_ROWS', 2):
+            result = read_data_file(self.source_file, chunk_filter=chunk_filter)
+        
+        self.assertEqual(chunk_sizes, [2, 2, 1])
+        self.assertEqual(result['Name'].tolist(), ['Ann', 'Cat', 'Dan'])
+        self.assertEqual(result.index.tolist(), [0, 1, 2])
+    
+    def test_merge_and_incremental_transfers_apply_the_filter(self):
+        """Test the filter in merged outputs and that incremental runs append only matching new rows"""
+        output_file = self.temp_dir / 'merged.csv'
+        result = merge_source_files([str(self.source_file)], {'Who': 'Name'}, ['Who'], output_file,
+                                    max_workers=1, row_filter='[Qty] >= 5')
+        self.assertEqual(result['rows'], 3)
+        self.assertEqual(pd.read_csv(output_file)['Who'].tolist(), ['Ann', 'Dan', 'Eve'])
+        
+        transfer = IncrementalTransfer(state_dir=self.temp_dir / 'state')
+        destination_df = pd.DataFrame({'Who': []})
+        output_file = self.temp_dir / 'active.csv'
+        first = transfer.run(self.source_file, destination_df, {'Who': 'Name'}, output_file,
+                             row_filter="[Status] == 'Active'")
+        self.assertEqual(first['mode'], 'full')
+        
+        with open(self.source_file, 'a', encoding='utf-8') as f:
+            f.write('Fay,Closed,2026-06-01,East,1\nGus,Active,2026-06-02,West,2\n')
+        second = transfer.run(self.source_file, destination_df, {'Who': 'Name'}, output_file,
+                              row_filter="[Status] == 'Active'")
+        self.assertEqual((second['read_mode'], second['rows_appended']), ('tail', 1))
+        self.assertEqual(pd.read_csv(output_file)['Who'].tolist(), ['Ann', 'Cat', 'Dan', 'Gus'])
+        
+        # A different filter changes which rows belong in the output, so it starts over
+        third = transfer.run(self.source_file, destination_df, {'Who': 'Name'}, output_file,
+                             row_filter="[Region] == 'East'")
+        self.assertEqual(third['mode'], 'full')
+        self.assertEqual(pd.read_csv(output_file)['Who'].tolist(), ['Cat', 'Fay'])
+    
+    def test_row_filter_round_trips_through_history_and_mapping_files(self):
+        """Test that the row filter is recorded with a session and read from mapping files"""
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        with patch(f'{config_module}.HISTORY_FILE', self.temp_dir / 'history.csv'):
+            append_mapping_history({'Who': 'Name', 'Count': 'Qty'}, 'orders.csv', 'template.xlsx', 'out.xlsx',
+                                   row_filter='[Qty] > 0')
+            session = load_history_session(destination_file_name='template.xlsx')
+        self.assertEqual(session['row_filter'], '[Qty] > 0')
+        
+        mapping_file = self.temp_dir / 'mappings.json'
+        mapping_file.write_text(json.dumps({
+            'mappings': {'Who': 'Name'},
+            'row_filter': "[Region] == 'North'"
+        }), encoding='utf-8')
+        self.assertEqual(load_mapping_spec(mapping_file)['row_filter'], "[Region] == 'North'")
+
+
+class TestDestinationTypes(unittest.TestCase):
+    """Test suite for aligning output columns to the destination's types"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create a typed template and an untyped source"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.destination_df = pd.DataFrame({
+            'Id': [1, 2],
+            'When': pd.to_datetime(['2026-01-01', '2026-01-02']),
+            'Price': [1.5, 2.0],
+            'Code': ['A1', 'B2'],
+            'Active': [True, False],
+            'Notes': [None, None]
+        })
+        self.source_df = pd.DataFrame({
+            'id': ['3', 'x', '5.5', '7'],
+            'date': ['2026-02-01', 'bad', None, '2026-03-04'],
+            'price': ['1.25', 'n/a', '3', '4'],
+            'code': [1001.0, 2.0, None, 4.0],
+            'active': ['yes', 'no', 'maybe', '1']
+        })
+        self.mappings = {'Id': 'id', 'When': 'date', 'Price': 'price', 'Code': 'code', 'Active': 'active'}
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_growing_the_destination_keeps_column_types(self):
+        """Test that rows added for a longer source don't turn template columns into object"""
+        destination_df = pd.DataFrame({'Id': [1, 2], 'Price': [1.5, 2.0]})
+        source_df = pd.DataFrame({'qty': [1, 2, 3, 4]})
+        result_df = build_transfer_frame(source_df, destination_df, {'Price': 'qty'})
+        
+        self.assertEqual(len(result_df), 4)
+        self.assertTrue(pd.api.types.is_numeric_dtype(result_df['Id']))
+        self.assertEqual(result_df['Id'].tolist()[:2], [1, 2])
+        self.assertEqual(result_df['Price'].tolist(), [1, 2, 3, 4])
+    
+    def test_types_are_inferred_from_template_data_and_bad_values_reported(self):
+        """Test that mapped columns are cast to the template's types and unconvertible values are reported"""
+        schema = DestinationSchema.from_template(self.destination_df)
+        self.assertEqual(
+            schema.column_types,
+            {'Id': 'int', 'When': 'date', 'Price': 'float', 'Code': 'text', 'Active': 'bool'}
+        )
+        
+        result_df = build_transfer_frame(self.source_df, self.destination_df, self.mappings)
+        aligned, problems = schema.align(result_df)
+        
+        self.assertEqual(str(aligned['Id'].dtype), 'Int64')
+        self.assertEqual(aligned['Id'].tolist()[0], 3)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(aligned['When']))
+        self.assertEqual(aligned['Price'].dtype, 'float64')
+        self.assertEqual(aligned['Code'].tolist()[:2], ['1001', '2'])
+        self.assertEqual(str(aligned['Active'].dtype), 'boolean')
+        
+        self.assertEqual(problems['Id']['count'], 2)
+        self.assertEqual(problems['Id']['examples'], [(2, 'x'), (3, '5.5')])
+        self.assertEqual(problems['When']['examples'], [(2, 'bad')])
+        self.assertEqual(set(problems), {'Id', 'When', 'Price', 'Active'})
+        self.assertIn("Active: 1 values are not bool (e.g. row 3: 'maybe')", describe_cast_problems(problems))
+    
+    def test_schema_file_overrides_inferred_types(self):
+        """Test that a template.schema.json next to the template declares column types"""
+        template_path = self.temp_dir / 'template.xlsx'
+        get_schema_path(template_path).write_text(
+            json.dumps({'columns': {'Id': 'text', 'Notes': 'float', 'Missing': 'int'}}), encoding='utf-8'
+        )
+        schema = DestinationSchema.from_template(self.destination_df, template_path)
+        self.assertEqual(schema.column_types['Id'], 'text')
+        self.assertEqual(schema.column_types['Notes'], 'float')
+        self.assertNotIn('Missing', schema.column_types)
+        
+        get_schema_path(template_path).write_text(json.dumps({'Id': 'integer'}), encoding='utf-8')
+        with self.assertRaisesRegex(ValueError, "Unknown type 'integer' for column 'Id'"):
+            DestinationSchema.from_template(self.destination_df, template_path)
+    
+    def test_error_policy_stops_on_bad_values(self):
+        """Test that the error policy raises instead of leaving bad values empty"""
+        schema = DestinationSchema({'Price': 'float'})
+        with self.assertRaisesRegex(ValueError, "Price: 1 values are not float"):
+            schema.align(self.source_df.rename(columns={'price': 'Price'}), policy='error')
+    
+    def test_stray_numbers_are_reported_not_fatal(self):
+        """Test that fractional or infinite numbers in bool and text columns are reported instead of crashing"""
+        schema = DestinationSchema({'Active': 'bool', 'Code': 'text'})
+        aligned, problems = schema.align(
+            pd.DataFrame({'Active': [1.0, 0.5, 0.0], 'Code': [1.0, float('inf'), 2.0]}), policy='blank'
+        )
+        self.assertEqual(aligned['Active'].tolist()[::2], [True, False])
+        self.assertTrue(pd.isna(aligned['Active'].iloc[1]))
+        self.assertEqual(problems['Active']['examples'], [(2, 0.5)])
+        self.assertEqual(aligned['Code'].tolist(), ['1.0', 'inf', '2.0'])
+        self.assertNotIn('Code', problems)
+
+
+class TestOutputValidation(unittest.TestCase):
+    """Test suite for validating output rows against destination rules before writing"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create a template with a schema file declaring rules"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.template_path = self.temp_dir / 'template.xlsx'
+        self.destination_df = pd.DataFrame(columns=['Id', 'Code', 'Price', 'Shipped', 'Name'])
+        get_schema_path(self.template_path).write_text(json.dumps({'columns': {
+            'Id': {'type': 'int', 'required': True, 'unique': True},
+            'Code': {'type': 'text', 'pattern': '[A-Z]{2}\\d+', 'max_length': 5},
+            'Price': {'type': 'float', 'min': 0, 'max': 100},
+            'Shipped': {'type': 'date', 'min': '2026-01-01'},
+            'Name': 'text'
+        }}), encoding='utf-8')
+        self.output_df = pd.DataFrame({
+            'Id': [1, 2, 2, None, 'x'],
+            'Code': ['AB1', 'ab2', 'CD123456', None, 'EF9'],
+            'Price': [10, -1, 50, 101, 5],
+            'Shipped': ['2026-02-01', '2025-12-31', None, '2026-03-01', '2026-04-01'],
+            'Name': ['a', 'b', 'c', 'd', 'e']
+        })
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_rules_report_counts_and_first_offending_rows(self):
+        """Test type, required, pattern, length, range and uniqueness rules on whole columns"""
+        schema = DestinationSchema.from_template(self.destination_df, self.template_path)
+        self.assertEqual(schema.rules['Id'], {'required': True, 'unique': True})
+        
+        checked, violations = schema.check(self.output_df)
+        found = {(v['column'], v['rule']): (v['count'], v['examples']) for v in violations}
+        
+        self.assertEqual(found[('Id', 'type')], (1, [(5, 'x')]))
+        self.assertEqual(found[('Id', 'required')], (2, [(4, None), (5, None)]))
+        self.assertEqual(found[('Id', 'unique')], (2, [(2, 2), (3, 2)]))
+        self.assertEqual(found[('Code', 'pattern')], (1, [(2, 'ab2')]))
+        self.assertEqual(found[('Code', 'max_length')], (1, [(3, 'CD123456')]))
+        self.assertEqual(found[('Price', 'min')], (1, [(2, -1.0)]))
+        self.assertEqual(found[('Price', 'max')], (1, [(4, 101.0)]))
+        self.assertEqual(found[('Shipped', 'min')][0], 1)
+        self.assertNotIn('Name', {column for column, _ in found})
+        self.assertEqual(str(checked['Id'].dtype), 'Int64')
+        self.assertIn("Code: 1 values don't match [A-Z]{2}\\d+ (e.g. row 2: 'ab2')", describe_violations(violations))
+    
+    def test_uniqueness_and_row_numbers_span_chunks(self):
+        """Test that chunked validation numbers rows across chunks and finds repeats between them"""
+        validator = ChunkValidator(DestinationSchema({'Id': 'int'}, {'Id': {'unique': True}}))
+        validator.check(pd.DataFrame({'Id': [1, 2, 3]}))
+        validator.check(pd.DataFrame({'Id': [4, 2, 5]}))
+        
+        violations = validator.get_violations()
+        self.assertEqual(len(violations), 1)
+        self.assertEqual((violations[0]['count'], violations[0]['examples']), (1, [(5, 2)]))
+        self.assertEqual(validator.rows_checked, 6)
+    
+    def test_invalid_rules_are_rejected(self):
+        """Test that unknown rules and bad patterns fail when the schema is loaded"""
+        with self.assertRaisesRegex(ValueError, "Unknown rule 'nullable' for column 'Id'"):
+            DestinationSchema({'Id': 'int'}, {'Id': {'nullable': False}})
+        with self.assertRaisesRegex(ValueError, "Invalid pattern for column 'Code'"):
+            DestinationSchema(rules={'Code': {'pattern': '[A-Z'}})
+    
+    def test_error_policy_writes_nothing(self):
+        """Test that merges stop before writing when violations are errors"""
+        source_file = self.temp_dir / 'source.csv'
+        pd.DataFrame({'id': [1, 1], 'code': ['AB1', 'AB2']}).to_csv(source_file, index=False)
+        output_file = self.temp_dir / 'merged.csv'
+        schema = DestinationSchema.from_template(self.destination_df, self.template_path)
+        
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        with patch(f'{config_module}.VALIDATION_POLICY', 'error'):
+            with self.assertRaisesRegex(Exception, 'Id: 2 values are duplicated'):
+                merge_source_files([str(source_file)], {'Id': 'id', 'Code': 'code'},
+                                   self.destination_df.columns.tolist(), output_file, max_workers=1, schema=schema)
+        self.assertFalse(output_file.exists())
+    
+    def test_merge_returns_violations(self):
+        """Test that a merge hands its violations back so the caller can show them"""
+        source_file = self.temp_dir / 'source.csv'
+        pd.DataFrame({'id': [1, 1], 'code': ['AB1', 'AB2']}).to_csv(source_file, index=False)
+        output_file = self.temp_dir / 'merged.csv'
+        schema = DestinationSchema.from_template(self.destination_df, self.template_path)
+        
+        result = merge_source_files([str(source_file)], {'Id': 'id', 'Code': 'code'},
+                                    self.destination_df.columns.tolist(), output_file, max_workers=1, schema=schema)
+        self.assertEqual(result['rows'], 2)
+        self.assertIn('Id: 2 values are duplicated', '\n'.join(describe_violations(result['violations'])))
+
+
+class TestMappingProfiles(unittest.TestCase):
+    """Test suite for named mapping profiles"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create an empty profile directory"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.store = ProfileStore(self.temp_dir / 'profiles')
+        self.headers = ['Full_Name', 'Kg', 'Notes']
+        self.mappings = {'Full_Name': 'Name', 'Kg': 'Grams'}
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_profiles_round_trip_with_transforms_and_filter(self):
+        """Test that a saved profile loads back and also works as a mapping file"""
+        path = self.store.save('Monthly orders', self.mappings, self.headers, {'Kg': 'scale:0.001'},
+                               "[Status] == 'Active'", 'template.xlsx')
+        self.assertEqual(path.name, 'Monthly_orders.json')
+        
+        profile = self.store.load('Monthly orders')
+        self.assertEqual(profile['mappings'], self.mappings)
+        self.assertEqual(profile['transforms'], {'Kg': 'scale:0.001'})
+        self.assertEqual(profile['row_filter'], "[Status] == 'Active'")
+        self.assertEqual(profile['header_signature'], get_header_signature(self.headers))
+        self.assertEqual(load_mapping_spec(path)['transforms'], {'Kg': 'scale:0.001'})
+        
+        with self.assertRaisesRegex(ValueError, "No mapping profile named 'Weekly'"):
+            self.store.load('Weekly')
+        with self.assertRaisesRegex(ValueError, 'Unknown transform'):
+            self.store.save('Broken', self.mappings, self.headers, {'Kg': 'shout'})
+    
+    def test_listing_uses_the_index_and_puts_matching_templates_first(self):
+        """Test that profiles are listed from the index, those for the current header row first"""
+        self.store.save('b orders', self.mappings, self.headers)
+        self.store.save('a other', {'X': 'Name'}, ['X'])
+        self.store.save('b orders', {'Kg': 'Grams'}, self.headers)
+        self.store.save('b/orders', self.mappings, self.headers)
+        
+        profiles = self.store.list_profiles(self.headers)
+        self.assertEqual([p['name'] for p in profiles], ['b orders', 'b/orders', 'a other'])
+        self.assertEqual([p['matches_template'] for p in profiles], [True, True, False])
+        self.assertEqual(profiles[0]['mappings_count'], 1)
+        self.assertNotEqual(profiles[0]['file'], profiles[1]['file'])
+        
+        with patch.object(self.store, 'rebuild_index', wraps=self.store.rebuild_index) as rebuild:
+            self.store.load('a other')
+        rebuild.assert_not_called()
+    
+    def test_missing_index_is_rebuilt_and_profiles_can_be_deleted(self):
+        """Test that the index is recreated from the profile files when it is lost"""
+        self.store.save('one', self.mappings, self.headers)
+        self.store.save('two', self.mappings, self.headers)
+        self.store.index_path.unlink()
+        
+        self.assertEqual(sorted(self.store.load_index()), ['one', 'two'])
+        self.assertTrue(self.store.index_path.exists())
+        
+        self.store.delete('one')
+        self.assertEqual(list(self.store.load_index()), ['two'])
+        self.assertEqual(sorted(p.name for p in self.store.profiles_dir.glob('*.json')), ['index.json', 'two.json'])
+    
+    def test_headless_runs_can_use_a_profile(self):
+        """Test that --profile picks the mappings for watch and refresh runs"""
+        template = self.temp_dir / 'template.csv'
+        template.write_text('Full_Name,Kg,Notes\n', encoding='utf-8')
+        self.store.save('daily', self.mappings, self.headers, row_filter='[Grams] > 0')
+        
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        with patch(f'{config_module}.PROFILES_DIR', self.store.profiles_dir):
+            args = parse_arguments(['--watch', '--template', str(template), '--profile', 'daily'])
+            spec = load_run_spec(args)
+        self.assertEqual((spec['mappings'], spec['row_filter']), (self.mappings, '[Grams] > 0'))
+
+
+class TestHistoryIndex(unittest.TestCase):
+    """Test suite for the history session index"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Point the history at a temporary file"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.history_file = self.temp_dir / 'history.csv'
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        self.history_patch = patch(f'{config_module}.HISTORY_FILE', self.history_file)
+        self.history_patch.start()
+    
+    def tearDown(self):
+        """Clean up test files"""
+        self.history_patch.stop()
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_sessions_are_summarized_and_read_on_demand(self):
+        """Test that each session gets a summary and only its own rows are read back"""
+        append_mapping_history({'A': 'x', 'B': 'y'}, 'one.csv', 'template.xlsx', 'out1.xlsx',
+                               {'A': 'map:Y=Yes,N=No'}, "[Note] == 'a, \"quoted\"\nvalue'")
+        append_mapping_history({'C': '1001'}, 'two.csv', 'other.xlsx', 'out2.xlsx')
+        
+        history_index = HistoryIndex()
+        sessions = history_index.get_sessions()
+        self.assertEqual([s['Source_File'] for s in sessions], ['one.csv', 'two.csv'])
+        self.assertEqual([s['mappings_count'] for s in sessions], [2, 1])
+        self.assertEqual(sessions[1]['end'], self.history_file.stat().st_size)
+        
+        first = history_index.read_session(sessions[0])
+        self.assertEqual(first['Destination_Column'].tolist(), ['A', 'B'])
+        self.assertEqual(get_history_transforms(first), {'A': 'map:Y=Yes,N=No'})
+        self.assertEqual(get_history_row_filter(first), "[Note] == 'a, \"quoted\"\nvalue'")
+        self.assertEqual(history_index.read_session(sessions[1])['Source_Column'].tolist(), ['1001'])
+    
+    def test_only_new_rows_are_indexed_after_an_append(self):
+        """Test that a saved index is extended from where it stopped"""
+        append_mapping_history({'A': 'x'}, 'one.csv', 'template.xlsx', 'out1.xlsx')
+        indexed = HistoryIndex().get_sessions()[0]['end']
+        append_mapping_history({'B': 'y'}, 'two.csv', 'template.xlsx', 'out2.xlsx')
+        
+        history_index = HistoryIndex()
+        with patch.object(HistoryIndex, 'scan', wraps=HistoryIndex.scan) as scan:
+            sessions = history_index.get_sessions()
+            history_index.get_sessions()
+        self.assertEqual(scan.call_count, 1)
+        self.assertEqual(scan.call_args[0][1], indexed)
+        self.assertEqual(len(sessions), 2)
+    
+    def test_rewritten_history_is_reindexed(self):
+        """Test that a history written in an older layout is upgraded and indexed from the top"""
+        pd.DataFrame({
+            'Timestamp': ['2024-01-01 10:00:00'] * 2, 'Source_File': ['old.csv'] * 2,
+            'Destination_File': ['template.xlsx'] * 2, 'Output_File': ['old_out.xlsx'] * 2,
+            'Source_Column': ['x', 'y'], 'Destination_Column': ['A', 'B']
+        }).to_csv(self.history_file, index=False)
+        self.assertEqual(len(HistoryIndex().get_sessions()), 1)
+        
+        append_mapping_history({'A': 'z'}, 'new.csv', 'template.xlsx', 'new_out.xlsx')
+        sessions = HistoryIndex().get_sessions()
+        self.assertEqual([s['Source_File'] for s in sessions], ['old.csv', 'new.csv'])
+        self.assertEqual(load_history_session(destination_file_name='template.xlsx')['mappings'], {'A': 'z'})
+        self.assertEqual(
+            load_history_session('2024-01-01 10:00:00', 'template.xlsx')['mappings'], {'A': 'x', 'B': 'y'}
+        )
+
+
+class TestHistoryCompatibility(unittest.TestCase):
+    """Test suite for ranking history sessions against the loaded headers"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def get_session(self, timestamp, columns):
+        """Build a session summary as the history index records it"""
+        return {'Timestamp': timestamp, 'columns': columns, 'mappings_count': len(columns)}
+    
+    def test_sessions_are_ranked_by_match_then_newest(self):
+        """Test that sessions are sorted by the share of mappings that fit, newest first on ties"""
+        sessions = [
+            self.get_session('1', [['A', 'x'], ['B', 'y']]),
+            self.get_session('2', [['A', 'x'], ['C', 'z']]),
+            self.get_session('3', [['A', 'x'], ['B', 'y']]),
+            self.get_session('4', [['A', '=[x] + [gone]']]),
+        ]
+        matcher = HeaderMatcher(['x', 'y'], ['A', 'B'])
+        ranked = matcher.rank(sessions)
+        self.assertEqual([s['Timestamp'] for s in ranked], ['3', '1', '2', '4'])
+        self.assertEqual([s['match_percent'] for s in ranked], [100.0, 100.0, 50.0, 0.0])
+        self.assertEqual(ranked[2]['matched'], 1)
+    
+    def test_normalization_ignores_case_and_spacing(self):
+        """Test that normalized matching renames saved columns to the loaded headers"""
+        sessions = [self.get_session('1', [['customer  name', 'first name'], ['Total', 'AMOUNT']])]
+        self.assertEqual(HeaderMatcher(['First Name', 'Amount'], ['Customer Name', 'Total']).rank(sessions)[0]['matched'], 0)
+        
+        matcher = HeaderMatcher(['First Name', 'Amount'], ['Customer Name', 'Total'], normalize=True)
+        self.assertEqual(matcher.rank(sessions)[0]['match_percent'], 100.0)
+        usable, transforms, skipped = matcher.resolve(
+            {'customer  name': 'first name', 'Total': '=[AMOUNT] * 2', 'Gone': 'Amount'},
+            {'customer  name': 'upper'}
+        )
+        self.assertEqual(usable, {'Customer Name': 'First Name', 'Total': '=[Amount] * 2'})
+        self.assertEqual(transforms, {'Customer Name': 'upper'})
+        self.assertEqual(skipped, {'Gone': 'Amount'})
+        self.assertEqual(matcher.resolve_row_filter("[amount] > 5 and [x] == '[amount]'"), None)
+        self.assertEqual(matcher.resolve_row_filter("[amount] > 5 or [FIRST NAME] == '[amount]'"),
+                         "[Amount] > 5 or [First Name] == '[amount]'")
+    
+    def test_history_index_records_session_columns(self):
+        """Test that indexed sessions carry the columns each mapping reads"""
+        temp_dir = Path(tempfile.mkdtemp())
+        try:
+            history_file = temp_dir / 'history.csv'
+            config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+            with patch(f'{config_module}.HISTORY_FILE', history_file):
+                append_mapping_history({'A': 'x', 'B': '=[y] + [z]'}, 's.csv', 't.xlsx', 'o.xlsx')
+                session = HistoryIndex().get_sessions()[0]
+            self.assertEqual(session['columns'], [['A', 'x'], ['B', 'y', 'z']])
+            self.assertEqual(HeaderMatcher(['x', 'y'], ['A', 'B']).rank([session])[0]['matched'], 1)
+        finally:
+            import shutil
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class TestHistoryCompaction(unittest.TestCase):
+    """Test suite for history retention and compaction"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Point the history at a temporary file"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.history_file = self.temp_dir / 'history.csv'
+        self.archive_dir = self.temp_dir / 'archive'
+        self.policy = {'auto_compact': True, 'compact_bytes': 1_000_000, 'archive_days': 90, 'retention_days': 365}
+        self.now = datetime(2026, 6, 15, 12, 0, 0)
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        self.history_patch = patch(f'{config_module}.HISTORY_FILE', self.history_file)
+        self.history_patch.start()
+    
+    def tearDown(self):
+        """Clean up test files"""
+        self.history_patch.stop()
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def add_session(self, timestamp, mappings, source_file='source.csv'):
+        """Append a history session saved at the given time"""
+        module = sys.modules['app.engine']
+        with patch.object(module, 'datetime') as mock_datetime:
+            mock_datetime.now.return_value = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+            append_mapping_history(mappings, source_file, 'template.xlsx', 'output.xlsx')
+    
+    def get_compactor(self):
+        """Build a compactor over the temporary history"""
+        return HistoryCompactor(self.history_file, self.archive_dir, self.policy)
+    
+    def test_repeated_sessions_are_merged_into_a_count(self):
+        """Test that identical sessions keep only their last use, with the uses summed"""
+        self.add_session('2026-06-01 09:00:00', {'A': 'x', 'B': 'y'}, 'jan.csv')
+        self.add_session('2026-06-02 09:00:00', {'A': 'z'})
+        self.add_session('2026-06-03 09:00:00', {'B': 'y', 'A': 'x'}, 'feb.csv')
+        
+        stats = self.get_compactor().run(self.now)
+        self.assertEqual((stats['sessions'], stats['merged'], stats['remaining']), (3, 1, 2))
+        
+        sessions = HistoryIndex(self.history_file).get_sessions()
+        self.assertEqual([(s['Source_File'], s['use_count']) for s in sessions], [('source.csv', 1), ('feb.csv', 2)])
+        self.assertEqual(load_history_session()['mappings'], {'B': 'y', 'A': 'x'})
+        
+        # Compacting again counts the merged uses rather than resetting them
+        self.add_session('2026-06-04 09:00:00', {'A': 'x', 'B': 'y'})
+        self.get_compactor().run(self.now)
+        self.assertEqual([s['use_count'] for s in HistoryIndex(self.history_file).get_sessions()], [1, 3])
+    
+    def test_old_sessions_are_archived_by_month_and_expired_ones_deleted(self):
+        """Test that sessions past the archive window go to monthly gzip files and those past retention are dropped"""
+        self.add_session('2025-01-10 09:00:00', {'A': 'old'})
+        self.add_session('2026-01-05 09:00:00', {'A': 'jan'})
+        self.add_session('2026-01-20 09:00:00', {'A': 'jan2'})
+        self.add_session('2026-06-10 09:00:00', {'A': 'new'})
+        self.archive_dir.mkdir()
+        (self.archive_dir / 'mapping_history_2024-12.csv.gz').write_bytes(gzip.compress(b"x\n"))
+        
+        compactor = self.get_compactor()
+        self.assertTrue(compactor.is_due(self.now))
+        stats = compactor.run(self.now)
+        self.assertEqual((stats['expired'], stats['archived'], stats['remaining'], stats['archives_removed']), (1, 2, 1, 1))
+        
+        self.assertEqual(pd.read_csv(self.history_file)['Source_Column'].tolist(), ['new'])
+        self.assertEqual([p.name for p in self.archive_dir.iterdir()], ['mapping_history_2026-01.csv.gz'])
+        archived = pd.read_csv(self.archive_dir / 'mapping_history_2026-01.csv.gz')
+        self.assertEqual(archived['Source_Column'].tolist(), ['jan', 'jan2'])
+        self.assertFalse(compactor.is_due(self.now))
+        
+        # A later archive of the same month is appended to the existing file
+        self.add_session('2026-01-25 09:00:00', {'A': 'late'})
+        compactor.run(self.now)
+        archived = pd.read_csv(self.archive_dir / 'mapping_history_2026-01.csv.gz')
+        self.assertEqual(archived['Source_Column'].tolist(), ['jan', 'jan2', 'late'])
+    
+    def test_policy_is_read_from_config_file(self):
+        """Test that config.json overrides the retention defaults"""
+        config_file = self.temp_dir / 'config.json'
+        config_file.write_text(json.dumps({'history': {'retention_days': 0, 'unknown': 1}}))
+        config_module = 'main.Config' if 'main' in sys.modules else 'app.main.Config'
+        with patch(f'{config_module}.CONFIG_FILE', config_file):
+            policy = load_history_policy()
+        self.assertEqual(policy['retention_days'], 0)
+        self.assertNotIn('unknown', policy)
+        self.assertIn('archive_days', policy)
+
+
+class TestOutputWriters(unittest.TestCase):
+    """Test suite for the registered output writers"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Set up class-level fixtures"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import required modules")
+    
+    def setUp(self):
+        """Create output data with typed, missing and mixed values"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.data = pd.DataFrame({
+            'ID': pd.array([1, None, 3, 4, 5], dtype='Int64'),
+            'Name': ['Ann', None, 'Cy', 'Dee', 'Eve'],
+            'Code': [1001, 'A-7', None, 'B-2', 1002],
+            'Price': [1.5, float('nan'), 3.0, 4.25, 5.0],
+            'Date': pd.to_datetime(['2024-01-02', None, '2024-03-04', '2024-05-06', '2024-07-08'])
+        })
+    
+    def tearDown(self):
+        """Clean up test files"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_every_format_round_trips(self):
+        """Test that each format writes every chunk, with missing values left empty"""
+        readers = {
+            'csv': pd.read_csv, 'csv.gz': pd.read_csv, 'xlsx': pd.read_excel,
+            'parquet': pd.read_parquet, 'feather': pd.read_feather
+        }
+        for name, writer_class in OUTPUT_WRITERS.items():
+            for engine in (('auto', 'openpyxl') if name == 'xlsx' else ('auto',)):
+                with self.subTest(format=name, engine=engine), patch('app.engine.Config.XLSX_ENGINE', engine):
+                    output_file = self.temp_dir / f"output_{engine}{writer_class.suffix}"
+                    try:
+                        write_output_file(self.data, output_file, chunk_rows=2)
+                    except ValueError as e:
+                        self.skipTest(str(e))
+                    
+                    written = readers[name](output_file)
+                    self.assertEqual(written.columns.tolist(), self.data.columns.tolist())
+                    self.assertEqual(written['Name'].tolist()[2:], ['Cy', 'Dee', 'Eve'])
+                    self.assertTrue(pd.isna(written['Name'][1]) and pd.isna(written['ID'][1]))
+                    self.assertEqual(written['Price'].tolist()[2:], [3.0, 4.25, 5.0])
+                    self.assertEqual(pd.to_datetime(written['Date'])[4], pd.Timestamp('2024-07-08'))
+                    # Columns mixing numbers and text are kept as they are, or as text in columnar formats
+                    self.assertEqual([str(code) for code in written['Code'][[0, 1, 4]]], ['1001', 'A-7', '1002'])
+    
+    def test_unknown_format_is_refused(self):
+        """Test that a file type without a writer is refused before anything is written"""
+        with self.assertRaises(ValueError):
+            write_output_file(self.data, self.temp_dir / 'output.txt')
+        self.assertEqual(get_output_format(self.temp_dir / 'OUTPUT.CSV.GZ'), 'csv.gz')
+        self.assertEqual(os.listdir(self.temp_dir), [])
+    
+    def test_excel_row_limit(self):
+        """Test that outputs too long for a worksheet fail instead of being cut short"""
+        with patch('app.engine.XLSX_MAX_ROWS', 4):
+            with self.assertRaises(ValueError):
+                write_output_file(self.data, self.temp_dir / 'output.xlsx', chunk_rows=2)
+        self.assertEqual(os.listdir(self.temp_dir), [])
+    
+    def test_excel_appends_rewrite_the_workbook(self):
+        """Test that rows appended to a workbook land after its last row, within the worksheet row limit"""
+        output_file = self.temp_dir / 'output.xlsx'
+        write_output_file(self.data.head(2), output_file)
+        append_output_rows(output_file, self.data.iloc[2:4])
+        self.assertEqual(pd.read_excel(output_file)['Name'].tolist()[2:], ['Cy', 'Dee'])
+        
+        # The whole workbook is read back to append, so the limit counts the rows already there
+        with patch('app.engine.XLSX_MAX_ROWS', 5):
+            with self.assertRaisesRegex(ValueError, 'at most 5 rows'):
+                append_output_rows(output_file, self.data.iloc[4:])
+        self.assertEqual(len(pd.read_excel(output_file)), 4)
+    
+    def test_incremental_refresh_by_format(self):
+        """Test that gzip CSV outputs are appended to and columnar outputs are rewritten"""
+        source_file = self.temp_dir / 'daily.csv'
+        source_file.write_text('Name\nAnn\n', encoding='utf-8')
+        destination_df = pd.DataFrame({'Full_Name': []})
+        transfer = IncrementalTransfer(state_dir=self.temp_dir / 'state')
+        
+        for name in ('out.csv.gz', 'out.parquet'):
+            output_file = self.temp_dir / name
+            try:
+                transfer.run(source_file, destination_df, {'Full_Name': 'Name'}, output_file)
+            except ValueError as e:
+                self.skipTest(str(e))
+            with open(source_file, 'a', encoding='utf-8') as f:
+                f.write('Ben\n')
+            result = transfer.run(source_file, destination_df, {'Full_Name': 'Name'}, output_file)
+            
+            self.assertEqual(result['mode'], 'append' if name == 'out.csv.gz' else 'full')
+            written = pd.read_csv(output_file) if name == 'out.csv.gz' else pd.read_parquet(output_file)
+            self.assertEqual(written['Full_Name'].tolist(), ['Ann', 'Ben'] if name == 'out.csv.gz' else ['Ann', 'Ben', 'Ben'])
+
+
 def run_tests():
     """Run all tests and generate report"""
     print("🚀 Starting ExcelColumnMapper Test Suite")
@@ -509,6 +2270,26 @@ def run_tests():
     # Add test classes
     suite.addTests(loader.loadTestsFromTestCase(TestExcelColumnMapper))
     suite.addTests(loader.loadTestsFromTestCase(TestExcelColumnMapperIntegration))
+    suite.addTests(loader.loadTestsFromTestCase(TestPerformanceTracer))
+    suite.addTests(loader.loadTestsFromTestCase(TestStartup))
+    suite.addTests(loader.loadTestsFromTestCase(TestThemeManager))
+    suite.addTests(loader.loadTestsFromTestCase(TestCancellation))
+    suite.addTests(loader.loadTestsFromTestCase(TestFilePrefetcher))
+    suite.addTests(loader.loadTestsFromTestCase(TestMultiSourceMerge))
+    suite.addTests(loader.loadTestsFromTestCase(TestWatchFolder))
+    suite.addTests(loader.loadTestsFromTestCase(TestIncrementalTransfer))
+    suite.addTests(loader.loadTestsFromTestCase(TestKeyUpsert))
+    suite.addTests(loader.loadTestsFromTestCase(TestTransformChains))
+    suite.addTests(loader.loadTestsFromTestCase(TestExpressionMappings))
+    suite.addTests(loader.loadTestsFromTestCase(TestLookupMappings))
+    suite.addTests(loader.loadTestsFromTestCase(TestRowFilters))
+    suite.addTests(loader.loadTestsFromTestCase(TestDestinationTypes))
+    suite.addTests(loader.loadTestsFromTestCase(TestOutputValidation))
+    suite.addTests(loader.loadTestsFromTestCase(TestMappingProfiles))
+    suite.addTests(loader.loadTestsFromTestCase(TestHistoryIndex))
+    suite.addTests(loader.loadTestsFromTestCase(TestHistoryCompatibility))
+    suite.addTests(loader.loadTestsFromTestCase(TestHistoryCompaction))
+    suite.addTests(loader.loadTestsFromTestCase(TestOutputWriters))
     
     # Run tests with detailed output
     runner = unittest.TextTestRunner(verbosity=2, buffer=True)
@@ -0,0 +1,118 @@
+"""
+Unit Tests for the Excel Column Mapper HTTP service
+Drives a real service on a free local port through ServiceClient
+"""
+
+import unittest
+from unittest.mock import patch
+import queue
+import tempfile
+import shutil
+import threading
+from pathlib import Path
+import sys
+
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from app.service import JobQueue, ServiceClient, ServiceError, create_server
+    IMPORT_SUCCESS = True
+except ImportError as e:
+    print(f"❌ Failed to import the service (is bottle installed?): {e}")
+    IMPORT_SUCCESS = False
+
+
+class TestHttpService(unittest.TestCase):
+    """Test suite for the HTTP service"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start one service with two worker processes for all tests"""
+        if not IMPORT_SUCCESS:
+            raise unittest.SkipTest("Could not import the service")
+        cls.temp_dir = Path(tempfile.mkdtemp())
+        cls.history_patch = patch('app.engine.Config.HISTORY_FILE', cls.temp_dir / 'history.csv')
+        cls.history_patch.start()
+
+        cls.jobs = JobQueue(max_workers=2, output_dir=cls.temp_dir / 'output')
+        cls.jobs.start()
+        cls.server = create_server(cls.jobs, '127.0.0.1', 0, upload_dir=cls.temp_dir / 'uploads')
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.client = ServiceClient(f"http://127.0.0.1:{cls.server.server_port}")
+
+        source_file = cls.temp_dir / 'orders.csv'
+        template_file = cls.temp_dir / 'template.csv'
+        pd.DataFrame({'Name': ['ann', 'ben', 'cy'], 'Qty': [1, 2, 3]}).to_csv(source_file, index=False)
+        pd.DataFrame({'Customer': [], 'Quantity': []}).to_csv(template_file, index=False)
+        cls.source_id = cls.client.upload(source_file)
+        cls.template_id = cls.client.upload(template_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the service and clean up"""
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.jobs.shutdown()
+        cls.history_patch.stop()
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def test_headers_are_inspected(self):
+        """Test that an upload's headers and first rows can be read back"""
+        headers = self.client.get_headers(self.source_id, sample=2)
+        self.assertEqual(headers['name'], 'orders.csv')
+        self.assertEqual(headers['headers'], ['Name', 'Qty'])
+        self.assertEqual(headers['sample'], [['ann', '1'], ['ben', '2']])
+
+    def test_jobs_run_concurrently_and_produce_output(self):
+        """Test that submitted jobs run in the pool and their output can be downloaded"""
+        submitted = [
+            self.client.submit(self.source_id, self.template_id, {'Customer': 'Name', 'Quantity': '=[Qty] * 10'},
+                               transforms={'Customer': 'upper'}, row_filter='[Qty] > 1', format='csv')
+            for _ in range(3)
+        ]
+        self.assertTrue(all(job['status'] in ('queued', 'running', 'done') for job in submitted))
+
+        for job in submitted:
+            finished = self.client.wait(job['id'])
+            self.assertEqual(finished['status'], 'done', finished.get('error'))
+            self.assertEqual(finished['rows'], 2)
+            output = pd.read_csv(self.client.download(job['id'], self.temp_dir / f"{job['id']}.csv"))
+            self.assertEqual(output['Customer'].tolist(), ['BEN', 'CY'])
+            self.assertEqual(output['Quantity'].tolist(), [20, 30])
+
+        listed = [job['id'] for job in self.client.request_json('GET', '/jobs')['jobs']]
+        self.assertTrue(set(job['id'] for job in submitted) <= set(listed))
+
+    def test_bad_requests_are_refused(self):
+        """Test that jobs which can't run are refused up front"""
+        with self.assertRaises(ServiceError) as raised:
+            self.client.submit(self.source_id, self.template_id, {'Customer': 'Surname'})
+        self.assertEqual(raised.exception.status, 400)
+        with self.assertRaises(ServiceError) as raised:
+            self.client.submit(self.source_id, self.template_id, {'Customer': 'Name'}, transforms={'Customer': 'shout'})
+        self.assertEqual(raised.exception.status, 400)
+        with self.assertRaises(ServiceError) as raised:
+            self.client.submit('0' * 32, self.template_id, {'Customer': 'Name'})
+        self.assertEqual(raised.exception.status, 404)
+        with self.assertRaises(ServiceError) as raised:
+            self.client.get_headers('../../etc')
+        self.assertEqual(raised.exception.status, 404)
+        with self.assertRaises(ServiceError) as raised:
+            self.client.get_job('missing')
+        self.assertEqual(raised.exception.status, 404)
+
+    def test_full_queue_refuses_submissions(self):
+        """Test that a job queue at capacity refuses new jobs instead of growing"""
+        jobs = JobQueue(max_workers=1, max_queued=1, output_dir=self.temp_dir / 'unused')
+        spec = {'template_name': 'template.csv', 'source_name': 'orders.csv', 'format': 'csv'}
+        self.assertEqual(jobs.submit(spec)['status'], 'queued')
+        with self.assertRaises(queue.Full):
+            jobs.submit(spec)
+
+
+if __name__ == '__main__':
+    unittest.main()